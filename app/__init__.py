@@ -2,15 +2,15 @@
 URL Shortener — Flask Application Factory
 """
 
-import logging
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 
 from app.config import Config
+from app.sharding import ShardSession
 
-db = SQLAlchemy()
-logger = logging.getLogger(__name__)
+# Statements are routed to the shard bound in the current context (app/sharding.py)
+db = SQLAlchemy(session_options={"class_": ShardSession})
 
 
 def create_app(config_class=Config):
@@ -30,22 +30,63 @@ def create_app(config_class=Config):
     from app.rate_limiter import limiter
     limiter.init_app(app)
 
+    # ---- Shards: code → database routing ----
+    from app.sharding import shards
+    shards.init_app(app)
+
+    # ---- Read replicas for read-only views ----
+    from app.replicas import replicas
+    replicas.init_app(app)
+
+    # ---- Block-based id allocation for new links ----
+    from app.id_allocator import id_allocator
+    id_allocator.init_app(app)
+
+    # ---- Bloom filter of issued short codes ----
+    from app.bloom import code_filter
+    code_filter.init_app(app)
+
+    # ---- Hot-key set / cache warm-up (started per worker by gunicorn) ----
+    from app.warmup import hot_keys
+    hot_keys.init_app(app)
+
+    # ---- Expiry sweeper (started per worker by gunicorn) ----
+    from app.expiry import expiry_sweeper
+    expiry_sweeper.init_app(app)
+
+    # ---- Click ingestion ----
+    from app.click_ingest import click_ingestor
+    click_ingestor.init_app(app)
+
     # ---- Blueprints / Routes ----
     from app.routes import api_bp, redirect_bp
     app.register_blueprint(api_bp)
     app.register_blueprint(redirect_bp)
 
-    # ---- Create tables if they don't exist ----
-    with app.app_context():
-        from app import models  # noqa: F401
-        try:
-            db.create_all()
-            logger.info("Database tables created / verified.")
-        except Exception as exc:
-            logger.warning("db.create_all() failed (will retry on first request): %s", exc)
+    # ---- Prometheus metrics (/metrics, DB timing, 429 counts) ----
+    from app import metrics
+    metrics.init_app(app)
+
+    # ---- CLI commands ----
+    from app.commands import register_commands
+    register_commands(app)
 
     return app
 
 
-# Module-level app instance so `gunicorn app:app` works
-app = create_app()
+_app = None
+
+
+def __getattr__(name: str):
+    """
+    ``app.app`` is built on first access, so ``gunicorn run:app`` /
+    ``gunicorn app:app`` still work while plain imports of the package (the
+    gunicorn hooks, the ASGI server, the CLI, benchmarks) do no setup work.
+    Nothing here touches the database; the schema is managed by app.migrate.
+    """
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
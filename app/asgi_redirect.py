@@ -0,0 +1,405 @@
+"""
+Lean asyncio redirect server for ``GET /<short_code>``.
+
+An optional, standalone ASGI app that serves *only* redirects, so the hot
+path skips the Flask/WSGI stack (limiter, CORS, session setup) and never
+blocks a worker on Redis or DB I/O.  The Flask app keeps the management API.
+
+Same semantics as ``routes.redirect_short_url``:
+- L1 (per process) → Redis entry (app.cache encoding) → async DB lookup
+- The link's redirect type (302 / 307, or a cacheable 301 / 308 with
+  Cache-Control) on success, 404 JSON for unknown / inactive / expired codes
+- Negative caching, expiry-clamped and jittered TTLs, pub/sub L1
+  invalidation; concurrent misses for a code share one DB lookup task (per
+  process; the cross-worker fill lock and early refresh are Flask-only)
+- Clicks are buffered and bulk-inserted (click_logs + rollups); counts go to
+  the shared Redis counter hash and are reconciled into urls.click_count
+- One async engine per shard; lookups and click writes go to the shard
+  encoded in the code / url_id (app/sharding.py)
+
+Run with::
+
+    pip install -r requirements-asgi.txt
+    uvicorn app.asgi_redirect:application --workers 2 --loop uvloop
+"""
+
+import re
+import json
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+import redis
+import redis.asyncio as aioredis
+from sqlalchemy import insert, select, update
+
+from app.cache import (
+    DEFAULT_TTL,
+    GONE,
+    INVALIDATION_CHANNEL,
+    NEGATIVE_TTL,
+    CachedUrl,
+    LocalCache,
+    _jittered,
+    _key,
+    decode_entry,
+    encode_entry,
+    to_epoch,
+)
+from app.config import Config
+from app import counters, rollups
+from app.encoder import shard_of_code, shard_of_id
+
+logger = logging.getLogger(__name__)
+
+CODE_PATH = re.compile(r"^/([0-9A-Za-z]{1,10})$")
+
+NOT_FOUND = {"error": "Short URL not found"}
+EXPIRED = {"error": "This short URL has expired"}
+
+
+def async_database_url(uri: str) -> str:
+    """Map the sync SQLAlchemy URI onto its asyncio driver."""
+    for sync_prefix, async_prefix in (
+        ("postgresql+psycopg2://", "postgresql+asyncpg://"),
+        ("postgresql://", "postgresql+asyncpg://"),
+        ("mysql+pymysql://", "mysql+aiomysql://"),
+        ("sqlite:///", "sqlite+aiosqlite:///"),
+    ):
+        if uri.startswith(sync_prefix):
+            return async_prefix + uri[len(sync_prefix):]
+    return uri
+
+
+class RedirectServer:
+    """ASGI application object."""
+
+    def __init__(self, config=Config) -> None:
+        self.config = config
+        self.redis: aioredis.Redis | None = None
+        self.engines: dict[int, object] = {}
+        self.l1 = LocalCache(
+            max_entries=config.L1_CACHE_MAX_ENTRIES,
+            max_bytes=config.L1_CACHE_MAX_BYTES,
+            ttl=config.L1_CACHE_TTL,
+        )
+        self._fills: dict[str, asyncio.Task] = {}
+        self._clicks: list[dict] = []
+        self._tasks: list[asyncio.Task] = []
+        self._flush_event: asyncio.Event | None = None
+        self.dropped = 0
+
+    # ------------------------------------------------------------------
+    # ASGI entry point
+    # ------------------------------------------------------------------
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        match = CODE_PATH.match(scope["path"])
+        if scope["method"] not in ("GET", "HEAD") or not match:
+            await self._json(send, 404, NOT_FOUND)
+            return
+        await self._redirect(match.group(1), scope, send)
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def startup(self) -> None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        self.redis = aioredis.from_url(
+            self.config.REDIS_URL,
+            decode_responses=True,
+            socket_connect_timeout=self.config.REDIS_CONNECT_TIMEOUT_MS / 1000,
+            socket_timeout=self.config.REDIS_SOCKET_TIMEOUT_MS / 1000,
+            health_check_interval=self.config.REDIS_HEALTH_CHECK_INTERVAL,
+        )
+        database_urls = {0: self.config.SQLALCHEMY_DATABASE_URI, **self.config.SHARD_DATABASE_URLS}
+        self.engines = {
+            shard: create_async_engine(
+                async_database_url(url),
+                pool_size=self.config.ASGI_DB_POOL_SIZE,
+                max_overflow=self.config.DB_MAX_OVERFLOW,
+                pool_recycle=self.config.DB_POOL_RECYCLE,
+                pool_timeout=self.config.DB_POOL_TIMEOUT,
+                pool_pre_ping=True,
+            )
+            for shard, url in database_urls.items()
+        }
+        self._flush_event = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._listen_for_invalidations()),
+            asyncio.create_task(self._flush_loop()),
+        ]
+
+    async def shutdown(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await self._flush_clicks()
+        for engine in self.engines.values():
+            await engine.dispose()
+        await self.redis.aclose()
+
+    # ------------------------------------------------------------------
+    # Redirect
+    # ------------------------------------------------------------------
+
+    async def _redirect(self, short_code: str, scope, send) -> None:
+        entry = await self._lookup(short_code)
+        status = entry.status() if entry else "gone"
+        if status == "gone":
+            await self._json(send, 404, NOT_FOUND)
+            return
+        if status == "expired":
+            await self._json(send, 404, EXPIRED)
+            return
+
+        self._record_click(short_code, entry.url_id, scope)
+        await send({
+            "type": "http.response.start",
+            "status": entry.redirect_type,
+            "headers": [
+                (b"location", entry.original_url.encode()),
+                (b"cache-control", entry.cache_control(self.config.REDIRECT_CACHE_MAX_AGE).encode()),
+                (b"content-length", b"0"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _lookup(self, short_code: str) -> CachedUrl | None:
+        value = self.l1.get(short_code)
+        if value is not None:
+            return decode_entry(value)
+
+        try:
+            value = await self.redis.get(_key(short_code))
+        except redis.RedisError as exc:
+            logger.warning("Redis GET failed: %s", exc)
+            value = None
+        entry = decode_entry(value) if value else None
+        if entry:
+            if entry.is_active:
+                self.l1.set(short_code, value)
+            return entry
+
+        # One lookup per code; shielded so a disconnecting client does not
+        # cancel it for the others.
+        fill = self._fills.get(short_code)
+        if fill is None:
+            fill = self._fills[short_code] = asyncio.ensure_future(self._load_from_db(short_code))
+            fill.add_done_callback(lambda _: self._fills.pop(short_code, None))
+        return await asyncio.shield(fill)
+
+    async def _load_from_db(self, short_code: str) -> CachedUrl | None:
+        from app.models import Url
+
+        urls = Url.__table__
+        async with self._engine(shard_of_code(short_code)).connect() as conn:
+            row = (await conn.execute(
+                select(urls.c.id, urls.c.original_url, urls.c.expires_at, urls.c.redirect_type)
+                .where(urls.c.short_code == short_code, urls.c.is_active.is_(True))
+            )).first()
+            if row is None:
+                await self._setex(short_code, _jittered(NEGATIVE_TTL), encode_entry(GONE))
+                return None
+
+            expires = to_epoch(row.expires_at)
+            if expires is not None and expires <= time.time():
+                await conn.execute(update(urls).where(urls.c.id == row.id).values(is_active=False))
+                await conn.commit()
+                await self._invalidate(short_code)
+                await self._setex(short_code, _jittered(NEGATIVE_TTL), encode_entry(GONE))
+                return CachedUrl(row.id, row.original_url, expires, True, row.redirect_type)
+
+        entry = CachedUrl(row.id, row.original_url, expires, True, row.redirect_type)
+        ttl = _jittered(DEFAULT_TTL)
+        if expires is not None:
+            ttl = min(ttl, int(expires - time.time()))
+        if ttl > 0:
+            value = encode_entry(entry)
+            self.l1.set(short_code, value)
+            await self._setex(short_code, ttl, value)
+        return entry
+
+    async def _setex(self, short_code: str, ttl: int, value: str) -> None:
+        try:
+            await self.redis.setex(_key(short_code), ttl, value)
+        except redis.RedisError as exc:
+            logger.warning("Redis SET failed: %s", exc)
+
+    async def _invalidate(self, short_code: str) -> None:
+        self.l1.delete(short_code)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.delete(_key(short_code))
+                pipe.publish(INVALIDATION_CHANNEL, short_code)
+                await pipe.execute()
+        except redis.RedisError as exc:
+            logger.warning("Redis DEL failed: %s", exc)
+
+    async def _listen_for_invalidations(self) -> None:
+        while True:
+            try:
+                async with self.redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    self.l1.clear()
+                    async for message in pubsub.listen():
+                        self.l1.delete(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Cache invalidation listener error: %s", exc)
+                self.l1.clear()
+                await asyncio.sleep(1)
+
+    # ------------------------------------------------------------------
+    # Click ingestion
+    # ------------------------------------------------------------------
+
+    def _record_click(self, short_code: str, url_id: int | None, scope) -> None:
+        if url_id is None:
+            return  # legacy entry without id; refreshed on the next miss
+        if len(self._clicks) >= self.config.CLICK_BUFFER_MAX:
+            self.dropped += 1
+            return
+        headers = dict(scope.get("headers") or [])
+        client = scope.get("client") or ("unknown", 0)
+        self._clicks.append({
+            "url_id": url_id,
+            "ip_address": client[0],
+            "user_agent": headers.get(b"user-agent", b"").decode("latin-1"),
+            "referer": headers.get(b"referer", b"").decode("latin-1"),
+            "clicked_at": datetime.now(timezone.utc).replace(tzinfo=None),
+        })
+        if len(self._clicks) >= self.config.CLICK_FLUSH_BATCH:
+            self._flush_event.set()
+
+    async def _flush_loop(self) -> None:
+        last_sync = time.monotonic()
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._flush_event.wait(), self.config.CLICK_FLUSH_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                await self._flush_clicks()
+                if time.monotonic() - last_sync >= self.config.COUNTER_SYNC_INTERVAL:
+                    last_sync = time.monotonic()
+                    await self._reconcile_counters()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Async click flush failed: %s", exc)
+
+    async def _flush_clicks(self) -> None:
+        from app.models import ClickLog
+
+        while self._clicks:
+            batch = self._clicks[: self.config.CLICK_FLUSH_BATCH]
+            del self._clicks[: len(batch)]
+            per_shard: dict[int, list[dict]] = {}
+            for click in batch:
+                per_shard.setdefault(shard_of_id(click["url_id"]), []).append(click)
+            for shard, clicks in per_shard.items():
+                engine = self._engine(shard)
+                async with engine.begin() as conn:
+                    await conn.execute(insert(ClickLog.__table__).values(clicks))
+                    for stmt in rollups.record_statements(
+                        engine.dialect.name, [(c["url_id"], c["clicked_at"]) for c in clicks]
+                    ):
+                        await conn.execute(stmt)
+
+            per_url: dict[int, int] = {}
+            for click in batch:
+                per_url[click["url_id"]] = per_url.get(click["url_id"], 0) + 1
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for url_id, count in per_url.items():
+                        pipe.hincrby(counters.PENDING_KEY, str(url_id), count)
+                    await pipe.execute()
+            except redis.RedisError as exc:
+                # The clicks are already logged: apply the counts on the DB
+                # (like the Flask flusher) rather than lose them.
+                logger.warning("Redis HINCRBY failed, falling back to DB: %s", exc)
+                deltas: dict[int, dict[int, int]] = {}
+                for url_id, count in per_url.items():
+                    deltas.setdefault(shard_of_id(url_id), {})[url_id] = count
+                for shard, shard_deltas in deltas.items():
+                    async with self._engine(shard).begin() as conn:
+                        await conn.execute(counters.reconcile_statement(shard_deltas))
+
+    async def _reconcile_counters(self) -> None:
+        """Async twin of counters.reconcile (same keys, same lock)."""
+        token = uuid.uuid4().hex
+        if not await self.redis.set(counters.LOCK_KEY, token, nx=True, ex=counters.LOCK_TTL):
+            return
+        try:
+            if not await self.redis.exists(counters.INFLIGHT_KEY):
+                if not await self.redis.exists(counters.PENDING_KEY):
+                    return
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    pipe.rename(counters.PENDING_KEY, counters.INFLIGHT_KEY)
+                    pipe.set(counters.BATCH_KEY, uuid.uuid4().hex)
+                    await pipe.execute()
+            batch_id = await self.redis.get(counters.BATCH_KEY)
+            if batch_id is None:
+                batch_id = uuid.uuid4().hex
+                await self.redis.set(counters.BATCH_KEY, batch_id)
+            raw = await self.redis.hgetall(counters.INFLIGHT_KEY)
+            deltas = {int(k): int(v) for k, v in raw.items() if int(v)}
+            per_shard: dict[int, dict[int, int]] = {}
+            for url_id, delta in deltas.items():
+                per_shard.setdefault(shard_of_id(url_id), {})[url_id] = delta
+            for shard, shard_deltas in per_shard.items():
+                async with self._engine(shard).begin() as conn:
+                    if (await conn.execute(counters.batch_applied(batch_id))).first() is None:
+                        await conn.execute(counters.reconcile_statement(shard_deltas))
+                        for stmt in counters.batch_marker_statements(batch_id):
+                            await conn.execute(stmt)
+                await self.redis.hdel(counters.INFLIGHT_KEY, *map(str, shard_deltas))
+            await self.redis.delete(counters.INFLIGHT_KEY, counters.BATCH_KEY)
+        finally:
+            if await self.redis.get(counters.LOCK_KEY) == token:
+                await self.redis.delete(counters.LOCK_KEY)
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def _engine(self, shard: int):
+        """Engine of *shard*; unknown shards fall back to 0 (the code 404s)."""
+        return self.engines.get(shard) or self.engines[0]
+
+    @staticmethod
+    async def _json(send, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+application = RedirectServer()
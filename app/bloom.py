@@ -0,0 +1,259 @@
+"""
+Bloom filter of issued short codes.
+
+Lets the redirect path answer "definitely not a short code" with zero DB
+queries, which keeps scans / bot traffic over random paths off MySQL.
+
+Strategy:
+- Bit array sized from BLOOM_CAPACITY / BLOOM_ERROR_RATE, k hash positions
+  derived from one BLAKE2b digest (double hashing)
+- Shared through Redis as a plain bitmap (SETBIT / GET), so every worker
+  sees codes issued elsewhere
+- Each worker keeps a local copy, loaded in the background from Redis.  If
+  the Redis bitmap is missing or untrusted, one worker (NX lock) rebuilds
+  it from ``urls`` while the others fail open and poll until it is trusted
+- A local miss is confirmed against the Redis bitmap before returning 404;
+  any uncertainty (not loaded yet, Redis down, bitmap evicted) fails open
+- The Redis bitmap is only trusted once a rebuild has merged every code
+  into it: a rebuild ORs its bits in (BITOP through a temp key, so codes
+  SETBIT meanwhile survive) together with a sentinel bit just past the
+  filter.  A bitmap that was evicted and recreated by SETBIT lacks the
+  sentinel; lookups then fail open and one worker rebuilds it
+"""
+
+import os
+import math
+import time
+import uuid
+import hashlib
+import logging
+import threading
+
+import redis
+from sqlalchemy import select
+
+from app.cache import get_redis
+from app.sharding import shards
+
+logger = logging.getLogger(__name__)
+
+LOAD_POLL_INTERVAL = 1.0  # seconds between checks while another worker rebuilds
+
+
+class BloomFilter:
+    """Plain Bloom filter over a bytearray (MSB-first, Redis bitmap layout)."""
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray(math.ceil(self.num_bits / 8))
+
+    def positions(self, item: str) -> list[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item: str) -> None:
+        for pos in self.positions(item):
+            self.bits[pos >> 3] |= 0x80 >> (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (0x80 >> (pos & 7)) for pos in self.positions(item))
+
+    def load(self, data: bytes) -> None:
+        self.bits[: len(data)] = data[: len(self.bits)]
+
+    def fill_ratio(self) -> float:
+        return int.from_bytes(self.bits, "big").bit_count() / self.num_bits
+
+    def false_positive_rate(self) -> float:
+        """Current FP probability estimated from the fraction of set bits."""
+        return self.fill_ratio() ** self.num_hashes
+
+    def approx_items(self) -> int:
+        ratio = self.fill_ratio()
+        if ratio >= 1:
+            return self.capacity
+        return round(-self.num_bits / self.num_hashes * math.log(1 - ratio))
+
+
+class CodeFilter:
+    """Process-local Bloom filter of short codes, synchronised through Redis."""
+
+    def __init__(self) -> None:
+        self._app = None
+        self._filter: BloomFilter | None = None
+        self._ready = False
+        self._loader_pid: int | None = None
+        self._lock = threading.Lock()
+        self._rebuild_pid: int | None = None
+        self.rejected = 0
+        self.redis_confirms = 0
+
+    def init_app(self, app) -> None:
+        self._app = app
+        self._filter = BloomFilter(
+            app.config.get("BLOOM_CAPACITY", 1_000_000),
+            app.config.get("BLOOM_ERROR_RATE", 0.001),
+        )
+
+    @property
+    def redis_key(self) -> str:
+        # Sizing is part of the key so a config change never misreads bits.
+        return f"bloom:codes:{self._filter.num_bits}:{self._filter.num_hashes}"
+
+    @property
+    def _sentinel(self) -> int:
+        """Bit just past the filter; set only by rebuild()."""
+        return len(self._filter.bits) * 8
+
+    def _trusted(self, data: bytes | None) -> bool:
+        index = len(self._filter.bits)
+        return bool(data) and len(data) > index and bool(data[index] & 0x80)
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def _ensure_loading(self) -> None:
+        if self._loader_pid == os.getpid():
+            return
+        with self._lock:
+            if self._loader_pid == os.getpid():
+                return
+            self._loader_pid = os.getpid()
+            self._ready = False
+            threading.Thread(target=self._load, name="bloom-loader", daemon=True).start()
+
+    def _load(self) -> None:
+        try:
+            data = get_redis(binary=True).get(self.redis_key)
+            while not self._trusted(data):
+                # Not ready (fail open) until some worker has rebuilt it
+                self._rebuild_shared()
+                time.sleep(LOAD_POLL_INTERVAL)
+                data = get_redis(binary=True).get(self.redis_key)
+            self._filter.load(data)
+            logger.info("Bloom filter loaded from Redis (%d bytes)", len(data))
+            self._ready = True
+        except Exception as exc:
+            logger.warning("Bloom filter load failed (failing open): %s", exc)
+            self._loader_pid = None
+
+    def rebuild(self) -> int:
+        """Rebuild from ``urls`` (every shard) and merge the bitmap into Redis."""
+        from app import db
+        from app.models import Url
+
+        fresh = BloomFilter(self._filter.capacity, self._filter.error_rate)
+        count = 0
+        with self._app.app_context():
+            for shard in shards.ids():
+                with shards.bound(shard):
+                    rows = db.session.execute(
+                        select(Url.short_code).execution_options(yield_per=10_000)
+                    )
+                    for (code,) in rows:
+                        fresh.add(code)
+                        count += 1
+        self._filter.load(bytes(fresh.bits))
+        tmp_key = f"{self.redis_key}:merge:{uuid.uuid4().hex}"
+        try:
+            pipe = get_redis(binary=True).pipeline(transaction=True)
+            pipe.set(tmp_key, bytes(fresh.bits) + b"\x80", ex=60)  # + sentinel
+            pipe.bitop("OR", self.redis_key, self.redis_key, tmp_key)
+            pipe.delete(tmp_key)
+            pipe.execute()
+        except redis.RedisError as exc:
+            logger.warning("Bloom filter publish failed: %s", exc)
+        logger.info("Bloom filter rebuilt from %d short codes", count)
+        return count
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def add(self, *codes: str) -> None:
+        """Record newly issued codes locally and in Redis."""
+        if self._filter is None:
+            return
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for code in codes:
+                self._filter.add(code)
+                for pos in self._filter.positions(code):
+                    pipe.setbit(self.redis_key, pos, 1)
+            pipe.execute()
+        except redis.RedisError as exc:
+            logger.warning("Bloom filter SETBIT failed: %s", exc)
+
+    def might_exist(self, short_code: str) -> bool:
+        """False only if *short_code* was definitely never issued."""
+        if self._filter is None:
+            return True
+        self._ensure_loading()
+        if not self._ready or short_code in self._filter:
+            return True
+
+        # Local miss: the code may have been issued by another worker.
+        positions = self._filter.positions(short_code)
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.getbit(self.redis_key, self._sentinel)
+            for pos in positions:
+                pipe.getbit(self.redis_key, pos)
+            trusted, *bits = pipe.execute()
+        except redis.RedisError:
+            return True
+        if not trusted:
+            self._rebuild_shared()
+            return True
+        if all(bits):
+            self.redis_confirms += 1
+            self._filter.add(short_code)
+            return True
+
+        self.rejected += 1
+        return False
+
+    def _rebuild_shared(self) -> None:
+        """Rebuild the Redis bitmap in the background; one worker at a time."""
+        if self._rebuild_pid == os.getpid():
+            return
+        try:
+            if not get_redis().set(f"{self.redis_key}:rebuild-lock", os.getpid(), nx=True, ex=300):
+                return
+        except redis.RedisError:
+            return
+        self._rebuild_pid = os.getpid()
+
+        def run():
+            try:
+                self.rebuild()
+            except Exception as exc:
+                logger.warning("Bloom filter rebuild failed: %s", exc)
+            finally:
+                self._rebuild_pid = None
+
+        threading.Thread(target=run, name="bloom-rebuild", daemon=True).start()
+
+    def stats(self) -> dict:
+        if self._filter is None:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "ready": self._ready,
+            "num_bits": self._filter.num_bits,
+            "num_hashes": self._filter.num_hashes,
+            "memory_bytes": len(self._filter.bits),
+            "approx_items": self._filter.approx_items(),
+            "false_positive_rate": round(self._filter.false_positive_rate(), 8),
+            "rejected": self.rejected,
+            "redis_confirms": self.redis_confirms,
+        }
+
+
+code_filter = CodeFilter()
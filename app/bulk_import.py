@@ -0,0 +1,331 @@
+"""
+Offline bulk import of links  (``flask --app run urls import <file>``).
+
+Strategy:
+- The input is streamed: CSV with a ``url`` (or ``original_url``) column,
+  or NDJSON objects with the same key; ``expires_at``, ``created_at``,
+  ``is_active`` and ``redirect_type`` are optional.  ``.gz`` files are
+  read compressed, so a ``urls export`` dump can be re-imported as-is
+- Records are cut into chunks and validated in a process pool with the
+  API's own validate_url / sanitize_url / url_hash.  At most two chunks
+  per worker are in flight and results are consumed in input order, so
+  memory stays flat whatever the file size
+- Each chunk goes to one shard (round-robin, like the batch API), takes
+  its ids from the allocator in one round trip and its codes from
+  base62_encode, and is loaded in one transaction with the dialect's fast
+  path: COPY on PostgreSQL, a multi-row INSERT elsewhere (pymysql folds
+  the executemany into multi-row INSERTs on MySQL)
+- A JSON checkpoint next to the input counts the committed records.  Each
+  chunk's first id is noted before its load; on resume that chunk counts
+  as committed if the id exists, so a crash between COMMIT and the
+  checkpoint write never loads a chunk twice
+- Codes go into the Bloom filter before their chunk loads (redirects for
+  them would 404 otherwise); ``--warm`` also writes them to Redis and L1
+- Rejected records are appended to ``<file>.rejected.ndjson`` with their
+  line number and reason; its committed length is part of the checkpoint
+"""
+
+import io
+import os
+import csv
+import gzip
+import json
+import time
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Iterator
+
+from sqlalchemy import insert, select
+
+from app.encoder import base62_encode
+from app.export import URL_COLUMNS
+from app.validators import sanitize_url, url_hash, validate_redirect_type, validate_url
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson")
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+
+def detect_format(path: str) -> str:
+    name = path[:-3] if path.endswith(".gz") else path
+    return "csv" if name.endswith(".csv") else "ndjson"
+
+
+def _open(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def read_records(path: str, fmt: str) -> Iterator[tuple[int, dict | None]]:
+    """``(line, record)`` pairs; a record that is not a JSON object is None."""
+    with _open(path) as fh:
+        if fmt == "csv":
+            reader = csv.DictReader(fh)
+            for record in reader:
+                yield reader.line_num, record
+            return
+        for line_no, line in enumerate(fh, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_no, record if isinstance(record, dict) else None
+
+
+def _chunks(records: Iterator, size: int) -> Iterator[list]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ---------------------------------------------------------------------------
+# Validation (runs in the worker processes)
+# ---------------------------------------------------------------------------
+
+def _parse_datetime(value, field: str) -> tuple[datetime | None, str]:
+    if not value:
+        return None, ""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None, f"{field} must be a valid ISO-8601 datetime"
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed, ""
+
+
+def validate_chunk(chunk: list[tuple[int, dict | None]]) -> tuple[list[dict], list[dict]]:
+    """Split *chunk* into insertable rows and rejections."""
+    rows, rejected = [], []
+    for line, record in chunk:
+        if record is None:
+            rejected.append({"line": line, "error": "Record must be a JSON object"})
+            continue
+        original_url = str(record.get("url") or record.get("original_url") or "").strip()
+        is_valid, error_msg = validate_url(original_url)
+        expires_at = created_at = None
+        if is_valid:
+            expires_at, error_msg = _parse_datetime(record.get("expires_at"), "expires_at")
+        if not error_msg:
+            created_at, error_msg = _parse_datetime(record.get("created_at"), "created_at")
+        if not error_msg:
+            redirect_type, error_msg = validate_redirect_type(record.get("redirect_type"))
+        if error_msg:
+            rejected.append({"line": line, "url": original_url, "error": error_msg})
+            continue
+        original_url = sanitize_url(original_url)
+        rows.append({
+            "original_url": original_url,
+            "url_hash": url_hash(original_url),
+            "expires_at": expires_at,
+            "created_at": created_at,
+            "is_active": str(record.get("is_active", True)).lower() not in ("false", "0", "no"),
+            "redirect_type": redirect_type,
+        })
+    return rows, rejected
+
+
+def _validated(chunks: Iterator[list], workers: int) -> Iterator[tuple[int, list, list]]:
+    """``(records, rows, rejected)`` per chunk, in input order."""
+    if workers <= 1:
+        for chunk in chunks:
+            yield len(chunk), *validate_chunk(chunk)
+        return
+    # spawn: the CLI process may hold DB connections and background threads
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        pending: deque = deque()
+        for chunk in chunks:
+            pending.append((len(chunk), pool.submit(validate_chunk, chunk)))
+            if len(pending) >= workers * 2:
+                size, future = pending.popleft()
+                yield size, *future.result()
+        while pending:
+            size, future = pending.popleft()
+            yield size, *future.result()
+
+
+# ---------------------------------------------------------------------------
+# Loading
+# ---------------------------------------------------------------------------
+
+def _copy(conn, rows: list[dict]) -> None:
+    """PostgreSQL COPY ... FROM STDIN (CSV; an unquoted empty field is NULL)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in URL_COLUMNS])
+    buffer.seek(0)
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY urls ({', '.join(URL_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+    finally:
+        cursor.close()
+
+
+def load_rows(engine, rows: list[dict]) -> None:
+    """Insert *rows* (ids and codes assigned) in one transaction."""
+    from app.models import Url
+
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            _copy(conn, rows)
+        else:
+            conn.execute(insert(Url.__table__), rows)
+
+
+# ---------------------------------------------------------------------------
+# Checkpoints
+# ---------------------------------------------------------------------------
+
+def checkpoint_path(path: str) -> str:
+    return f"{path}.checkpoint.json"
+
+
+def _read_checkpoint(path: str, source: str) -> dict:
+    if not os.path.exists(path):
+        return {
+            "source": source, "records": 0, "imported": 0, "rejected": 0,
+            "rejects_bytes": 0, "pending": None,
+        }
+    with open(path) as fh:
+        state = json.load(fh)
+    if state.get("source") != source:
+        raise ValueError(f"{path} belongs to {state.get('source')!r}; restart to discard it")
+    return state
+
+
+def _write_checkpoint(path: str, state: dict) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump(state, fh)
+    os.replace(tmp, path)
+
+
+def _settle_pending(state: dict) -> None:
+    """Resolve a chunk whose load may or may not have committed."""
+    from app.models import Url
+    from app.sharding import shards
+
+    pending, state["pending"] = state.get("pending"), None
+    if not pending:
+        return
+    urls = Url.__table__
+    with shards.engine(pending["shard"]).connect() as conn:
+        committed = conn.execute(
+            select(urls.c.id).where(urls.c.id == pending["first_id"])
+        ).first() is not None
+    if committed:
+        state["records"] = pending["records"]
+        state["imported"] += pending["imported"]
+        state["rejected"] += pending["rejected"]
+        state["rejects_bytes"] = pending["rejects_bytes"]
+        logger.info("Chunk ending at record %d was committed before the crash", pending["records"])
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def import_urls(
+    path: str,
+    fmt: str | None = None,
+    chunk_size: int = 5000,
+    workers: int = 1,
+    warm: bool = False,
+    restart: bool = False,
+    progress: Callable[[dict], None] | None = None,
+) -> dict:
+    """
+    Import links from *path*; resumes from its checkpoint unless *restart*.
+    Must run in an app context.  Returns the final checkpoint state plus
+    ``seconds``; ``progress(state)`` is called after every chunk.
+    """
+    from app.bloom import code_filter
+    from app.cache import set_cached_urls
+    from app.id_allocator import id_allocator
+    from app.sharding import shards
+
+    fmt = fmt or detect_format(path)
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    started = time.perf_counter()
+    state_path = checkpoint_path(path)
+    source = os.path.abspath(path)
+    if restart and os.path.exists(state_path):
+        os.remove(state_path)
+    state = _read_checkpoint(state_path, source)
+    _settle_pending(state)
+
+    records = read_records(path, fmt)
+    for _ in zip(range(state["records"]), records):
+        pass  # already committed
+
+    # Rejections past the last committed chunk are written again on resume.
+    with open(f"{path}.rejected.ndjson", "a") as rejects:
+        rejects.truncate(state["rejects_bytes"])
+        for size, rows, rejected in _validated(_chunks(records, chunk_size), workers):
+            for item in rejected:
+                rejects.write(json.dumps(item) + "\n")
+            rejects.flush()
+            done = {
+                "records": state["records"] + size,
+                "imported": state["imported"] + len(rows),
+                "rejected": state["rejected"] + len(rejected),
+                "rejects_bytes": rejects.tell(),
+            }
+            if rows:
+                shard = shards.pick()
+                now = datetime.now(timezone.utc).replace(tzinfo=None)
+                for row, url_id in zip(rows, id_allocator.reserve(len(rows), shard)):
+                    row.update(
+                        id=url_id,
+                        short_code=base62_encode(url_id),
+                        created_at=row["created_at"] or now,
+                        click_count=0,
+                    )
+                state["pending"] = {
+                    **done,
+                    "shard": shard,
+                    "first_id": rows[0]["id"],
+                    "imported": len(rows),
+                    "rejected": len(rejected),
+                }
+                _write_checkpoint(state_path, state)
+                # Before the load: a code in the filter that never gets
+                # committed only costs a DB lookup, a missing one a 404.
+                code_filter.add(*(row["short_code"] for row in rows))
+                load_rows(shards.engine(shard), rows)
+                if warm:
+                    set_cached_urls([
+                        (row["short_code"], row["original_url"], row["id"], row["expires_at"],
+                         row["redirect_type"])
+                        for row in rows if row["is_active"]
+                    ])
+
+            state.update(done, pending=None)
+            _write_checkpoint(state_path, state)
+            if progress:
+                progress(state)
+
+    logger.info(
+        "Bulk import of %s: %d links, %d rejected", path, state["imported"], state["rejected"]
+    )
+    return {**state, "seconds": round(time.perf_counter() - started, 3)}
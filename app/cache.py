@@ -1,16 +1,49 @@
 """
-Redis caching layer for hot URL lookups.
+Two-tier caching layer for hot URL lookups.
 
 Strategy:
-- On redirect: check Redis first → if miss, query MySQL → populate cache
-- On create:   write-through to cache
-- On delete:   invalidate cache entry
-- Default TTL: 3600 seconds (1 hour)
+- L1: bounded in-process LRU per worker (short TTL, no network)
+- L2: shared Redis
+- On redirect: check L1 → Redis → if miss, query MySQL → populate both
+- On create:   write-through to both tiers
+- On delete (and expiry sweeps, one pipeline per batch):
+               invalidate Redis and publish on ``url:invalidate`` so every
+               worker drops its L1 entry
+- Unknown / inactive codes get a short-lived negative entry in Redis only
+  (never L1, so a newly issued code is visible everywhere at once)
+- Entries carry url id, expiry, active flag and redirect type
+  ("u2|<id>|<exp>|<active>|<type>|<url>") so the hit path can decide
+  redirect / expired / gone and build the response without the DB; "u1"
+  entries (no type) still decode, as 302
+- Default TTL: 3600 seconds (1 hour) in Redis, HOT_CACHE_TTL for codes in
+  the hot-key set (app/warmup.py), clamped to the link's remaining
+  lifetime; L1_CACHE_TTL in L1.  Redis TTLs are shortened by a random
+  share of up to CACHE_TTL_JITTER, so entries written together (warm-up,
+  batch create) do not expire together
+- ``fetch_url`` is the redirect read-through: on a miss only one lookup
+  per code runs at a time — other threads of the worker wait on its
+  in-process future, other workers on a short Redis fill lock
+  (``cache:fill:<code>``) and then read the entry it wrote
+- Hot entries are renewed before they expire (XFetch): a Redis hit
+  triggers a refresh with probability rising as the key's TTL runs out,
+  scaled by this worker's average lookup time and
+  CACHE_EARLY_REFRESH_BETA; the other requests keep the current entry
 """
 
+import os
+import sys
+import math
 import time
+import random
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from datetime import datetime, timezone
+from typing import Callable, NamedTuple
+
 import redis
+from app import metrics
 from app.config import Config
 
 logger = logging.getLogger(__name__)
@@ -19,60 +52,748 @@ logger = logging.getLogger(__name__)
 # Singleton Redis client
 # ---------------------------------------------------------------------------
 _redis_client: redis.Redis | None = None
+_redis_binary_client: redis.Redis | None = None
 
 CACHE_PREFIX = "url:"
 DEFAULT_TTL = 3600  # seconds
+NEGATIVE_TTL = Config.NEGATIVE_CACHE_TTL
+HOT_TTL = Config.HOT_CACHE_TTL
+ENTRY_VERSION = "u2"
+INVALIDATION_CHANNEL = "url:invalidate"
+FILL_LOCK_PREFIX = "cache:fill:"
+FILL_POLL_INTERVAL = 0.005  # seconds between reads while another worker fills
 
 
-def get_redis() -> redis.Redis:
-    """Return (and lazily create) the Redis client."""
-    global _redis_client
-    if _redis_client is None:
-        _redis_client = redis.Redis.from_url(
-            Config.REDIS_URL,
-            decode_responses=True,
-            socket_connect_timeout=3,
+# ---------------------------------------------------------------------------
+# Entry encoding
+# ---------------------------------------------------------------------------
+
+class CachedUrl(NamedTuple):
+    """Decoded cache entry."""
+
+    url_id: int | None
+    original_url: str
+    expires_at: float | None  # epoch seconds
+    is_active: bool
+    redirect_type: int = 302
+
+    def status(self, now: float | None = None) -> str:
+        """One of ``"redirect"``, ``"expired"`` or ``"gone"``."""
+        if not self.is_active:
+            return "gone"
+        if self.expires_at is not None and self.expires_at <= (now or time.time()):
+            return "expired"
+        return "redirect"
+
+    def cache_control(self, max_age: int, now: float | None = None) -> str:
+        """Cache-Control for the redirect: 302 / 307 are never stored; 301 /
+        308 are public for *max_age* seconds, never past expires_at."""
+        if self.redirect_type in (302, 307):
+            return "no-store"
+        if self.expires_at is not None:
+            max_age = min(max_age, int(self.expires_at - (now or time.time())))
+        return f"public, max-age={max_age}" if max_age > 0 else "no-store"
+
+
+def to_epoch(dt: datetime | None) -> float | None:
+    """Epoch seconds for a DB datetime (naive values are UTC)."""
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def encode_entry(entry: CachedUrl) -> str:
+    expires = "" if entry.expires_at is None else str(int(entry.expires_at))
+    url_id = "" if entry.url_id is None else str(entry.url_id)
+    active = "1" if entry.is_active else "0"
+    return f"{ENTRY_VERSION}|{url_id}|{expires}|{active}|{entry.redirect_type}|{entry.original_url}"
+
+
+def decode_entry(value: str) -> CachedUrl | None:
+    """Decode a stored entry; unknown formats decode to None (a miss)."""
+    if value.startswith("u1|"):
+        _, url_id, expires, active, original_url = value.split("|", 4)
+        redirect_type = "302"
+    else:
+        parts = value.split("|", 5)
+        if len(parts) != 6 or parts[0] != ENTRY_VERSION:
+            return None
+        _, url_id, expires, active, redirect_type, original_url = parts
+    return CachedUrl(
+        url_id=int(url_id) if url_id else None,
+        original_url=original_url,
+        expires_at=float(expires) if expires else None,
+        is_active=active == "1",
+        redirect_type=int(redirect_type),
+    )
+
+
+GONE = CachedUrl(None, "", None, False)
+
+
+# ---------------------------------------------------------------------------
+# L1: per-process LRU
+# ---------------------------------------------------------------------------
+
+class LocalCache:
+    """Thread-safe LRU with a per-entry TTL and entry/byte limits."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[str, float, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires, _ = entry
+            if expires < time.monotonic():
+                self._pop(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        if self.max_entries <= 0:
+            return
+        size = sys.getsizeof(key) + sys.getsizeof(value)
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (value, time.monotonic() + self.ttl, size)
+            self._bytes += size
+            while self._data and (
+                len(self._data) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._data))
+                self._pop(oldest)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _pop(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._data),
+            "bytes": self._bytes,
+        }
+
+
+_l1 = LocalCache(
+    max_entries=Config.L1_CACHE_MAX_ENTRIES,
+    max_bytes=Config.L1_CACHE_MAX_BYTES,
+    ttl=Config.L1_CACHE_TTL,
+)
+_l2_stats = {"hits": 0, "misses": 0, "errors": 0, "skipped": 0}
+
+# Snapshot of the rolling hot-key set (app/warmup.py); these get HOT_TTL.
+_hot_codes: frozenset[str] = frozenset()
+
+
+def set_hot_codes(codes) -> None:
+    global _hot_codes
+    _hot_codes = frozenset(codes)
+
+
+_listener_pid: int | None = None
+_listener_lock = threading.Lock()
+
+
+# ---------------------------------------------------------------------------
+# Redis client: sized pool, ms timeouts, circuit breaker
+# ---------------------------------------------------------------------------
+
+class CircuitOpen(redis.ConnectionError):
+    """Raised instead of calling Redis while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed → open after *threshold* consecutive failures; after *cooldown*
+    seconds one probe call is let through (half-open) and closes the
+    breaker on success or re-opens it on failure.
+    """
+
+    def __init__(self, threshold: int, cooldown: float) -> None:
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejected = 0
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls are being skipped (does not start a probe)."""
+        return self.state == "open" and time.monotonic() - self.opened_at < self.cooldown
+
+    def allow(self) -> bool:
+        """May the caller talk to Redis?  Must be followed by record_*()."""
+        if self.state == "closed":
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "open" and now - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._probing = False
+            # One probe at a time; a probe that never reported is replaced.
+            if self.state == "half_open" and (
+                not self._probing or now - self._probe_started >= self.cooldown
+            ):
+                self._probing = True
+                self._probe_started = now
+                return True
+            if self.state == "closed":
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        if self.state == "closed" and not self.failures:
+            return
+        with self._lock:
+            if self.state != "closed":
+                logger.info("Redis circuit breaker closed")
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    self.opens += 1
+                    logger.warning(
+                        "Redis circuit breaker open for %.1fs after %d failures",
+                        self.cooldown, self.failures,
+                    )
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opens": self.opens,
+            "rejected": self.rejected,
+        }
+
+
+breaker = CircuitBreaker(Config.REDIS_BREAKER_FAILURES, Config.REDIS_BREAKER_COOLDOWN)
+
+# Errors that say "Redis is unhealthy" (a ResponseError means it answered).
+_BREAKER_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+
+
+def guarded(call, *args, **kwargs):
+    """Run a Redis call through ``breaker`` (raises CircuitOpen while open)."""
+    if not breaker.allow():
+        raise CircuitOpen("Redis circuit breaker is open")
+    failed = False
+    try:
+        return call(*args, **kwargs)
+    except _BREAKER_ERRORS:
+        failed = True
+        breaker.record_failure()
+        raise
+    finally:
+        if not failed:
+            breaker.record_success()
+
+
+class _GuardedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error: bool = True):
+        if not self.command_stack:
+            return []
+        return guarded(super().execute, raise_on_error)
+
+
+class GuardedRedis(redis.Redis):
+    """redis.Redis whose commands and pipelines go through ``breaker``."""
+
+    def execute_command(self, *args, **options):
+        return guarded(super().execute_command, *args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> _GuardedPipeline:
+        return _GuardedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
         )
+
+
+def _make_client(decode_responses: bool) -> GuardedRedis:
+    pool = redis.BlockingConnectionPool.from_url(
+        Config.REDIS_URL,
+        max_connections=Config.REDIS_POOL_SIZE,
+        timeout=Config.REDIS_POOL_TIMEOUT_MS / 1000,
+        socket_connect_timeout=Config.REDIS_CONNECT_TIMEOUT_MS / 1000,
+        socket_timeout=Config.REDIS_SOCKET_TIMEOUT_MS / 1000,
+        health_check_interval=Config.REDIS_HEALTH_CHECK_INTERVAL,
+        decode_responses=decode_responses,
+    )
+    return GuardedRedis(connection_pool=pool)
+
+
+def get_redis(binary: bool = False) -> redis.Redis:
+    """Return (and lazily create) the Redis client.
+
+    ``binary=True`` returns a client without response decoding, for raw
+    values such as the Bloom filter bitmap.  Both share the pool sizing,
+    timeouts and circuit breaker configured in Config.
+    """
+    global _redis_client, _redis_binary_client
+    if binary:
+        if _redis_binary_client is None:
+            _redis_binary_client = _make_client(decode_responses=False)
+        return _redis_binary_client
+    if _redis_client is None:
+        _redis_client = _make_client(decode_responses=True)
     return _redis_client
 
 
+def get_many(keys: list[str]) -> list[str | None]:
+    """MGET *keys* in one round trip; all None if Redis is unavailable."""
+    if not keys:
+        return []
+    try:
+        with metrics.REDIS_SECONDS.labels("mget").time():
+            return get_redis().mget(keys)
+    except redis.RedisError as exc:
+        _log_redis_error("Redis MGET failed: %s", exc)
+        return [None] * len(keys)
+
+
+def set_many(items: dict[str, str] | list[tuple[str, str, int]], ttl: int = DEFAULT_TTL) -> bool:
+    """SETEX many keys in one pipeline.
+
+    *items* is ``{key: value}`` (all with *ttl*) or ``[(key, value, ttl)]``.
+    Returns False if Redis is unavailable.
+    """
+    if isinstance(items, dict):
+        items = [(key, value, ttl) for key, value in items.items()]
+    if not items:
+        return True
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for key, value, item_ttl in items:
+            pipe.setex(key, item_ttl, value)
+        with metrics.REDIS_SECONDS.labels("pipeline").time():
+            pipe.execute()
+        return True
+    except redis.RedisError as exc:
+        _log_redis_error("Redis pipelined SET failed: %s", exc)
+        return False
+
+
+def _log_redis_error(message: str, exc: Exception) -> None:
+    # An open breaker is logged once when it trips, not on every call.
+    logger.log(logging.DEBUG if isinstance(exc, CircuitOpen) else logging.WARNING, message, exc)
+
+
 def _key(short_code: str) -> str:
     return f"{CACHE_PREFIX}{short_code}"
 
 
+# ---------------------------------------------------------------------------
+# Cross-worker invalidation
+# ---------------------------------------------------------------------------
+
+def _listen_for_invalidations() -> None:
+    """Drop L1 entries named on the invalidation channel (runs forever)."""
+    while True:
+        try:
+            if breaker.is_open:
+                _l1.clear()
+                time.sleep(1)
+                continue
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Anything could have changed while we were not subscribed.
+            _l1.clear()
+            while True:
+                # Polling keeps the subscriber alive under the short socket timeout.
+                message = pubsub.get_message(timeout=1.0)
+                if message:
+                    _l1.delete(message["data"])
+        except (redis.RedisError, AttributeError) as exc:
+            logger.warning("Cache invalidation listener error: %s", exc)
+            _l1.clear()
+            time.sleep(1)
+
+
+def _ensure_listener() -> None:
+    """Start the invalidation subscriber once per process (after fork)."""
+    global _listener_pid
+    if _listener_pid == os.getpid() or _l1.max_entries <= 0:
+        return
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+        threading.Thread(
+            target=_listen_for_invalidations, name="cache-invalidation", daemon=True
+        ).start()
+
+
 # ---------------------------------------------------------------------------
 # Public API
 # ---------------------------------------------------------------------------
 
-def get_cached_url(short_code: str) -> str | None:
-    """Look up a short code in Redis.  Returns original_url or None."""
+def get_cached_url(short_code: str) -> CachedUrl | None:
+    """
+    Look up a short code in L1, then Redis.
+
+    Returns the decoded entry (check ``entry.status()``), or None on a miss.
+    """
+    _ensure_listener()
+    value = _l1.get(short_code)
+    if value is not None:
+        metrics.CACHE_LOOKUPS.labels("l1", "hit").inc()
+        return decode_entry(value)
+    metrics.CACHE_LOOKUPS.labels("l1", "miss").inc()
+    return _get_l2(short_code)[0]
+
+
+def _get_l2(short_code: str, with_ttl: bool = False) -> tuple[CachedUrl | None, float]:
+    """Redis lookup (promoting active entries to L1).  Returns the entry and,
+    with *with_ttl*, the key's remaining TTL in seconds (fetched in the same
+    round trip; negative if unknown)."""
     try:
-        start = time.perf_counter_ns()
-        value = get_redis().get(_key(short_code))
-        elapsed_ms = (time.perf_counter_ns() - start) / 1_000_000
-        if value:
-            logger.info("CACHE HIT  %-10s  (%.2f ms)", short_code, elapsed_ms)
+        start = time.perf_counter()
+        if with_ttl:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.get(_key(short_code))
+            pipe.pttl(_key(short_code))
+            value, ttl_ms = pipe.execute()
         else:
-            logger.info("CACHE MISS %-10s  (%.2f ms)", short_code, elapsed_ms)
-        return value
+            value, ttl_ms = get_redis().get(_key(short_code)), -1
+        elapsed = time.perf_counter() - start
+        metrics.REDIS_SECONDS.labels("get").observe(elapsed)
+        entry = decode_entry(value) if value else None
+        if entry:
+            _l2_stats["hits"] += 1
+            metrics.CACHE_LOOKUPS.labels("l2", "hit").inc()
+            if entry.is_active:
+                _l1.set(short_code, value)
+        else:
+            _l2_stats["misses"] += 1
+            metrics.CACHE_LOOKUPS.labels("l2", "miss").inc()
+        metrics.log_sampled(
+            logger, "CACHE %s %-10s  (%.2f ms)", "HIT " if entry else "MISS",
+            short_code, elapsed * 1000,
+        )
+        return entry, ttl_ms / 1000 if ttl_ms >= 0 else -1.0
+    except CircuitOpen:
+        _l2_stats["skipped"] += 1
+        metrics.CACHE_LOOKUPS.labels("l2", "skipped").inc()
+        return None, -1.0
     except redis.RedisError as exc:
+        _l2_stats["errors"] += 1
+        metrics.CACHE_LOOKUPS.labels("l2", "error").inc()
         logger.warning("Redis GET failed: %s", exc)
-        return None
+        return None, -1.0
+
+
+def set_cached_url(
+    short_code: str,
+    original_url: str,
+    url_id: int | None = None,
+    expires_at: datetime | None = None,
+    redirect_type: int = 302,
+    ttl: int = DEFAULT_TTL,
+) -> None:
+    """Write a short_code → original_url entry to both tiers.
+
+    The Redis TTL is clamped to the link's remaining lifetime; links that
+    have already expired are not cached.
+    """
+    _set_entry(short_code, CachedUrl(url_id, original_url, to_epoch(expires_at), True, redirect_type), ttl)
 
 
-def set_cached_url(short_code: str, original_url: str, ttl: int = DEFAULT_TTL) -> None:
-    """Write a short_code → original_url mapping to Redis."""
+def _set_entry(short_code: str, entry: CachedUrl, ttl: int = DEFAULT_TTL) -> None:
+    ttl = _ttl_for(short_code, ttl)
+    if entry.expires_at is not None:
+        ttl = min(ttl, int(entry.expires_at - time.time()))
+        if ttl <= 0:
+            return
+    value = encode_entry(entry)
+    _l1.set(short_code, value)
     try:
-        get_redis().setex(_key(short_code), ttl, original_url)
-        logger.debug("CACHE SET  %-10s  ttl=%ds", short_code, ttl)
+        with metrics.REDIS_SECONDS.labels("setex").time():
+            get_redis().setex(_key(short_code), ttl, value)
+        metrics.log_sampled(logger, "CACHE SET  %-10s  ttl=%ds", short_code, ttl)
     except redis.RedisError as exc:
-        logger.warning("Redis SET failed: %s", exc)
+        _log_redis_error("Redis SET failed: %s", exc)
+
+
+def set_cached_urls(
+    items: list[tuple[str, str, int | None, datetime | None, int]],
+    ttl: int = DEFAULT_TTL,
+) -> None:
+    """Write many ``(short_code, original_url, url_id, expires_at,
+    redirect_type)`` entries in one Redis pipeline (same TTL clamping as
+    set_cached_url)."""
+    now = time.time()
+    batch = []
+    for short_code, original_url, url_id, expires_at, redirect_type in items:
+        expires = to_epoch(expires_at)
+        item_ttl = _ttl_for(short_code, ttl)
+        if expires is not None:
+            item_ttl = min(item_ttl, int(expires - now))
+        if item_ttl <= 0:
+            continue
+        value = encode_entry(CachedUrl(url_id, original_url, expires, True, redirect_type))
+        _l1.set(short_code, value)
+        batch.append((_key(short_code), value, item_ttl))
+    if set_many(batch):
+        logger.debug("CACHE SET  %d entries (pipelined)", len(batch))
+
+
+def get_cached_urls(short_codes: list[str]) -> dict[str, CachedUrl]:
+    """Batch get_cached_url: L1 first, one MGET for the rest.  Misses are omitted."""
+    found: dict[str, CachedUrl] = {}
+    remote = []
+    for short_code in short_codes:
+        value = _l1.get(short_code)
+        if value is not None:
+            found[short_code] = decode_entry(value)
+        else:
+            remote.append(short_code)
+    for short_code, value in zip(remote, get_many([_key(c) for c in remote])):
+        entry = decode_entry(value) if value else None
+        if entry:
+            found[short_code] = entry
+            if entry.is_active:
+                _l1.set(short_code, value)
+    return found
+
+
+def set_negative_cache(short_code: str, ttl: int = NEGATIVE_TTL) -> None:
+    """Remember (briefly) that a short code does not resolve."""
+    try:
+        with metrics.REDIS_SECONDS.labels("setex").time():
+            get_redis().setex(_key(short_code), _jittered(ttl), encode_entry(GONE))
+        metrics.log_sampled(logger, "CACHE NEG  %-10s  ttl=%ds", short_code, ttl)
+    except redis.RedisError as exc:
+        _log_redis_error("Redis SET failed: %s", exc)
 
 
 def invalidate_cache(short_code: str) -> None:
-    """Remove a short code from the cache (e.g. on delete)."""
+    """Remove a short code from every tier on every worker (e.g. on delete)."""
+    invalidate_caches([short_code])
+
+
+def invalidate_caches(short_codes: list[str]) -> None:
+    """invalidate_cache() for many codes in one pipeline (e.g. the expiry sweep)."""
+    if not short_codes:
+        return
+    for short_code in short_codes:
+        _l1.delete(short_code)
     try:
-        get_redis().delete(_key(short_code))
-        logger.debug("CACHE DEL  %-10s", short_code)
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.delete(*(_key(short_code) for short_code in short_codes))
+        for short_code in short_codes:
+            pipe.publish(INVALIDATION_CHANNEL, short_code)
+        with metrics.REDIS_SECONDS.labels("pipeline").time():
+            pipe.execute()
+        logger.debug("CACHE DEL  %d codes", len(short_codes))
     except redis.RedisError as exc:
-        logger.warning("Redis DEL failed: %s", exc)
+        _log_redis_error("Redis DEL failed: %s", exc)
+
+
+# ---------------------------------------------------------------------------
+# Read-through: miss coalescing and early refresh
+# ---------------------------------------------------------------------------
+
+_flights: dict[str, Future] = {}
+_flights_lock = threading.Lock()
+_fill_stats = {"loads": 0, "coalesced": 0, "lock_waits": 0, "early_refreshes": 0}
+# Moving average of load() time in this worker: XFetch's recompute cost
+_load_seconds = 0.01
+
+
+def _jittered(ttl: int) -> int:
+    """*ttl* minus a random share of up to CACHE_TTL_JITTER of it."""
+    if Config.CACHE_TTL_JITTER <= 0 or ttl <= 1:
+        return ttl
+    return max(1, int(ttl * (1 - Config.CACHE_TTL_JITTER * random.random())))
+
+
+def _ttl_for(short_code: str, ttl: int) -> int:
+    return _jittered(max(ttl, HOT_TTL) if short_code in _hot_codes else ttl)
+
+
+def fetch_url(
+    short_code: str,
+    load: Callable[[], CachedUrl],
+    might_exist: Callable[[str], bool] | None = None,
+) -> CachedUrl | None:
+    """
+    get_cached_url with read-through.  On a miss, codes for which
+    *might_exist* is False return None (uncached); otherwise *load* (the DB
+    lookup) runs once per code across threads and workers, and its result
+    is cached: live entries as usual, anything else (GONE, expired)
+    negatively.  Hot Redis hits may renew the entry early.
+    """
+    _ensure_listener()
+    value = _l1.get(short_code)
+    if value is not None:
+        metrics.CACHE_LOOKUPS.labels("l1", "hit").inc()
+        return decode_entry(value)
+    metrics.CACHE_LOOKUPS.labels("l1", "miss").inc()
+
+    entry, ttl_left = _get_l2(short_code, with_ttl=Config.CACHE_EARLY_REFRESH_BETA > 0)
+    if entry is not None:
+        if not _refresh_due(entry, ttl_left):
+            return entry
+        _fill_stats["early_refreshes"] += 1
+        return _single_flight(short_code, load, stale=entry)
+    if might_exist is not None and not might_exist(short_code):
+        return None
+    return _single_flight(short_code, load)
+
+
+def _refresh_due(entry: CachedUrl, ttl_left: float) -> bool:
+    """XFetch: ``delta * beta * -ln(rand) >= ttl_left`` (delta = load time)."""
+    if ttl_left < 0 or Config.CACHE_EARLY_REFRESH_BETA <= 0:
+        return False
+    now = time.time()
+    if entry.status(now) != "redirect":
+        return False
+    if entry.expires_at is not None and entry.expires_at - now <= ttl_left + 1:
+        return False  # the key ends with the link; a refresh cannot extend it
+    gap = _load_seconds * Config.CACHE_EARLY_REFRESH_BETA * -math.log(1.0 - random.random())
+    return gap >= ttl_left
+
+
+def _single_flight(short_code: str, load, stale: CachedUrl | None = None) -> CachedUrl:
+    """Run *load* for *short_code* unless this worker already is; wait for
+    that run instead (or keep *stale*, when renewing early)."""
+    with _flights_lock:
+        flight = _flights.get(short_code)
+        leader = flight is None
+        if leader:
+            flight = _flights[short_code] = Future()
+    if not leader:
+        if stale is not None:
+            return stale
+        _fill_stats["coalesced"] += 1
+        try:
+            return flight.result(timeout=Config.CACHE_FILL_WAIT)
+        except FutureTimeout:
+            return load()  # the leader is stuck; do not hold this request too
+
+    try:
+        entry = _fill(short_code, load, stale)
+    except Exception as exc:
+        flight.set_exception(exc)
+        if stale is None:
+            raise
+        logger.warning("Early refresh of %s failed: %s", short_code, exc)
+        return stale
+    else:
+        flight.set_result(entry)
+        return entry
+    finally:
+        with _flights_lock:
+            _flights.pop(short_code, None)
+
+
+def _fill(short_code: str, load, stale: CachedUrl | None) -> CachedUrl:
+    """Take the cross-worker fill lock, then load and cache.  A worker that
+    finds the lock taken waits for the holder's entry (renewals give up and
+    keep *stale*); without Redis, or if the holder takes too long, it loads
+    by itself."""
+    global _load_seconds
+    lock_key = f"{FILL_LOCK_PREFIX}{short_code}"
+    locked = False
+    try:
+        locked = bool(get_redis().set(
+            lock_key, os.getpid(), nx=True, px=int(Config.CACHE_FILL_WAIT * 2000)
+        ))
+        if not locked:
+            if stale is not None:
+                return stale
+            _fill_stats["lock_waits"] += 1
+            entry = _wait_for_fill(short_code)
+            if entry is not None:
+                return entry
+    except redis.RedisError as exc:
+        _log_redis_error("Cache fill lock unavailable: %s", exc)
+
+    try:
+        started = time.perf_counter()
+        entry = load()
+        _load_seconds += 0.1 * (time.perf_counter() - started - _load_seconds)
+        _fill_stats["loads"] += 1
+        if entry.status() == "redirect":
+            _set_entry(short_code, entry)
+        else:
+            set_negative_cache(short_code)
+        return entry
+    finally:
+        if locked:
+            try:
+                get_redis().delete(lock_key)
+            except redis.RedisError as exc:
+                _log_redis_error("Cache fill unlock failed: %s", exc)
+
+
+def _wait_for_fill(short_code: str) -> CachedUrl | None:
+    """Poll Redis for the entry another worker is loading (None on timeout)."""
+    deadline = time.monotonic() + Config.CACHE_FILL_WAIT
+    r = get_redis()
+    while time.monotonic() < deadline:
+        time.sleep(FILL_POLL_INTERVAL)
+        value = r.get(_key(short_code))
+        entry = decode_entry(value) if value else None
+        if entry is not None:
+            if entry.is_active:
+                _l1.set(short_code, value)
+            return entry
+    return None
+
+
+def cache_stats() -> dict:
+    """Hit / miss / eviction counters per tier for this worker."""
+    return {
+        "l1": _l1.stats(),
+        "l2": dict(_l2_stats),
+        "fill": {
+            **_fill_stats,
+            "in_flight": len(_flights),
+            "load_ms": round(_load_seconds * 1000, 2),
+        },
+        "breaker": breaker.stats(),
+    }
@@ -0,0 +1,276 @@
+"""
+Asynchronous, batched click-log ingestion.
+
+Strategy:
+- On redirect: enqueue a compact ClickEvent into a bounded in-process buffer
+  (never touches the DB on the request thread)
+- A background flusher drains the buffer when it reaches CLICK_FLUSH_BATCH
+  events or every CLICK_FLUSH_INTERVAL seconds, whichever comes first
+- Each flush is one multi-row INSERT into click_logs plus one upsert per
+  rollup table (app/rollups.py), committed together; click counts go to
+  Redis (see app/counters.py) and are folded into urls.click_count by a
+  periodic reconciler running on the same thread; per-code counts also
+  feed the hot-key set (app/warmup.py)
+- Events are grouped by the shard of their url_id; each shard gets its own
+  INSERT + rollup upsert transaction
+- Backpressure: when the buffer is full new events are dropped and counted
+  instead of blocking the redirect
+- On worker shutdown (gunicorn worker_exit / atexit) the buffer is drained
+"""
+
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+from sqlalchemy import bindparam, insert, select, update
+
+from app import rollups
+from app.counters import add_clicks, reconcile
+from app.encoder import shard_of_id
+from app.sharding import shards
+from app.warmup import hot_keys
+
+logger = logging.getLogger(__name__)
+
+
+class ClickEvent(NamedTuple):
+    """A single redirect, captured on the hot path."""
+
+    short_code: str
+    url_id: int | None
+    ip_address: str
+    user_agent: str
+    referer: str
+    clicked_at: datetime
+
+
+class ClickIngestor:
+    """Bounded click buffer with a background bulk-insert flusher."""
+
+    def __init__(self) -> None:
+        self._app = None
+        self._buffer: deque[ClickEvent] = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+
+        self.max_size = 10_000
+        self.batch_size = 500
+        self.interval = 1.0
+        self.counter_sync_interval = 10.0
+        self._last_sync = 0.0
+
+        # Counters
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed = 0
+        self.flushes = 0
+
+    # ------------------------------------------------------------------
+    # Setup
+    # ------------------------------------------------------------------
+
+    def init_app(self, app) -> None:
+        self._app = app
+        self.max_size = app.config.get("CLICK_BUFFER_MAX", self.max_size)
+        self.batch_size = app.config.get("CLICK_FLUSH_BATCH", self.batch_size)
+        self.interval = app.config.get("CLICK_FLUSH_INTERVAL", self.interval)
+        self.counter_sync_interval = app.config.get(
+            "COUNTER_SYNC_INTERVAL", self.counter_sync_interval
+        )
+        atexit.register(self.shutdown)
+
+    def _ensure_started(self) -> None:
+        # Threads do not survive fork(), so (re)start per process.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="click-flusher", daemon=True
+        )
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Hot path
+    # ------------------------------------------------------------------
+
+    def enqueue(self, event: ClickEvent) -> bool:
+        """Buffer a click.  Returns False if it was dropped (buffer full)."""
+        with self._lock:
+            if len(self._buffer) >= self.max_size:
+                self.dropped += 1
+                return False
+            self._buffer.append(event)
+            self.enqueued += 1
+            pending = len(self._buffer)
+
+        if self._pid != os.getpid() or self._thread is None:
+            with self._lock:
+                self._ensure_started()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    # ------------------------------------------------------------------
+    # Flusher
+    # ------------------------------------------------------------------
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+            if time.monotonic() - self._last_sync >= self.counter_sync_interval:
+                self.sync_counters()
+
+    def _drain(self) -> list[ClickEvent]:
+        with self._lock:
+            count = min(len(self._buffer), self.batch_size)
+            return [self._buffer.popleft() for _ in range(count)]
+
+    def flush(self) -> int:
+        """Write everything currently buffered.  Returns rows written."""
+        written = 0
+        while True:
+            batch = self._drain()
+            if not batch:
+                return written
+            try:
+                with self._app.app_context():
+                    written += self._write_batch(batch)
+                self.flushes += 1
+            except Exception as exc:
+                self.failed += len(batch)
+                logger.warning("Click flush of %d events failed: %s", len(batch), exc)
+                return written
+
+    def _write_batch(self, batch: list[ClickEvent]) -> int:
+        from app import db
+        from app.models import Url
+
+        # Resolve short codes for events captured on the cache-hit path
+        missing = {e.short_code for e in batch if e.url_id is None}
+        ids: dict[str, int] = {}
+        for shard, codes in shards.group_codes(missing).items():
+            with shards.bound(shard):
+                rows = db.session.execute(
+                    select(Url.id, Url.short_code).where(
+                        Url.short_code.in_(codes), Url.is_active.is_(True)
+                    )
+                )
+                ids.update({code: url_id for url_id, code in rows})
+
+        per_shard: dict[int, list[dict]] = {}
+        per_code: dict[str, int] = {}
+        for e in batch:
+            url_id = e.url_id if e.url_id is not None else ids.get(e.short_code)
+            if url_id is None:
+                continue
+            per_code[e.short_code] = per_code.get(e.short_code, 0) + 1
+            per_shard.setdefault(shard_of_id(url_id), []).append({
+                "url_id": url_id,
+                "ip_address": e.ip_address,
+                "user_agent": e.user_agent,
+                "referer": e.referer,
+                "clicked_at": e.clicked_at,
+            })
+
+        written = 0
+        for shard, rows in per_shard.items():
+            with shards.bound(shard):
+                written += self._write_shard(rows)
+        if not written:
+            return 0
+
+        hot_keys.record(per_code)
+        self.flushed += written
+        logger.debug("Flushed %d clicks on %d shards", written, len(per_shard))
+        return written
+
+    def _write_shard(self, rows: list[dict]) -> int:
+        """Insert one shard's clicks and bump its counters (shard already bound)."""
+        from app import db
+        from app.models import Url, ClickLog
+
+        per_url: dict[int, int] = {}
+        for row in rows:
+            per_url[row["url_id"]] = per_url.get(row["url_id"], 0) + 1
+        try:
+            db.session.execute(insert(ClickLog.__table__).values(rows))
+            rollups.record([(row["url_id"], row["clicked_at"]) for row in rows])
+            db.session.commit()
+            if not add_clicks(per_url):
+                # Redis down — fall back to a batched counter UPDATE
+                urls = Url.__table__
+                db.session.execute(
+                    update(urls)
+                    .where(urls.c.id == bindparam("b_id"))
+                    .values(click_count=urls.c.click_count + bindparam("b_n")),
+                    [{"b_id": k, "b_n": n} for k, n in per_url.items()],
+                )
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return len(rows)
+
+    def sync_counters(self) -> int:
+        """Fold pending Redis click counters into urls.click_count."""
+        self._last_sync = time.monotonic()
+        try:
+            with self._app.app_context():
+                return reconcile()
+        except Exception as exc:
+            logger.warning("Counter reconcile failed: %s", exc)
+            return 0
+
+    # ------------------------------------------------------------------
+    # Shutdown / stats
+    # ------------------------------------------------------------------
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Stop the flusher and drain the buffer (idempotent)."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self._thread = None
+        if self._app is not None:
+            if self._buffer:
+                self.flush()
+            self.sync_counters()
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "capacity": self.max_size,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "flushes": self.flushes,
+        }
+
+
+def make_click_event(short_code: str, url_id: int | None, req) -> ClickEvent:
+    """Capture the request fields needed for a ClickLog row."""
+    return ClickEvent(
+        short_code=short_code,
+        url_id=url_id,
+        ip_address=req.remote_addr or "unknown",
+        user_agent=req.headers.get("User-Agent", ""),
+        referer=req.headers.get("Referer", ""),
+        clicked_at=datetime.now(timezone.utc),
+    )
+
+
+click_ingestor = ClickIngestor()
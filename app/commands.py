@@ -0,0 +1,316 @@
+"""
+Flask CLI commands  (run with ``flask --app run <command>``).
+"""
+
+import os
+
+import click
+from flask import current_app
+
+
+def register_commands(app) -> None:
+    """Attach the maintenance commands to *app*."""
+
+    @app.cli.group("db")
+    def db_group() -> None:
+        """Versioned schema migrations (see app/migrate.py)."""
+
+    @db_group.command("upgrade")
+    @click.option("--target", type=int, default=None, help="Stop after this version.")
+    @click.option("--shard", type=int, default=None, help="Only this shard (default: all).")
+    def db_upgrade_command(target: int | None, shard: int | None) -> None:
+        """Apply pending migrations on every shard (run once per release)."""
+        from app import migrate
+        from app.sharding import shards
+
+        applied = 0
+        for shard_id in shards.ids() if shard is None else [shard]:
+            applied += len(migrate.upgrade(
+                shards.engine(shard_id),
+                target=target,
+                progress=lambda step, seconds: click.echo(
+                    f"    shard {shard_id}: {step.version:04d} {step.name} ({seconds:.2f}s)"
+                ),
+            ))
+        click.echo(f"[OK] {applied} migrations applied")
+
+    @db_group.command("status")
+    def db_status_command() -> None:
+        """List migrations and when each was applied, per shard."""
+        from app import migrate
+        from app.sharding import shards
+
+        for shard_id in shards.ids():
+            click.echo(f"shard {shard_id}")
+            for row in migrate.status(shards.engine(shard_id)):
+                applied_at = row["applied_at"].isoformat(sep=" ") if row["applied_at"] else "pending"
+                click.echo(f"    {row['version']:04d} {row['name']:<28} {applied_at}")
+
+    @app.cli.group("shards")
+    def shards_group() -> None:
+        """Inspect and add url shards (see app/sharding.py)."""
+
+    @shards_group.command("status")
+    def shards_status_command() -> None:
+        """Links, id sequence and misplaced rows per shard."""
+        from app.sharding import shards
+
+        for row in _shard_report(shards):
+            click.echo(
+                f"    shard {row['shard']}: {row['links']} links, next id {row['next_id']}, "
+                f"{'writable' if row['writable'] else 'read-only'}"
+                + (f", {row['misplaced']} ids outside its range" if row["misplaced"] else "")
+            )
+
+    @shards_group.command("init")
+    @click.argument("shard", type=int)
+    def shards_init_command(shard: int) -> None:
+        """Apply the schema to a new shard and seed its id sequence."""
+        from app import migrate
+        from app.encoder import base62_encode, shard_range
+        from app.id_allocator import id_allocator
+        from app.sharding import shards
+
+        if shard not in shards.ids():
+            raise click.ClickException(
+                f"Shard {shard} is not configured; add it to SHARD_DATABASE_URLS first"
+            )
+        applied = migrate.upgrade(shards.engine(shard))
+        id_allocator.seed(shard)
+        click.echo(
+            f"[OK] shard {shard} ready: {len(applied)} migrations applied, ids from "
+            f"{shard_range(shard)[0]} (codes like {base62_encode(shard_range(shard)[0])!r})"
+        )
+        if shard not in shards.write_ids:
+            click.echo(f"    add {shard} to SHARD_WRITE_IDS to start placing new links there")
+
+    @app.cli.group("urls")
+    def urls_group() -> None:
+        """Offline bulk import / export of links."""
+
+    @urls_group.command("import")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]), default=None,
+                  help="Input format (default: from the file extension).")
+    @click.option("--chunk-size", default=5000, show_default=True, help="Records per load.")
+    @click.option("--workers", default=os.cpu_count() or 1, show_default=True,
+                  help="Validation processes (1 = validate inline).")
+    @click.option("--warm", is_flag=True, help="Also write the imported links to Redis.")
+    @click.option("--restart", is_flag=True, help="Ignore the checkpoint and start over.")
+    def urls_import_command(path, fmt, chunk_size, workers, warm, restart) -> None:
+        """Bulk-load links from a CSV / NDJSON file (resumable)."""
+        from app.bulk_import import checkpoint_path, import_urls
+
+        try:
+            report = import_urls(
+                path, fmt=fmt, chunk_size=chunk_size, workers=workers, warm=warm,
+                restart=restart,
+                progress=lambda state: click.echo(
+                    f"    {state['records']} records: {state['imported']} imported, "
+                    f"{state['rejected']} rejected"
+                ),
+            )
+        except ValueError as exc:
+            raise click.ClickException(str(exc))
+        click.echo(
+            f"[OK] {report['imported']} links imported, {report['rejected']} rejected "
+            f"in {report['seconds']}s (checkpoint {checkpoint_path(path)})"
+        )
+        if report["rejected"]:
+            click.echo(f"     rejected records: {path}.rejected.ndjson")
+
+    @urls_group.command("export")
+    @click.argument("output", type=click.Path(dir_okay=False, allow_dash=True), default="-")
+    @click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]), default=None,
+                  help="Output format (default: from the file extension, else ndjson).")
+    @click.option("--gzip", "compress", is_flag=True, default=None,
+                  help="Gzip the output (default: when OUTPUT ends in .gz).")
+    def urls_export_command(output, fmt, compress) -> None:
+        """Stream every link (all shards, id order) to OUTPUT or stdout."""
+        from app import export
+        from app.bulk_import import detect_format
+
+        fmt = fmt or detect_format(output)
+        if compress is None:
+            compress = output.endswith(".gz")
+        rows = count = 0
+
+        def counted():
+            nonlocal rows
+            for row in export.url_rows(current_app.config["EXPORT_YIELD_PER"]):
+                rows += 1
+                yield row
+
+        with click.open_file(output, "wb") as fh:
+            for chunk in export.stream_export(counted(), fmt, compress, export.URL_COLUMNS):
+                fh.write(chunk)
+                count += len(chunk)
+        if output != "-":
+            click.echo(f"[OK] {rows} links exported to {output} ({count} bytes)")
+
+    @app.cli.command("backfill-url-hashes")
+    @click.option("--batch-size", default=1000, show_default=True)
+    def backfill_url_hashes_command(batch_size: int) -> None:
+        """Fill urls.url_hash for rows created before de-duplication."""
+        from app.dedup import backfill_url_hashes
+
+        total = backfill_url_hashes(batch_size)
+        click.echo(f"[OK] url_hash backfilled for {total} rows")
+
+    @app.cli.command("rebuild-rollups")
+    @click.option("--code", default=None, help="Only rebuild this short code.")
+    def rebuild_rollups_command(code: str | None) -> None:
+        """Recompute hourly/daily click rollups from click_logs."""
+        from app import rollups
+        from app.models import Url
+        from app.sharding import shards
+
+        scanned = 0
+        if code:
+            with shards.bound(shards.for_code(code)):
+                url_record = Url.query.filter_by(short_code=code).first()
+                if url_record is None:
+                    raise click.ClickException(f"Unknown short code {code!r}")
+                scanned = rollups.rebuild(url_record.id)
+        else:
+            for shard in shards.ids():
+                with shards.bound(shard):
+                    scanned += rollups.rebuild()
+        click.echo(f"[OK] rollups rebuilt from {scanned} click rows")
+
+    @app.cli.command("warm-cache")
+    @click.option("--top-n", type=int, default=None, help="Links per source (default WARMUP_TOP_N).")
+    @click.option("--recent-hours", type=int, default=None,
+                  help="Window for recent click volume (default WARMUP_RECENT_HOURS).")
+    def warm_cache_command(top_n: int | None, recent_hours: int | None) -> None:
+        """Preload the hottest links into Redis."""
+        from app.warmup import hot_keys
+
+        overrides = {"progress": lambda done, total: click.echo(f"    {done}/{total}")}
+        if top_n is not None:
+            overrides["top_n"] = top_n
+        if recent_hours is not None:
+            overrides["recent_hours"] = recent_hours
+        report = hot_keys.warm(**overrides)
+        click.echo(
+            f"[OK] warmed {report['links']} links ({report['hot']} hot) "
+            f"in {report['batches']} batches, {report['seconds']}s"
+        )
+
+    @app.cli.command("expire-links")
+    @click.option("--batch-size", type=int, default=None, help="Rows per batch (default EXPIRY_SWEEP_BATCH).")
+    @click.option("--max-batches", type=int, default=None,
+                  help="Batches per shard (default EXPIRY_SWEEP_MAX_BATCHES).")
+    def expire_links_command(batch_size: int | None, max_batches: int | None) -> None:
+        """Deactivate links whose expiry has passed."""
+        from app.expiry import expiry_sweeper
+
+        overrides = {"progress": lambda links: click.echo(f"    {links}")}
+        if batch_size is not None:
+            overrides["batch_size"] = batch_size
+        if max_batches is not None:
+            overrides["max_batches"] = max_batches
+        report = expiry_sweeper.sweep(**overrides)
+        click.echo(
+            f"[OK] deactivated {report['links']} links in {report['batches']} batches, "
+            f"{report['seconds']}s ({report['per_second']}/s), lag {report['lag_seconds']}s"
+        )
+        if not report["complete"]:
+            click.echo("    more links are due; run again or raise --max-batches")
+
+    @app.cli.group("partitions")
+    def partitions_group() -> None:
+        """Manage monthly click_logs partitions (MySQL / PostgreSQL)."""
+
+    @partitions_group.command("ensure")
+    @click.option("--months-ahead", default=3, show_default=True)
+    def partitions_ensure_command(months_ahead: int) -> None:
+        """Create upcoming monthly partitions on every partitioned shard."""
+        from app.partitions import ensure_partitions, is_partitioned
+        from app.sharding import shards
+
+        created = []
+        for shard in shards.ids():
+            with shards.bound(shard):
+                if not is_partitioned():
+                    click.echo(f"    shard {shard}: click_logs is not partitioned, skipped")
+                    continue
+                created += ensure_partitions(months_ahead)
+        click.echo(f"[OK] created {len(created)} partitions {created}")
+
+    @partitions_group.command("retention")
+    @click.option("--months", type=int, default=None,
+                  help="Keep this many months (default CLICK_RETENTION_MONTHS).")
+    def partitions_retention_command(months: int | None) -> None:
+        """Archive and drop partitions older than the retention window."""
+        from app.partitions import apply_retention, shard_archive_dir
+        from app.sharding import shards
+
+        months = app.config["CLICK_RETENTION_MONTHS"] if months is None else months
+        dropped = []
+        for shard in shards.ids():
+            with shards.bound(shard):
+                dropped += apply_retention(
+                    months, shard_archive_dir(app.config["CLICK_ARCHIVE_DIR"], shard)
+                )
+        for item in dropped:
+            click.echo(f"    {item['partition']}: {item['rows']} rows -> {item['segment']}")
+        click.echo(f"[OK] {len(dropped)} partitions archived and dropped")
+
+    @partitions_group.command("archive-query")
+    @click.option("--code", default=None, help="Only clicks for this short code.")
+    @click.option("--since", default=None, help="ISO-8601 lower bound.")
+    @click.option("--until", default=None, help="ISO-8601 upper bound.")
+    def partitions_archive_query_command(code, since, until) -> None:
+        """Print archived clicks as NDJSON."""
+        import json
+        from datetime import datetime
+        from app.models import Url
+        from app.partitions import iter_archived_clicks, shard_archive_dir
+        from app.sharding import shards
+
+        url_id = None
+        shard_ids = shards.ids()
+        if code:
+            shard_ids = [shards.for_code(code)]
+            with shards.bound(shard_ids[0]):
+                url_record = Url.query.filter_by(short_code=code).first()
+            if url_record is None:
+                raise click.ClickException(f"Unknown short code {code!r}")
+            url_id = url_record.id
+        for shard in shard_ids:
+            for row in iter_archived_clicks(
+                shard_archive_dir(app.config["CLICK_ARCHIVE_DIR"], shard),
+                url_id=url_id,
+                since=datetime.fromisoformat(since) if since else None,
+                until=datetime.fromisoformat(until) if until else None,
+            ):
+                click.echo(json.dumps(row))
+
+
+def _shard_report(shards) -> list[dict]:
+    """Per-shard link count, sequence position and rows outside the shard's id range."""
+    from sqlalchemy import func, or_, select
+    from app.encoder import shard_range
+    from app.models import IdSequence, Url
+
+    report = []
+    for shard in shards.ids():
+        start, end = shard_range(shard)
+        with shards.engine(shard).connect() as conn:
+            links = conn.execute(select(func.count()).select_from(Url.__table__)).scalar()
+            misplaced = conn.execute(
+                select(func.count()).select_from(Url.__table__)
+                .where(or_(Url.id < start, Url.id >= end))
+            ).scalar()
+            next_id = conn.execute(
+                select(IdSequence.next_id).where(IdSequence.name == "urls")
+            ).scalar()
+        report.append({
+            "shard": shard,
+            "links": links,
+            "next_id": next_id,
+            "misplaced": misplaced,
+            "writable": shard in shards.write_ids,
+        })
+    return report
@@ -8,6 +8,19 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def _engine_options(url: str, pool_size: int, **pool) -> dict:
+    """Explicit pool settings for one database (SQLite keeps its own pool class)."""
+    if url.startswith("sqlite"):
+        return {"pool_pre_ping": True}
+    return {"pool_size": pool_size, "pool_pre_ping": True, **pool}
+
+
+def _bind_options(urls: dict[str, str], pool_size: int, **pool) -> dict[str, dict]:
+    # Flask-SQLAlchemy applies SQLALCHEMY_ENGINE_OPTIONS to the default
+    # database only; binds carry their options next to the url.
+    return {key: {"url": url, **_engine_options(url, pool_size, **pool)} for key, url in urls.items()}
+
+
 class Config:
     # Flask
     SECRET_KEY = os.getenv("SECRET_KEY", "change-me")
@@ -36,6 +49,67 @@ class Config:
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # ---- Engine pools (every database: primary, shards, replicas) ----
+    # Per worker: pool_size persistent connections plus max_overflow burst
+    # ones; recycle below the server / proxy idle timeout; pre-ping drops
+    # connections that died while idle instead of failing a request.
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))
+    REPLICA_POOL_SIZE = int(os.getenv("REPLICA_POOL_SIZE", DB_POOL_SIZE))
+    _pool = {
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(SQLALCHEMY_DATABASE_URI, DB_POOL_SIZE, **_pool)
+
+    # ---- Shards (app/sharding.py) ----
+    # Extra databases for urls and their clicks, "1=<url>,2=<url>"; shard 0 is
+    # the database above.  Each becomes the Flask-SQLAlchemy bind "shard<n>".
+    SHARD_DATABASE_URLS = {
+        int(shard): url.strip().replace("postgres://", "postgresql://", 1)
+        for shard, url in (
+            item.split("=", 1)
+            for item in os.getenv("SHARD_DATABASE_URLS", "").split(",")
+            if item.strip()
+        )
+    }
+    # Shards that receive new links (round-robin); empty = all of them.
+    SHARD_WRITE_IDS = [
+        int(shard) for shard in os.getenv("SHARD_WRITE_IDS", "").split(",") if shard.strip()
+    ]
+
+    # ---- Read replicas (app/replicas.py) ----
+    # "<shard>=<url>,..." (0 = the database above); a shard may be listed more
+    # than once.  Each becomes the bind "shard<n>-replica<i>".
+    REPLICA_DATABASE_URLS = [
+        (int(shard), url.strip().replace("postgres://", "postgresql://", 1))
+        for shard, url in (
+            item.split("=", 1)
+            for item in os.getenv("REPLICA_DATABASE_URLS", "").split(",")
+            if item.strip()
+        )
+    ]
+    REPLICA_BINDS = {
+        f"shard{shard}-replica{i}": shard for i, (shard, _) in enumerate(REPLICA_DATABASE_URLS, 1)
+    }
+    # Replicas further behind than this (seconds) are skipped until they catch up.
+    REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", 5.0))
+    REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", 2.0))
+
+    SQLALCHEMY_BINDS = {
+        **_bind_options(
+            {f"shard{shard}": url for shard, url in SHARD_DATABASE_URLS.items()},
+            DB_POOL_SIZE, **_pool,
+        ),
+        **_bind_options(
+            {f"shard{shard}-replica{i}": url for i, (shard, url) in enumerate(REPLICA_DATABASE_URLS, 1)},
+            REPLICA_POOL_SIZE, **_pool,
+        ),
+    }
+
     # ---- Redis ----
     # Render injects REDIS_URL for its managed Redis instance.
     REDIS_URL = os.getenv("REDIS_URL", "")
@@ -45,9 +119,121 @@ class Config:
         REDIS_DB = int(os.getenv("REDIS_DB", 0))
         REDIS_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
 
+    # ---- Redis client (per worker pool, ms timeouts, circuit breaker) ----
+    REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", 32))
+    REDIS_POOL_TIMEOUT_MS = int(os.getenv("REDIS_POOL_TIMEOUT_MS", 50))
+    REDIS_CONNECT_TIMEOUT_MS = int(os.getenv("REDIS_CONNECT_TIMEOUT_MS", 200))
+    REDIS_SOCKET_TIMEOUT_MS = int(os.getenv("REDIS_SOCKET_TIMEOUT_MS", 100))
+    REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+    # Consecutive connection errors / timeouts before Redis is skipped, and for how long
+    REDIS_BREAKER_FAILURES = int(os.getenv("REDIS_BREAKER_FAILURES", 5))
+    REDIS_BREAKER_COOLDOWN = float(os.getenv("REDIS_BREAKER_COOLDOWN", 10.0))
+
+    # ---- In-process L1 cache (per worker, in front of Redis) ----
+    L1_CACHE_MAX_ENTRIES = int(os.getenv("L1_CACHE_MAX_ENTRIES", 10000))
+    L1_CACHE_MAX_BYTES = int(os.getenv("L1_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+    L1_CACHE_TTL = float(os.getenv("L1_CACHE_TTL", 5.0))
+
+    # ---- Cache fills (app/cache.fetch_url) ----
+    # Redis TTLs are shortened by a random share of up to this fraction.
+    CACHE_TTL_JITTER = float(os.getenv("CACHE_TTL_JITTER", 0.1))
+    # XFetch early refresh of hot entries; higher renews earlier, 0 = off.
+    CACHE_EARLY_REFRESH_BETA = float(os.getenv("CACHE_EARLY_REFRESH_BETA", 1.0))
+    # Longest a request waits for another one's DB lookup of the same code
+    # (seconds); the cross-worker fill lock expires after twice that.
+    CACHE_FILL_WAIT = float(os.getenv("CACHE_FILL_WAIT", 0.5))
+
+    # ---- Unknown-code protection ----
+    # Codes confirmed missing/inactive are cached negatively for this long.
+    NEGATIVE_CACHE_TTL = int(os.getenv("NEGATIVE_CACHE_TTL", 60))
+    # Bloom filter of issued codes (shared through Redis).
+    BLOOM_CAPACITY = int(os.getenv("BLOOM_CAPACITY", 1_000_000))
+    BLOOM_ERROR_RATE = float(os.getenv("BLOOM_ERROR_RATE", 0.001))
+
+    # ---- HTTP caching ----
+    # Cache-Control max-age for 301 / 308 links (capped by their expires_at).
+    REDIRECT_CACHE_MAX_AGE = int(os.getenv("REDIRECT_CACHE_MAX_AGE", 86400))
+
+    # ---- Click ingestion ----
+    # Redirects buffer clicks in-process; a background thread bulk-inserts them.
+    CLICK_BUFFER_MAX = int(os.getenv("CLICK_BUFFER_MAX", 10000))
+    CLICK_FLUSH_BATCH = int(os.getenv("CLICK_FLUSH_BATCH", 500))
+    CLICK_FLUSH_INTERVAL = float(os.getenv("CLICK_FLUSH_INTERVAL", 1.0))
+    # Click counters live in Redis and are written back to urls.click_count.
+    COUNTER_SYNC_INTERVAL = float(os.getenv("COUNTER_SYNC_INTERVAL", 10.0))
+
+    # ---- Cache warm-up / hot keys (app/warmup.py) ----
+    WARMUP_ON_BOOT = os.getenv("WARMUP_ON_BOOT", "True").lower() in ("true", "1", "yes")
+    WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", 1000))
+    WARMUP_RECENT_HOURS = int(os.getenv("WARMUP_RECENT_HOURS", 24))
+    WARMUP_BATCH_SIZE = int(os.getenv("WARMUP_BATCH_SIZE", 500))
+    HOT_KEYS_MAX = int(os.getenv("HOT_KEYS_MAX", 1000))
+    HOT_CACHE_TTL = int(os.getenv("HOT_CACHE_TTL", 86400))
+    HOT_REFRESH_INTERVAL = float(os.getenv("HOT_REFRESH_INTERVAL", 30.0))
+    HOT_DECAY_INTERVAL = float(os.getenv("HOT_DECAY_INTERVAL", 600.0))
+    # Required as X-Admin-Token on /api/admin/* when set.
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+    # ---- Expiry sweeper (app/expiry.py) ----
+    # Seconds between scheduled sweeps (one worker per interval); 0 = CLI only.
+    EXPIRY_SWEEP_INTERVAL = float(os.getenv("EXPIRY_SWEEP_INTERVAL", 60.0))
+    EXPIRY_SWEEP_BATCH = int(os.getenv("EXPIRY_SWEEP_BATCH", 500))
+    # Per shard per sweep; the rest waits for the next one.
+    EXPIRY_SWEEP_MAX_BATCHES = int(os.getenv("EXPIRY_SWEEP_MAX_BATCHES", 100))
+
+    # ---- Id allocation ----
+    # Ids reserved per round trip to the id_sequences table (per worker).
+    ID_BLOCK_SIZE = int(os.getenv("ID_BLOCK_SIZE", 100))
+
+    # ---- De-duplication ----
+    # Default for the per-request "dedupe" flag on POST /api/shorten.
+    DEDUP_DEFAULT = os.getenv("DEDUP_DEFAULT", "False").lower() in ("true", "1", "yes")
+
+    # ---- Batch shortening ----
+    BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 1000))
+    # Budget is counted per submitted URL, not per request.
+    BATCH_RATE_LIMIT = os.getenv("BATCH_RATE_LIMIT", "5000 per minute")
+
+    # ---- Analytics ----
+    ANALYTICS_MAX_HOURLY_DAYS = int(os.getenv("ANALYTICS_MAX_HOURLY_DAYS", 31))
+    # Streaming export: rows fetched per server-side cursor round trip
+    EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", 1000))
+    EXPORT_MAX_CODES = int(os.getenv("EXPORT_MAX_CODES", 1000))
+
+    # ---- Click retention (partitioned click_logs) ----
+    # Months of raw clicks kept in the DB; 0 keeps everything.
+    CLICK_RETENTION_MONTHS = int(os.getenv("CLICK_RETENTION_MONTHS", 0))
+    CLICK_ARCHIVE_DIR = os.getenv("CLICK_ARCHIVE_DIR", "archive")
+
+    # ---- Standalone ASGI redirect server (app/asgi_redirect.py) ----
+    ASGI_DB_POOL_SIZE = int(os.getenv("ASGI_DB_POOL_SIZE", 20))
+
+    # ---- Observability ----
+    # Fraction of hot-path requests logged at DEBUG (cache hit/miss, redirects).
+    LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.01))
+
     # App
     BASE_URL = os.getenv("BASE_URL", "http://localhost:5000")
 
-    # Rate Limiter storage
-    RATELIMIT_STORAGE_URI = REDIS_URL
-    RATELIMIT_STRATEGY = "fixed-window"
+    # Rate Limiter storage.  With RATELIMIT_LOCAL each worker counts in memory
+    # and syncs with Redis in batches (app/limit_storage.py); otherwise every
+    # check is a Redis round trip.
+    RATELIMIT_LOCAL = os.getenv("RATELIMIT_LOCAL", "True").lower() in ("true", "1", "yes")
+    RATELIMIT_STORAGE_URI = (
+        f"local+{REDIS_URL}"
+        if RATELIMIT_LOCAL and REDIS_URL.startswith(("redis://", "rediss://"))
+        else REDIS_URL
+    )
+    # fixed-window (default) | sliding-window-counter (no burst of 2x the
+    # limit across a window boundary) | moving-window (exact sliding log)
+    RATELIMIT_STRATEGY = os.getenv("RATELIMIT_STRATEGY", "fixed-window")
+    # Seconds between batched syncs, and local hits per key before an inline push
+    RATELIMIT_SYNC_INTERVAL = float(os.getenv("RATELIMIT_SYNC_INTERVAL", 0.5))
+    RATELIMIT_MAX_PENDING = int(os.getenv("RATELIMIT_MAX_PENDING", 10))
+    # Same ms timeouts for the limiter's own Redis client; a Redis outage
+    # lets requests through instead of failing them.
+    RATELIMIT_STORAGE_OPTIONS = {
+        "socket_connect_timeout": REDIS_CONNECT_TIMEOUT_MS / 1000,
+        "socket_timeout": REDIS_SOCKET_TIMEOUT_MS / 1000,
+    }
+    RATELIMIT_SWALLOW_ERRORS = True
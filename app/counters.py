@@ -0,0 +1,191 @@
+"""
+Redis-resident click counters with periodic write-back to urls.click_count.
+
+Strategy:
+- Click flushes add per-URL deltas to the Redis hash ``clicks:pending``
+  (one pipelined HINCRBY per URL) instead of updating the ``urls`` row
+- A reconciler renames the hash to ``clicks:inflight`` (atomic), folds every
+  delta into ``urls.click_count`` with one batched UPDATE, then deletes it
+- Readers add pending + inflight deltas to the persisted value, so totals
+  stay exact without touching the DB per click
+- If Redis is unavailable callers fall back to updating the DB directly
+- Deltas are applied per shard (by url_id); each shard's fields are removed
+  from the inflight hash once committed
+- Every inflight hash gets a batch id (``clicks:inflight-batch``, set in
+  the same MULTI as the rename, which only runs once ``clicks:pending``
+  is known to exist: Redis does not roll back the SET if the RENAME
+  fails).  A shard records the id in ``counter_batches`` in the
+  transaction that applies it and skips a batch it already holds, so a
+  crash between COMMIT and HDEL never re-applies it
+"""
+
+import uuid
+import logging
+from datetime import datetime, timedelta, timezone
+
+import redis
+from sqlalchemy import case, delete, insert, select, update
+
+from app.cache import get_redis
+from app.sharding import shards
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = "clicks:pending"
+INFLIGHT_KEY = "clicks:inflight"
+BATCH_KEY = "clicks:inflight-batch"
+LOCK_KEY = "clicks:reconcile-lock"
+LOCK_TTL = 60  # seconds
+BATCH_RETENTION = timedelta(days=1)  # applied markers kept this long
+
+
+def add_clicks(per_url: dict[int, int]) -> bool:
+    """Add click deltas to Redis.  Returns False if Redis is unavailable."""
+    if not per_url:
+        return True
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for url_id, count in per_url.items():
+            pipe.hincrby(PENDING_KEY, str(url_id), count)
+        pipe.execute()
+        return True
+    except redis.RedisError as exc:
+        logger.warning("Redis HINCRBY failed, falling back to DB: %s", exc)
+        return False
+
+
+def get_pending(url_id: int) -> int:
+    """Clicks for *url_id* not yet folded into urls.click_count."""
+    return get_pending_many([url_id]).get(url_id, 0)
+
+
+def get_pending_many(url_ids: list[int]) -> dict[int, int]:
+    """
+    Pending deltas for several URLs in one round trip.
+
+    Both hashes are read in one MULTI, so a concurrent rename never hides
+    or doubles a delta.  Between a shard's COMMIT and the HDEL that follows
+    it, a delta is already in urls.click_count and still inflight: totals
+    read in that window (one Redis round trip) are briefly over-counted,
+    which at worst costs a conditional GET its 304.
+    """
+    if not url_ids:
+        return {}
+    fields = [str(i) for i in url_ids]
+    try:
+        pipe = get_redis().pipeline(transaction=True)
+        pipe.hmget(PENDING_KEY, fields)
+        pipe.hmget(INFLIGHT_KEY, fields)
+        pending, inflight = pipe.execute()
+    except redis.RedisError as exc:
+        logger.warning("Redis HMGET failed: %s", exc)
+        return {}
+    return {
+        url_id: int(p or 0) + int(f or 0)
+        for url_id, p, f in zip(url_ids, pending, inflight)
+    }
+
+
+def reconcile_statement(deltas: dict[int, int]):
+    """One UPDATE adding ``deltas[url_id]`` to each url's click_count."""
+    from app.models import Url
+
+    urls = Url.__table__
+    return (
+        update(urls)
+        .where(urls.c.id.in_(deltas))
+        .values(click_count=urls.c.click_count + case(deltas, value=urls.c.id, else_=0))
+    )
+
+
+def batch_applied(batch_id: str):
+    """SELECT returning a row if *batch_id* was applied on this shard."""
+    from app.models import CounterBatch
+
+    batches = CounterBatch.__table__
+    return select(batches.c.batch_id).where(batches.c.batch_id == batch_id)
+
+
+def batch_marker_statements(batch_id: str) -> list:
+    """Record *batch_id* as applied and drop markers past BATCH_RETENTION;
+    run in the transaction that applies the batch."""
+    from app.models import CounterBatch
+
+    batches = CounterBatch.__table__
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return [
+        delete(batches).where(batches.c.applied_at < now - BATCH_RETENTION),
+        insert(batches).values(batch_id=batch_id, applied_at=now),
+    ]
+
+
+def _inflight_batch(r) -> str | None:
+    """Id of the inflight hash, moving pending there first if needed
+    (None when there is nothing to reconcile)."""
+    if not r.exists(INFLIGHT_KEY):
+        # Only the lock holder removes pending, so it still exists at EXEC
+        if not r.exists(PENDING_KEY):
+            return None  # nothing pending
+        pipe = r.pipeline(transaction=True)
+        pipe.rename(PENDING_KEY, INFLIGHT_KEY)
+        pipe.set(BATCH_KEY, uuid.uuid4().hex)
+        pipe.execute()
+    batch_id = r.get(BATCH_KEY)
+    if batch_id is None:
+        # Left over from before batch ids: it has never been marked anywhere
+        batch_id = uuid.uuid4().hex
+        r.set(BATCH_KEY, batch_id)
+    return batch_id
+
+
+def reconcile() -> int:
+    """
+    Fold pending Redis deltas into urls.click_count.
+
+    Must run inside an app context.  Only one process reconciles at a time
+    (guarded by a Redis lock).  Returns the number of URLs updated.
+    """
+    from app import db
+
+    r = get_redis()
+    token = uuid.uuid4().hex
+    try:
+        if not r.set(LOCK_KEY, token, nx=True, ex=LOCK_TTL):
+            return 0
+    except redis.RedisError as exc:
+        logger.warning("Counter reconcile skipped: %s", exc)
+        return 0
+
+    try:
+        # A leftover inflight hash means a previous run died mid-way: retry it.
+        batch_id = _inflight_batch(r)
+        if batch_id is None:
+            return 0
+
+        deltas = {int(k): int(v) for k, v in r.hgetall(INFLIGHT_KEY).items() if int(v)}
+        for shard, url_ids in shards.group_ids(deltas).items():
+            with shards.bound(shard):
+                try:
+                    if db.session.execute(batch_applied(batch_id)).first() is None:
+                        db.session.execute(
+                            reconcile_statement({url_id: deltas[url_id] for url_id in url_ids})
+                        )
+                        for stmt in batch_marker_statements(batch_id):
+                            db.session.execute(stmt)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+            r.hdel(INFLIGHT_KEY, *url_ids)
+        r.delete(INFLIGHT_KEY, BATCH_KEY)
+        logger.debug("Reconciled click counters for %d urls", len(deltas))
+        return len(deltas)
+    except redis.RedisError as exc:
+        logger.warning("Counter reconcile failed: %s", exc)
+        return 0
+    finally:
+        try:
+            if r.get(LOCK_KEY) == token:
+                r.delete(LOCK_KEY)
+        except redis.RedisError:
+            pass
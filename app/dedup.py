@@ -0,0 +1,114 @@
+"""
+Content-hash de-duplication for repeated original URLs.
+
+Strategy:
+- Every new row stores ``url_hash`` = SHA-256 of the normalized URL
+- Opt-in (``"dedupe": true`` on POST /api/shorten): look the hash up in
+  Redis (``urlhash:<hash>:<expiry>`` → short_code), then in the indexed
+  ``url_hash`` column, and return the existing active code
+- Only links with the *same* expires_at are reused, so a caller asking for
+  a different lifetime always gets a fresh code
+- ``backfill_url_hashes`` fills the column for rows created before it existed
+"""
+
+import logging
+from datetime import datetime
+
+import redis
+from sqlalchemy import bindparam, select, update
+
+from app.cache import DEFAULT_TTL, get_cached_url, get_redis, set_many, to_epoch
+from app.sharding import shards
+
+logger = logging.getLogger(__name__)
+
+HASH_PREFIX = "urlhash:"
+
+
+def _hash_key(digest: str, expires_at: datetime | None) -> str:
+    expires = to_epoch(expires_at)
+    return f"{HASH_PREFIX}{digest}:{int(expires) if expires is not None else 0}"
+
+
+def remember(digest: str, expires_at: datetime | None, short_code: str) -> None:
+    """Cache hash → code for future de-duplicated requests."""
+    try:
+        get_redis().setex(_hash_key(digest, expires_at), DEFAULT_TTL, short_code)
+    except redis.RedisError as exc:
+        logger.warning("Redis SET failed: %s", exc)
+
+
+def remember_many(items: list[tuple[str, datetime | None, str]]) -> None:
+    """remember() for many ``(digest, expires_at, short_code)`` in one pipeline."""
+    set_many([
+        (_hash_key(digest, expires_at), short_code, DEFAULT_TTL)
+        for digest, expires_at, short_code in items
+    ])
+
+
+def find_existing(digest: str, expires_at: datetime | None):
+    """Return an active, unexpired Url with this hash and expiry, or None."""
+    from app.models import Url
+
+    try:
+        code = get_redis().get(_hash_key(digest, expires_at))
+    except redis.RedisError as exc:
+        logger.warning("Redis GET failed: %s", exc)
+        code = None
+
+    if code:
+        entry = get_cached_url(code)
+        if entry is None or entry.status() == "redirect":
+            with shards.bound(shards.for_code(code)):
+                url_record = Url.query.filter_by(short_code=code, is_active=True).first()
+            if url_record and url_record.url_hash == digest and not url_record.is_expired():
+                return url_record
+
+    same_expiry = Url.expires_at.is_(None) if expires_at is None else Url.expires_at == expires_at
+    for shard in shards.ids():
+        with shards.bound(shard):
+            url_record = (
+                Url.query.filter(Url.url_hash == digest, Url.is_active.is_(True), same_expiry)
+                .order_by(Url.id)
+                .first()
+            )
+        if url_record is not None and not url_record.is_expired():
+            remember(digest, expires_at, url_record.short_code)
+            return url_record
+    return None
+
+
+def backfill_url_hashes(batch_size: int = 1000) -> int:
+    """Fill ``url_hash`` for rows that predate it, on every shard.  Returns rows updated."""
+    total = 0
+    for shard in shards.ids():
+        with shards.bound(shard):
+            total += _backfill_shard(batch_size)
+    return total
+
+
+def _backfill_shard(batch_size: int) -> int:
+    from app import db
+    from app.models import Url
+    from app.validators import url_hash
+
+    urls = Url.__table__
+    last_id = 0
+    total = 0
+    while True:
+        rows = db.session.execute(
+            select(urls.c.id, urls.c.original_url)
+            .where(urls.c.id > last_id, urls.c.url_hash.is_(None))
+            .order_by(urls.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return total
+        db.session.execute(
+            update(urls).where(urls.c.id == bindparam("b_id")).values(url_hash=bindparam("b_hash")),
+            [{"b_id": row.id, "b_hash": url_hash(row.original_url)} for row in rows],
+        )
+        db.session.commit()
+        last_id = rows[-1].id
+        total += len(rows)
+        logger.info("Backfilled url_hash for %d rows (up to id %d)", total, last_id)
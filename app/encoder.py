@@ -4,11 +4,17 @@ Base62 Encoder / Decoder
 Converts a unique auto-increment integer ID into a short alphanumeric code.
 62 characters  →  up to 56+ billion unique codes with 6 characters.
 O(1) encode / decode complexity.  Collision-free by design.
+
+Ids carry their database shard in the bits from SHARD_SHIFT up, so the
+shard can be read back from a short code without any lookup.  Every id
+issued before sharding is below 2**40 and belongs to shard 0.
 """
 
 CHARSET = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
 BASE = len(CHARSET)  # 62
 
+SHARD_SHIFT = 40  # ~1.1 trillion ids per shard
+
 
 def base62_encode(num: int) -> str:
     """Encode a positive integer to a Base62 string."""
@@ -31,3 +37,21 @@ def base62_decode(code: str) -> int:
         idx = CHARSET.index(char)
         num = num * BASE + idx
     return num
+
+
+def shard_range(shard: int) -> tuple[int, int]:
+    """Ids owned by *shard*: ``[start, end)``."""
+    return shard << SHARD_SHIFT, (shard + 1) << SHARD_SHIFT
+
+
+def shard_of_id(num: int) -> int:
+    """The shard encoded in an id."""
+    return num >> SHARD_SHIFT
+
+
+def shard_of_code(code: str) -> int:
+    """The shard a short code lives on (0 for anything undecodable)."""
+    try:
+        return shard_of_id(base62_decode(code))
+    except ValueError:
+        return 0
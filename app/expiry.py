@@ -0,0 +1,174 @@
+"""
+Background deactivation of expired links.
+
+Strategy:
+- ``sweep_expired`` finds due rows (active, ``expires_at`` passed) through
+  the ``(is_active, expires_at)`` index, oldest first, and deactivates them
+  in batches of EXPIRY_SWEEP_BATCH: one SELECT, one UPDATE ... WHERE id IN
+  and one commit per batch, at most EXPIRY_SWEEP_MAX_BATCHES per shard per
+  run, so a large backlog never holds locks or a transaction for long
+- The cache keys of each batch are dropped in one Redis pipeline, which
+  also tells every worker to drop its L1 copies (cache.invalidate_caches)
+- Every worker runs a scheduler thread (started by gunicorn
+  post_worker_init); an NX lock lets one of them sweep per
+  EXPIRY_SWEEP_INTERVAL.  ``flask --app run expire-links`` sweeps on
+  demand (e.g. from cron); EXPIRY_SWEEP_INTERVAL=0 leaves it to the CLI
+- Each run reports links / batches / seconds / links per second and its
+  lag: how long the oldest link it deactivated had already been expired
+- The redirect cache-miss path still deactivates an expired link it runs
+  into; the sweep only means nobody has to visit it first
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Callable
+
+import redis
+from sqlalchemy import select, true, update
+
+from app import metrics
+from app.cache import CircuitOpen, get_redis, invalidate_caches
+from app.sharding import shards
+
+logger = logging.getLogger(__name__)
+
+SWEEP_LOCK_KEY = "expiry:sweep-lock"
+
+
+def sweep_expired(
+    batch_size: int = 500,
+    max_batches: int = 100,
+    now: datetime | None = None,
+    progress: Callable[[int], None] | None = None,
+) -> dict:
+    """
+    Deactivate links whose expires_at has passed.  Must run in an app context.
+
+    Returns ``{"links", "batches", "seconds", "per_second", "lag_seconds",
+    "complete"}``; ``complete`` is False when a shard still had due rows
+    after *max_batches*.  ``progress(links)`` is called after every batch.
+    """
+    from app import db
+    from app.models import Url
+
+    started = time.perf_counter()
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    urls = Url.__table__
+    # "= true" rather than "IS true" so the composite index is usable
+    due = select(urls.c.id, urls.c.short_code, urls.c.expires_at).where(
+        urls.c.is_active == true(), urls.c.expires_at <= now
+    ).order_by(urls.c.expires_at).limit(batch_size)
+
+    links = batches = 0
+    oldest: datetime | None = None
+    complete = True
+    for shard in shards.ids():
+        with shards.bound(shard):
+            for _ in range(max_batches):
+                rows = db.session.execute(due).all()
+                if not rows:
+                    break
+                # is_active again: a concurrent sweep may have got there first
+                db.session.execute(
+                    update(urls)
+                    .where(urls.c.id.in_([row.id for row in rows]), urls.c.is_active == true())
+                    .values(is_active=False, updated_at=now)
+                )
+                db.session.commit()
+                invalidate_caches([row.short_code for row in rows])
+                if oldest is None or rows[0].expires_at < oldest:
+                    oldest = rows[0].expires_at
+                links += len(rows)
+                batches += 1
+                if progress:
+                    progress(links)
+                if len(rows) < batch_size:
+                    break
+            else:
+                complete = False
+
+    seconds = time.perf_counter() - started
+    lag = (now - oldest).total_seconds() if oldest is not None else 0.0
+    metrics.LINKS_EXPIRED.inc(links)
+    metrics.EXPIRY_LAG.set(lag)
+    report = {
+        "links": links,
+        "batches": batches,
+        "seconds": round(seconds, 3),
+        "per_second": round(links / seconds, 1) if seconds > 0 else 0.0,
+        "lag_seconds": round(lag, 1),
+        "complete": complete,
+    }
+    logger.info(
+        "Expiry sweep: %d links in %d batches, %.2fs, lag %.0fs%s",
+        links, batches, seconds, lag, "" if complete else " (backlog left)",
+    )
+    return report
+
+
+class ExpirySweeper:
+    """Scheduled expiry sweeps for one worker."""
+
+    def __init__(self) -> None:
+        self._app = None
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+        self.interval = 60.0
+        self.last_sweep: dict | None = None
+        self.sweeps = 0
+
+    def init_app(self, app) -> None:
+        self._app = app
+        self.interval = app.config.get("EXPIRY_SWEEP_INTERVAL", self.interval)
+
+    def sweep(self, lock: bool = False, **overrides) -> dict | None:
+        """Run sweep_expired with config defaults.  With *lock*, only if no
+        other worker swept within the last interval (returns None then)."""
+        config = self._app.config
+        if lock:
+            try:
+                ttl = max(int(self.interval), 1)
+                if not get_redis().set(SWEEP_LOCK_KEY, os.getpid(), nx=True, ex=ttl):
+                    return None
+            except CircuitOpen:
+                return None
+            except redis.RedisError as exc:
+                logger.warning("Expiry sweep skipped: %s", exc)
+                return None
+        with self._app.app_context():
+            report = sweep_expired(
+                batch_size=overrides.get("batch_size", config["EXPIRY_SWEEP_BATCH"]),
+                max_batches=overrides.get("max_batches", config["EXPIRY_SWEEP_MAX_BATCHES"]),
+                progress=overrides.get("progress"),
+            )
+        report["finished_at"] = datetime.now(timezone.utc).isoformat()
+        self.last_sweep = report
+        self.sweeps += 1
+        return report
+
+    def start(self) -> None:
+        """Start this worker's scheduler thread (once per process)."""
+        if self._pid == os.getpid() or self._app is None or self.interval <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="expiry-sweeper", daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sweep(lock=True)
+            except Exception as exc:
+                logger.warning("Expiry sweep failed: %s", exc)
+
+    def stats(self) -> dict:
+        return {"interval": self.interval, "sweeps": self.sweeps, "last_sweep": self.last_sweep}
+
+
+expiry_sweeper = ExpirySweeper()
@@ -0,0 +1,119 @@
+"""
+Block-based ID allocation for ``urls``.
+
+Lets ``shorten_url`` compute the Base62 short code *before* the INSERT so
+each link is written once, instead of INSERT "tmp" → flush → UPDATE.
+
+Strategy:
+- A one-row-per-sequence table (``id_sequences``) holds the next free id
+- Each worker reserves a block of ID_BLOCK_SIZE ids with a single
+  ``UPDATE ... SET next_id = next_id + n`` in its own short transaction
+  (row lock → safe across workers and nodes), then hands ids out locally
+- The sequence is seeded from ``MAX(urls.id) + 1`` on first use
+- Ids of a block that a worker never uses are simply skipped (gaps are fine)
+- Every shard has its own ``id_sequences`` row, seeded inside the shard's
+  id range (app.encoder.shard_range), and the worker keeps one block per
+  shard
+"""
+
+import os
+import logging
+import threading
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.encoder import shard_range
+from app.sharding import shards
+
+logger = logging.getLogger(__name__)
+
+
+class IdAllocator:
+    """Hands out ids from blocks reserved in the ``id_sequences`` table."""
+
+    def __init__(self, name: str = "urls") -> None:
+        self.name = name
+        self.block_size = 100
+        self._blocks: dict[int, list[int]] = {}  # shard -> [next, end)
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+        self.blocks_reserved = 0
+
+    def init_app(self, app) -> None:
+        self.block_size = app.config.get("ID_BLOCK_SIZE", self.block_size)
+
+    def next_id(self, shard: int = 0) -> int:
+        """Return one unused id on *shard*."""
+        return self.reserve(1, shard)[0]
+
+    def reserve(self, count: int, shard: int = 0) -> list[int]:
+        """Return *count* unused ids on *shard* (not necessarily contiguous)."""
+        ids: list[int] = []
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked child must never reuse the parent's blocks.
+                self._pid = os.getpid()
+                self._blocks.clear()
+            block = self._blocks.setdefault(shard, [0, 0])
+            while len(ids) < count:
+                if block[0] >= block[1]:
+                    want = max(self.block_size, count - len(ids))
+                    block[:] = self._reserve_block(want, shard)
+                take = min(block[1] - block[0], count - len(ids))
+                ids.extend(range(block[0], block[0] + take))
+                block[0] += take
+        return ids
+
+    def _reserve_block(self, size: int, shard: int = 0) -> tuple[int, int]:
+        """Atomically claim ``size`` ids on *shard*.  Returns (start, end_exclusive)."""
+        from app.models import IdSequence
+
+        seq = IdSequence.__table__
+        for _ in range(3):
+            # Separate connection/transaction: never entangled with the
+            # caller's session, and the row lock is held only briefly.
+            with shards.engine(shard).begin() as conn:
+                updated = conn.execute(
+                    update(seq)
+                    .where(seq.c.name == self.name)
+                    .values(next_id=seq.c.next_id + size)
+                ).rowcount
+                if updated:
+                    end = conn.execute(
+                        select(seq.c.next_id).where(seq.c.name == self.name)
+                    ).scalar_one()
+                    if end > shard_range(shard)[1]:
+                        raise RuntimeError(f"Shard {shard} has run out of ids")
+                    self.blocks_reserved += 1
+                    logger.debug(
+                        "Reserved ids [%d, %d) for %s on shard %d", end - size, end, self.name, shard
+                    )
+                    return end - size, end
+            self.seed(shard)
+        raise RuntimeError(f"Could not reserve ids for sequence {self.name!r}")
+
+    def seed(self, shard: int = 0) -> None:
+        """Create the shard's sequence row from MAX(urls.id) + 1 (first use only)."""
+        from app.models import IdSequence, Url
+
+        try:
+            with shards.engine(shard).begin() as conn:
+                highest = conn.execute(select(func.max(Url.id))).scalar() or 0
+                start = max(highest + 1, shard_range(shard)[0], 1)
+                conn.execute(
+                    insert(IdSequence.__table__).values(name=self.name, next_id=start)
+                )
+                logger.info("Seeded id sequence %s on shard %d at %d", self.name, shard, start)
+        except IntegrityError:
+            pass  # another worker seeded it first
+
+    def stats(self) -> dict:
+        return {
+            "block_size": self.block_size,
+            "remaining_in_block": sum(max(0, end - nxt) for nxt, end in self._blocks.values()),
+            "blocks_reserved": self.blocks_reserved,
+        }
+
+
+id_allocator = IdAllocator()
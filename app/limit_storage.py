@@ -0,0 +1,294 @@
+"""
+Rate-limit storage that counts in worker memory and syncs with Redis in batches.
+
+Registered with ``limits`` under the ``local+redis://`` / ``local+rediss://``
+schemes, so flask-limiter picks it up from RATELIMIT_STORAGE_URI and every
+``@limiter.limit(...)`` decorator works unchanged.
+
+Strategy:
+- Each worker keeps a per-key counter: the global count it last saw in
+  Redis plus the hits it has admitted locally since (``pending``)
+- The first hit on a window, or ``max_pending`` local hits, pushes the key
+  to Redis inline (SET NX EX + INCRBY + PTTL in one MULTI); everything in
+  between is answered from memory
+- A background thread pushes every touched key every ``sync_interval``
+  seconds in a single pipeline and pulls back the global totals
+- Accuracy / latency knobs: a worker sees other workers' hits at most
+  ``sync_interval`` late and holds back at most ``max_pending - 1`` of its
+  own; ``max_pending=1`` makes every hit a Redis round trip (exact)
+- Pushes go through the cache's Redis circuit breaker; while it is open
+  each worker keeps limiting on its local counts alone
+- Strategies: ``fixed-window`` and ``sliding-window-counter`` are served
+  locally; ``moving-window`` (a true sliding log) goes to Redis on every hit
+"""
+
+import os
+import time
+import logging
+import threading
+from math import floor
+
+import redis
+from limits.storage import RedisStorage, Storage
+from limits.storage.base import (
+    MovingWindowSupport,
+    SlidingWindowCounterSupport,
+    TimestampedSlidingWindow,
+)
+
+from app.cache import CircuitOpen, guarded
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "LIMITS-LOCAL:"
+
+
+class _Counter:
+    __slots__ = ("expiry", "synced", "pending", "expires_at", "touched")
+
+    def __init__(self, expiry: int) -> None:
+        self.expiry = expiry
+        self.synced = 0          # global count as of the last push
+        self.pending = 0         # hits admitted here since then
+        self.expires_at = 0.0    # window end (epoch seconds); 0 = unknown
+        self.touched = False     # hit or read since the last background sync
+
+
+class LocalBatchedStorage(
+    Storage, SlidingWindowCounterSupport, MovingWindowSupport, TimestampedSlidingWindow
+):
+    STORAGE_SCHEME = ["local+redis", "local+rediss"]
+
+    def __init__(
+        self,
+        uri: str,
+        wrap_exceptions: bool = False,
+        sync_interval: float = Config.RATELIMIT_SYNC_INTERVAL,
+        max_pending: int = Config.RATELIMIT_MAX_PENDING,
+        **options,
+    ) -> None:
+        super().__init__(uri, wrap_exceptions=wrap_exceptions)
+        # The exact store serves moving-window and owns the redis client.
+        self.exact = RedisStorage(uri.split("+", 1)[1], wrap_exceptions=wrap_exceptions, **options)
+        self.redis = self.exact.storage
+        self.sync_interval = sync_interval
+        self.max_pending = max(1, max_pending)
+        self._counters: dict[str, _Counter] = {}
+        self._lock = threading.Lock()
+        self._syncer_pid: int | None = None
+        self._stats = {"inline_pushes": 0, "batch_syncs": 0, "sync_errors": 0}
+
+    @property
+    def base_exceptions(self):
+        return redis.RedisError
+
+    # ------------------------------------------------------------------
+    # Redis round trips
+    # ------------------------------------------------------------------
+
+    def _push(self, batch: list[tuple[str, int, int]]) -> list[tuple[int, int]]:
+        """Apply ``(key, expiry, delta)`` items; returns ``(count, pttl_ms)`` each."""
+        pipe = self.redis.pipeline(transaction=True)
+        for key, expiry, delta in batch:
+            pipe.set(KEY_PREFIX + key, 0, ex=expiry, nx=True)
+            pipe.incrby(KEY_PREFIX + key, delta)
+            pipe.pttl(KEY_PREFIX + key)
+        results = pipe.execute()
+        return [(results[i + 1], results[i + 2]) for i in range(0, len(results), 3)]
+
+    def _apply(self, counter: _Counter, count: int, pttl: int, now: float) -> None:
+        counter.synced = count
+        counter.expires_at = now + max(pttl, 0) / 1000
+
+    def _push_inline(self, key: str, expiry: int, counter: _Counter) -> int:
+        with self._lock:
+            delta, counter.pending = counter.pending, 0
+        try:
+            [(count, pttl)] = guarded(self._push, [(key, expiry, delta)])
+        except CircuitOpen:
+            # Redis is being skipped: keep counting locally for this window.
+            with self._lock:
+                counter.pending += delta
+                if not counter.expires_at:
+                    counter.expires_at = time.time() + expiry
+                return counter.synced + counter.pending
+        except redis.RedisError:
+            with self._lock:
+                counter.pending += delta
+            raise
+        with self._lock:
+            self._apply(counter, count, pttl, time.time())
+            self._stats["inline_pushes"] += 1
+            return counter.synced + counter.pending
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "keys": len(self._counters),
+                "sync_interval": self.sync_interval,
+                "max_pending": self.max_pending,
+                **self._stats,
+            }
+
+    # ------------------------------------------------------------------
+    # Background sync
+    # ------------------------------------------------------------------
+
+    def _ensure_syncer(self) -> None:
+        if self._syncer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._syncer_pid == os.getpid():
+                return
+            self._syncer_pid = os.getpid()
+            threading.Thread(target=self._sync_loop, name="ratelimit-sync", daemon=True).start()
+
+    def _sync_loop(self) -> None:
+        while True:
+            time.sleep(self.sync_interval)
+            try:
+                self.sync()
+            except CircuitOpen:
+                pass
+            except redis.RedisError as exc:
+                self._stats["sync_errors"] += 1
+                logger.warning("Rate-limit sync failed: %s", exc)
+
+    def sync(self) -> int:
+        """Push pending hits of every touched key and refresh global counts."""
+        now = time.time()
+        with self._lock:
+            for key in [k for k, c in self._counters.items() if c.expires_at <= now and not c.pending]:
+                del self._counters[key]
+            batch, counters = [], []
+            for key, counter in self._counters.items():
+                if counter.touched or counter.pending:
+                    batch.append((key, counter.expiry, counter.pending))
+                    counters.append(counter)
+                    counter.pending = 0
+                    counter.touched = False
+        if not batch:
+            return 0
+        try:
+            results = guarded(self._push, batch)
+        except redis.RedisError:
+            with self._lock:
+                for (_, _, delta), counter in zip(batch, counters):
+                    counter.pending += delta
+            raise
+        now = time.time()
+        with self._lock:
+            for counter, (count, pttl) in zip(counters, results):
+                self._apply(counter, count, pttl, now)
+            self._stats["batch_syncs"] += 1
+        return len(batch)
+
+    # ------------------------------------------------------------------
+    # Fixed window
+    # ------------------------------------------------------------------
+
+    def _fresh(self, key: str, now: float) -> _Counter | None:
+        counter = self._counters.get(key)
+        if counter is None or counter.expires_at <= now:
+            return None
+        return counter
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        self._ensure_syncer()
+        with self._lock:
+            counter = self._fresh(key, time.time())
+            if counter is not None:
+                counter.pending += amount
+                counter.touched = True
+                if counter.pending < self.max_pending:
+                    return counter.synced + counter.pending
+            else:
+                # New (or rolled-over) window: learn the global count inline.
+                counter = self._counters[key] = _Counter(expiry)
+                counter.pending = amount
+        return self._push_inline(key, expiry, counter)
+
+    def _count(self, key: str, expiry: int) -> int:
+        with self._lock:
+            counter = self._fresh(key, time.time())
+            if counter is not None:
+                counter.touched = True
+                return counter.synced + counter.pending
+            counter = self._counters[key] = _Counter(expiry)
+        return self._push_inline(key, expiry, counter)
+
+    def get(self, key: str) -> int:
+        with self._lock:
+            counter = self._fresh(key, time.time())
+            if counter is not None:
+                return counter.synced + counter.pending
+        return int(self.redis.get(KEY_PREFIX + key) or 0)
+
+    def get_expiry(self, key: str) -> float:
+        with self._lock:
+            counter = self._fresh(key, time.time())
+            if counter is not None:
+                return counter.expires_at
+        return time.time() + max(self.redis.pttl(KEY_PREFIX + key), 0) / 1000
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            self._counters.pop(key, None)
+        self.redis.delete(KEY_PREFIX + key)
+        self.exact.clear(key)
+
+    def reset(self) -> int | None:
+        with self._lock:
+            self._counters.clear()
+        keys = list(self.redis.scan_iter(match=KEY_PREFIX + "*", count=1000))
+        if keys:
+            self.redis.delete(*keys)
+        return len(keys) + (self.exact.reset() or 0)
+
+    def check(self) -> bool:
+        return self.exact.check()
+
+    # ------------------------------------------------------------------
+    # Sliding window counter (weighted previous + current fixed windows)
+    # ------------------------------------------------------------------
+
+    def _sliding_window(self, key: str, expiry: int, now: float):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous_count = self._count(previous_key, 2 * expiry)
+        current_count = self._count(current_key, 2 * expiry)
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return current_key, (previous_count, previous_ttl, current_count, current_ttl)
+
+    def get_sliding_window(self, key: str, expiry: int) -> tuple[int, float, int, float]:
+        self._ensure_syncer()
+        return self._sliding_window(key, expiry, time.time())[1]
+
+    def acquire_sliding_window_entry(
+        self, key: str, limit: int, expiry: int, amount: int = 1
+    ) -> bool:
+        if amount > limit:
+            return False
+        self._ensure_syncer()
+        current_key, (previous_count, previous_ttl, current_count, _) = self._sliding_window(
+            key, expiry, time.time()
+        )
+        if floor(previous_count * previous_ttl / expiry + current_count) + amount > limit:
+            return False
+        self.incr(current_key, 2 * expiry, amount)
+        return True
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        for window_key in self.sliding_window_keys(key, expiry, time.time()):
+            self.clear(window_key)
+
+    # ------------------------------------------------------------------
+    # Moving window (exact sliding log, always in Redis)
+    # ------------------------------------------------------------------
+
+    def acquire_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        return self.exact.acquire_entry(key, limit, expiry, amount)
+
+    def get_moving_window(self, key: str, limit: int, expiry: int) -> tuple[float, int]:
+        return self.exact.get_moving_window(key, limit, expiry)
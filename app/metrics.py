@@ -0,0 +1,180 @@
+"""
+Prometheus metrics for the request hot paths.
+
+Strategy:
+- Counters and fixed-bucket histograms (prometheus_client) for cache
+  lookups per tier, Redis and DB call latency, end-to-end redirect latency
+  and rate-limit rejections
+- Under gunicorn every worker writes its samples to mmap'ed files in
+  PROMETHEUS_MULTIPROC_DIR (set up by gunicorn.conf.py); ``GET /metrics``
+  merges all of them, so one scrape covers every worker on the node
+- Without that variable (``python run.py``, the benchmark) the in-process
+  registry is served as-is
+- DB latency comes from SQLAlchemy cursor events, labelled with the
+  Flask-SQLAlchemy bind (shard / replica) that ran the statement and also
+  totalled per bind in-process for /api/stats; Redis latency comes from
+  the cache call sites, rejections from a 429 error handler
+- The expiry sweeper (app/expiry.py) counts the links it deactivates and
+  sets its lag gauge after every run
+- Per-request log lines are DEBUG and sampled (LOG_SAMPLE_RATE)
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+
+from flask import Response, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import Config
+
+# Sub-millisecond resolution for Redis / L1, up to a second for slow queries.
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+CACHE_LOOKUPS = Counter(
+    "shortener_cache_lookups_total",
+    "Short-code cache lookups by tier and result",
+    ["tier", "result"],
+)
+REDIS_SECONDS = Histogram(
+    "shortener_redis_command_seconds",
+    "Latency of Redis calls made by the cache layer",
+    ["command"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_SECONDS = Histogram(
+    "shortener_db_query_seconds",
+    "Latency of SQL statements by bind and statement type",
+    ["bind", "statement"],
+    buckets=LATENCY_BUCKETS,
+)
+REDIRECT_SECONDS = Histogram(
+    "shortener_redirect_seconds",
+    "End-to-end GET /<code> latency by outcome",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+RATE_LIMITED = Counter(
+    "shortener_rate_limited_total",
+    "Requests rejected by the rate limiter",
+    ["endpoint"],
+)
+LINKS_EXPIRED = Counter(
+    "shortener_links_expired_total",
+    "Links deactivated by the expiry sweeper",
+)
+EXPIRY_LAG = Gauge(
+    "shortener_expiry_sweep_lag_seconds",
+    "How long the oldest link deactivated by the last sweep had been expired",
+    multiprocess_mode="livemax",
+)
+
+_STATEMENT_TYPES = {"select", "insert", "update", "delete"}
+_sample_rate = Config.LOG_SAMPLE_RATE
+
+# Engine → bind name ("shard0" for the default database), filled by init_app
+_bind_names: dict[Engine, str] = {}
+# bind → [queries, total seconds, max seconds] for this worker
+_bind_totals: dict[str, list] = {}
+_totals_lock = threading.Lock()
+
+
+def observe_redirect(outcome: str, start: float) -> None:
+    """Record a redirect that began at ``time.perf_counter()`` == *start*."""
+    REDIRECT_SECONDS.labels(outcome).observe(time.perf_counter() - start)
+
+
+def log_sampled(logger: logging.Logger, msg: str, *args) -> None:
+    """DEBUG-log roughly LOG_SAMPLE_RATE of calls; free when DEBUG is off."""
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < _sample_rate:
+        logger.debug(msg, *args)
+
+
+# ---------------------------------------------------------------------------
+# DB timing (every engine, including the async server's sync_engine)
+# ---------------------------------------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    verb = statement.lstrip()[:6].lower()
+    bind = _bind_names.get(conn.engine, "other")
+    DB_SECONDS.labels(bind, verb if verb in _STATEMENT_TYPES else "other").observe(elapsed)
+    with _totals_lock:
+        totals = _bind_totals.setdefault(bind, [0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += elapsed
+        totals[2] = max(totals[2], elapsed)
+
+
+def instrument_engines() -> None:
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def db_stats() -> dict:
+    """Per-bind query count and latency in this worker."""
+    with _totals_lock:
+        items = sorted(_bind_totals.items())
+    return {
+        bind: {
+            "queries": count,
+            "avg_ms": round(total / count * 1000, 3),
+            "max_ms": round(peak * 1000, 3),
+        }
+        for bind, (count, total, peak) in items
+    }
+
+
+# ---------------------------------------------------------------------------
+# Exposition
+# ---------------------------------------------------------------------------
+
+def render() -> bytes:
+    """Prometheus text format, merged across workers when multiprocess."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def metrics_view():
+    return Response(render(), content_type=CONTENT_TYPE_LATEST)
+
+
+def _count_rate_limited(exc):
+    RATE_LIMITED.labels(request.endpoint or "unknown").inc()
+    return exc.get_response()
+
+
+def init_app(app) -> None:
+    """Expose ``GET /metrics`` and start counting DB calls and 429s."""
+    from app import db
+    from app.rate_limiter import limiter
+
+    with app.app_context():
+        for key, engine in db.engines.items():
+            _bind_names[engine] = key or "shard0"
+    instrument_engines()
+    app.add_url_rule("/metrics", "metrics", limiter.exempt(metrics_view))
+    app.register_error_handler(429, _count_rate_limited)
@@ -0,0 +1,258 @@
+"""
+Versioned schema migrations, applied once per release instead of per worker.
+
+Strategy:
+- Each migration is a numbered Python step registered with ``@migration``;
+  applied versions are recorded in ``schema_migrations``
+- ``flask --app run db upgrade`` (run by build.sh, i.e. once per deploy)
+  applies whatever is pending in order and commits after every step, so a
+  failed release can simply be re-run
+- Steps inspect before they change anything: a fresh database (whose base
+  tables come from the current models) and one created by an older
+  init_db.sql / setup_db.py or ``db.create_all()`` converge on the same
+  schema.  Both of those now only create the database and defer to here
+- Version numbers are owned by this module.  The numbered files in
+  migrations/ are legacy manual scripts (002-004 match steps 2-4) and
+  one-offs; 005_partition_click_logs_* is not step 5
+- Concurrent runners are serialised with an advisory lock (PostgreSQL
+  ``pg_advisory_lock`` / MySQL ``GET_LOCK``)
+- Workers never create or reflect tables on boot; a new index or column is
+  a new step here (plus the model change)
+- Dialect-specific one-offs such as click_logs partitioning stay in
+  migrations/*.sql
+"""
+
+import time
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, NamedTuple
+
+from sqlalchemy import (
+    Column, DateTime, Integer, MetaData, String, Table, inspect, select, text,
+)
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = "url_shortener_migrate"
+LOCK_ID = 0x75726C73  # pg_advisory_lock key ("urls")
+LOCK_TIMEOUT = 60     # seconds (MySQL GET_LOCK)
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[Connection], None]
+
+
+MIGRATIONS: list[Migration] = []
+
+
+def migration(version: int, name: str):
+    """Register ``fn(conn)`` as schema step *version*."""
+    def register(fn):
+        if any(m.version == version for m in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append(Migration(version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return fn
+    return register
+
+
+# ---------------------------------------------------------------------------
+# Helpers for idempotent steps
+# ---------------------------------------------------------------------------
+
+def _has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
+
+
+def _has_index(conn: Connection, table: str, columns: list[str]) -> bool:
+    """True if any index (or unique constraint) on *table* covers exactly *columns*."""
+    inspector = inspect(conn)
+    existing = [i["column_names"] for i in inspector.get_indexes(table)]
+    existing += [u["column_names"] for u in inspector.get_unique_constraints(table)]
+    return list(columns) in [list(cols) for cols in existing]
+
+
+def _add_column(conn: Connection, model, name: str) -> None:
+    """ALTER TABLE ... ADD COLUMN for the model's column *name*, unless present."""
+    table = model.__tablename__
+    if _has_column(conn, table, name):
+        return
+    column = model.__table__.c[name]
+    ddl = f"ALTER TABLE {table} ADD COLUMN {name} {column.type.compile(dialect=conn.dialect)}"
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    ddl += " NULL" if column.nullable else " NOT NULL"
+    conn.execute(text(ddl))
+
+
+def _create_tables(conn: Connection, *models) -> None:
+    for model in models:
+        model.__table__.create(conn, checkfirst=True)
+
+
+def _create_index(conn: Connection, model, name: str) -> None:
+    """Create the model's index *name* unless its columns are indexed already."""
+    [index] = [i for i in model.__table__.indexes if i.name == name]
+    if not _has_index(conn, model.__tablename__, [c.name for c in index.columns]):
+        index.create(conn)
+
+
+# ---------------------------------------------------------------------------
+# Steps
+# ---------------------------------------------------------------------------
+
+@migration(1, "base tables")
+def _base_tables(conn: Connection) -> None:
+    from app.models import ClickLog, IdSequence, Url
+
+    _create_tables(conn, Url, ClickLog, IdSequence)
+
+
+@migration(2, "urls.url_hash")
+def _url_hash(conn: Connection) -> None:
+    from app.models import Url
+
+    if not _has_column(conn, "urls", "url_hash"):
+        conn.execute(text("ALTER TABLE urls ADD COLUMN url_hash VARCHAR(64) NULL"))
+    _create_index(conn, Url, "ix_urls_url_hash")
+
+
+@migration(3, "click rollup tables")
+def _click_rollups(conn: Connection) -> None:
+    from app.models import ClickRollupDaily, ClickRollupHourly
+
+    _create_tables(conn, ClickRollupHourly, ClickRollupDaily)
+
+
+@migration(4, "click_logs keyset index")
+def _click_keyset_index(conn: Connection) -> None:
+    from app.models import ClickLog
+
+    _create_index(conn, ClickLog, "idx_url_clicked")
+
+
+@migration(5, "urls.redirect_type, urls.updated_at")
+def _http_caching(conn: Connection) -> None:
+    from app.models import Url
+
+    _add_column(conn, Url, "redirect_type")
+    _add_column(conn, Url, "updated_at")
+
+
+@migration(6, "urls expiry index")
+def _expiry_index(conn: Connection) -> None:
+    from app.models import Url
+
+    _create_index(conn, Url, "ix_urls_active_expires")
+
+
+@migration(7, "counter_batches table")
+def _counter_batches(conn: Connection) -> None:
+    from app.models import CounterBatch
+
+    _create_tables(conn, CounterBatch)
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+@contextmanager
+def _migration_lock(conn: Connection):
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": LOCK_ID})
+        conn.commit()
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_ID})
+            conn.commit()
+    elif dialect in ("mysql", "mariadb"):
+        got = conn.execute(
+            text("SELECT GET_LOCK(:name, :timeout)"),
+            {"name": LOCK_NAME, "timeout": LOCK_TIMEOUT},
+        ).scalar()
+        conn.commit()
+        if got != 1:
+            raise RuntimeError("Another migration run holds the lock")
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": LOCK_NAME})
+            conn.commit()
+    else:
+        yield
+
+
+def _applied(conn: Connection) -> dict[int, datetime]:
+    schema_migrations.create(conn, checkfirst=True)
+    rows = conn.execute(select(schema_migrations.c.version, schema_migrations.c.applied_at))
+    return {version: applied_at for version, applied_at in rows}
+
+
+def _engine(engine: Engine | None) -> Engine:
+    if engine is not None:
+        return engine
+    from app import db
+    return db.engine
+
+
+def status(engine: Engine | None = None) -> list[dict]:
+    """Every known migration with its ``applied_at`` (None if pending)."""
+    with _engine(engine).connect() as conn:
+        applied = _applied(conn)
+        conn.commit()
+    return [
+        {"version": m.version, "name": m.name, "applied_at": applied.get(m.version)}
+        for m in MIGRATIONS
+    ]
+
+
+def upgrade(
+    engine: Engine | None = None,
+    target: int | None = None,
+    progress: Callable[[Migration, float], None] | None = None,
+) -> list[Migration]:
+    """
+    Apply pending migrations up to *target* (default: all), in order.
+
+    Each step commits together with its ``schema_migrations`` row (MySQL
+    DDL commits implicitly, which is why steps are idempotent).
+    ``progress(migration, seconds)`` is called after each one.
+    """
+    done: list[Migration] = []
+    with _engine(engine).connect() as conn:
+        with _migration_lock(conn):
+            applied = _applied(conn)
+            conn.commit()
+            for step in MIGRATIONS:
+                if step.version in applied or (target is not None and step.version > target):
+                    continue
+                started = time.perf_counter()
+                step.apply(conn)
+                conn.execute(schema_migrations.insert().values(
+                    version=step.version,
+                    name=step.name,
+                    applied_at=datetime.now(timezone.utc).replace(tzinfo=None),
+                ))
+                conn.commit()
+                elapsed = time.perf_counter() - started
+                logger.info("Applied migration %04d %s (%.2fs)", step.version, step.name, elapsed)
+                done.append(step)
+                if progress:
+                    progress(step, elapsed)
+    return done
@@ -5,29 +5,65 @@ SQLAlchemy ORM models for the URL Shortener.
 from datetime import datetime, timezone
 from app import db
 
+# BIGINT primary keys only auto-increment as INTEGER on SQLite (benchmarks / dev)
+BigIntPK = db.BigInteger().with_variant(db.Integer, "sqlite")
+
 
 class Url(db.Model):
     """Shortened URL record."""
 
     __tablename__ = "urls"
+    __table_args__ = (
+        # Due rows for the expiry sweeper (app/expiry.py), oldest first
+        db.Index("ix_urls_active_expires", "is_active", "expires_at"),
+    )
 
-    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    id = db.Column(BigIntPK, primary_key=True, autoincrement=True)
     short_code = db.Column(db.String(10), unique=True, nullable=False, index=True)
     original_url = db.Column(db.Text, nullable=False)
+    # SHA-256 of the normalized original_url (see validators.url_hash)
+    url_hash = db.Column(db.String(64), nullable=True, index=True)
     created_at = db.Column(
         db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc)
     )
     expires_at = db.Column(db.DateTime, nullable=True)
     is_active = db.Column(db.Boolean, nullable=False, default=True)
     click_count = db.Column(db.BigInteger, nullable=False, default=0)
+    # 302 (default) / 307: never cached, every visit is counted.  301 / 308: cached
+    # by browsers / CDNs (see cache.CachedUrl.cache_control), repeat visits
+    # never reach us and are not counted.
+    redirect_type = db.Column(db.SmallInteger, nullable=False, default=302, server_default="302")
+    # Last change to the row (click_count write-back included); NULL on
+    # rows from before it existed.  Backs Last-Modified on the API.
+    updated_at = db.Column(
+        db.DateTime, nullable=True,
+        default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc),
+    )
 
     # Relationship
     click_logs = db.relationship(
         "ClickLog", backref="url", lazy="dynamic", cascade="all, delete-orphan"
     )
 
-    def to_dict(self, base_url: str = "") -> dict:
-        """Serialize to JSON-friendly dict."""
+    def is_expired(self, now: datetime | None = None) -> bool:
+        """True if expires_at has passed (naive DB values are UTC)."""
+        if self.expires_at is None:
+            return False
+        expires_at = self.expires_at
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        return expires_at <= (now or datetime.now(timezone.utc))
+
+    def to_dict(self, base_url: str = "", pending_clicks: int | None = None) -> dict:
+        """
+        Serialize to JSON-friendly dict.
+
+        ``click_count`` includes clicks still pending in Redis; pass
+        *pending_clicks* to skip the lookup when it is already known.
+        """
+        if pending_clicks is None:
+            from app.counters import get_pending
+            pending_clicks = get_pending(self.id) if self.id is not None else 0
         return {
             "id": self.id,
             "short_code": self.short_code,
@@ -36,7 +72,10 @@ class Url(db.Model):
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "expires_at": self.expires_at.isoformat() if self.expires_at else None,
             "is_active": self.is_active,
-            "click_count": self.click_count,
+            "click_count": (self.click_count or 0) + pending_clicks,
+            "redirect_type": self.redirect_type,
+            # Cacheable redirects only reach us (and are counted) once per client
+            "click_counting": "every_visit" if self.redirect_type in (302, 307) else "first_visit_per_client",
         }
 
 
@@ -44,8 +83,12 @@ class ClickLog(db.Model):
     """Individual click / visit record for analytics."""
 
     __tablename__ = "click_logs"
+    __table_args__ = (
+        # Backs keyset pagination of a URL's clicks on (clicked_at, id)
+        db.Index("idx_url_clicked", "url_id", "clicked_at", "id"),
+    )
 
-    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    id = db.Column(BigIntPK, primary_key=True, autoincrement=True)
     url_id = db.Column(
         db.BigInteger, db.ForeignKey("urls.id", ondelete="CASCADE"), nullable=False
     )
@@ -64,3 +107,41 @@ class ClickLog(db.Model):
             "referer": self.referer,
             "clicked_at": self.clicked_at.isoformat() if self.clicked_at else None,
         }
+
+
+class IdSequence(db.Model):
+    """Next free id per sequence; reserved in blocks by app.id_allocator."""
+
+    __tablename__ = "id_sequences"
+
+    name = db.Column(db.String(32), primary_key=True)
+    next_id = db.Column(db.BigInteger, nullable=False)
+
+
+class CounterBatch(db.Model):
+    """Click-counter batches already folded into urls.click_count (app.counters)."""
+
+    __tablename__ = "counter_batches"
+
+    batch_id = db.Column(db.String(32), primary_key=True)
+    applied_at = db.Column(db.DateTime, nullable=False)
+
+
+class ClickRollupHourly(db.Model):
+    """Clicks per URL per hour (bucket = hour start, UTC)."""
+
+    __tablename__ = "click_rollups_hourly"
+
+    url_id = db.Column(db.BigInteger, primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    clicks = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class ClickRollupDaily(db.Model):
+    """Clicks per URL per day (UTC)."""
+
+    __tablename__ = "click_rollups_daily"
+
+    url_id = db.Column(db.BigInteger, primary_key=True)
+    bucket = db.Column(db.Date, primary_key=True)
+    clicks = db.Column(db.BigInteger, nullable=False, default=0)
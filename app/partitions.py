@@ -0,0 +1,285 @@
+"""
+Monthly partitions for click_logs, with retention and a cold archive.
+
+Requires click_logs to be partitioned by RANGE on clicked_at (see
+migrations/005_partition_click_logs_*.sql).  Supported on MySQL and
+PostgreSQL.
+
+Strategy:
+- ``ensure_partitions`` creates the next N monthly partitions ahead of time
+  (MySQL: split p_future; Postgres: CREATE TABLE ... PARTITION OF).  It
+  runs on every deploy (build.sh); until it does, clicks past the last
+  month land in p_future / click_logs_default instead of failing, and the
+  next run moves them into their month
+- ``apply_retention`` takes every partition that ends before the retention
+  cut-off, streams its rows into a gzip NDJSON segment under
+  CLICK_ARCHIVE_DIR, then drops / detaches it — a metadata operation
+  instead of a huge DELETE
+- Segments are append-only (gzip members are concatenated) and can still
+  be read with ``iter_archived_clicks`` for historical analytics
+- Functions act on the shard bound by the caller; shards other than 0
+  archive into ``<CLICK_ARCHIVE_DIR>/shard<n>`` (``shard_archive_dir``)
+"""
+
+import os
+import gzip
+import json
+import logging
+from datetime import date, datetime
+from typing import Iterator, NamedTuple
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "click_logs-"
+SEGMENT_SUFFIX = ".ndjson.gz"
+
+
+class Partition(NamedTuple):
+    name: str
+    upper: date | None  # exclusive upper bound; None = MAXVALUE
+
+
+def month_start(d: date, offset: int = 0) -> date:
+    """First day of the month *offset* months after *d*'s month."""
+    months = d.year * 12 + d.month - 1 + offset
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def _dialect() -> str:
+    from app import db
+
+    name = db.session.get_bind().dialect.name
+    if name not in ("mysql", "postgresql"):
+        raise RuntimeError(f"click_logs partitioning is not supported on {name}")
+    return name
+
+
+def _parse_bound(value: str) -> date | None:
+    value = value.strip().strip("'")
+    if "MAXVALUE" in value.upper():
+        return None
+    return datetime.fromisoformat(value[:10]).date()
+
+
+# ---------------------------------------------------------------------------
+# Introspection
+# ---------------------------------------------------------------------------
+
+def list_partitions() -> list[Partition]:
+    """Partitions of click_logs ordered by upper bound (MAXVALUE last)."""
+    from app import db
+
+    if _dialect() == "mysql":
+        rows = db.session.execute(text(
+            "SELECT PARTITION_NAME, PARTITION_DESCRIPTION "
+            "FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'click_logs' "
+            "AND PARTITION_NAME IS NOT NULL"
+        )).all()
+        parts = [Partition(name, _parse_bound(desc)) for name, desc in rows]
+    else:
+        rows = db.session.execute(text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'click_logs'::regclass"
+        )).all()
+        parts = []
+        for name, bound in rows:
+            # e.g. "FOR VALUES FROM ('2026-10-01 00:00:00') TO ('2026-11-01 00:00:00')"
+            upper = bound.rsplit("TO (", 1)[-1].rstrip(")") if "TO (" in bound else "MAXVALUE"
+            parts.append(Partition(name, _parse_bound(upper)))
+
+    return sorted(parts, key=lambda p: (p.upper is None, p.upper or date.max))
+
+
+# ---------------------------------------------------------------------------
+# Creation
+# ---------------------------------------------------------------------------
+
+def is_partitioned() -> bool:
+    """True if click_logs is partitioned on the bound shard."""
+    from app import db
+
+    if db.session.get_bind().dialect.name not in ("mysql", "postgresql"):
+        return False
+    return bool(list_partitions())
+
+
+def _pg_default_partition() -> str | None:
+    from app import db
+
+    return db.session.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'click_logs'::regclass "
+        "AND pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT'"
+    )).scalar()
+
+
+def _create_pg_partition(name: str, lower: date, upper: date, default: str | None) -> None:
+    """CREATE ... PARTITION OF.  Rows of that month already in the default
+    partition are moved over while it is detached (same transaction)."""
+    from app import db
+
+    bounds = f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+    in_range = "clicked_at >= :lower AND clicked_at < :upper"
+    params = {"lower": lower, "upper": upper}
+    stranded = default is not None and db.session.execute(
+        text(f"SELECT 1 FROM {default} WHERE {in_range} LIMIT 1"), params
+    ).first() is not None
+    if not stranded:
+        db.session.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF click_logs {bounds}"))
+        return
+    db.session.execute(text(f"ALTER TABLE click_logs DETACH PARTITION {default}"))
+    db.session.execute(text(f"CREATE TABLE {name} PARTITION OF click_logs {bounds}"))
+    db.session.execute(text(f"INSERT INTO {name} SELECT * FROM {default} WHERE {in_range}"), params)
+    db.session.execute(text(f"DELETE FROM {default} WHERE {in_range}"), params)
+    db.session.execute(text(f"ALTER TABLE click_logs ATTACH PARTITION {default} DEFAULT"))
+    logger.info("Moved rows for %s out of %s", name, default)
+
+
+def ensure_partitions(months_ahead: int = 3, today: date | None = None) -> list[str]:
+    """Create monthly partitions up to *months_ahead* months out."""
+    from app import db
+
+    dialect = _dialect()
+    today = today or date.today()
+    existing = list_partitions()
+    default = _pg_default_partition() if dialect == "postgresql" else None
+    bounded = [p.upper for p in existing if p.upper is not None]
+    last_upper = max(bounded) if bounded else month_start(today)
+
+    created = []
+    target = month_start(today, months_ahead + 1)
+    lower = last_upper
+    while lower < target:
+        upper = month_start(lower, 1)
+        name = f"p{lower:%Y%m}" if dialect == "mysql" else f"click_logs_p{lower:%Y%m}"
+        if dialect == "mysql":
+            db.session.execute(text(
+                f"ALTER TABLE click_logs REORGANIZE PARTITION p_future INTO ("
+                f"PARTITION {name} VALUES LESS THAN ('{upper.isoformat()}'), "
+                f"PARTITION p_future VALUES LESS THAN (MAXVALUE))"
+            ))
+        else:
+            _create_pg_partition(name, lower, upper, default)
+        created.append(name)
+        lower = upper
+
+    db.session.commit()
+    if created:
+        logger.info("Created click_logs partitions: %s", ", ".join(created))
+    return created
+
+
+# ---------------------------------------------------------------------------
+# Retention / archive
+# ---------------------------------------------------------------------------
+
+def shard_archive_dir(archive_dir: str, shard: int) -> str:
+    """Archive directory of *shard* (shard 0 keeps the top level)."""
+    return archive_dir if shard == 0 else os.path.join(archive_dir, f"shard{shard}")
+
+
+def _segment_path(archive_dir: str, partition: Partition) -> str:
+    return os.path.join(archive_dir, f"{SEGMENT_PREFIX}{partition.name}{SEGMENT_SUFFIX}")
+
+
+def _archive_partition(partition: Partition, archive_dir: str, chunk_size: int) -> int:
+    """Append every row of *partition* to its segment file.  Returns rows."""
+    from app import db
+
+    source = (
+        f"click_logs PARTITION ({partition.name})" if _dialect() == "mysql" else partition.name
+    )
+    os.makedirs(archive_dir, exist_ok=True)
+    path = _segment_path(archive_dir, partition)
+    rows_written = 0
+    last_id = 0
+    with gzip.open(path, "at", encoding="utf-8") as segment:
+        while True:
+            rows = db.session.execute(text(
+                f"SELECT id, url_id, ip_address, user_agent, referer, clicked_at "
+                f"FROM {source} WHERE id > :last_id ORDER BY id LIMIT :limit"
+            ), {"last_id": last_id, "limit": chunk_size}).all()
+            if not rows:
+                break
+            for row in rows:
+                segment.write(json.dumps({
+                    "id": row.id,
+                    "url_id": row.url_id,
+                    "ip_address": row.ip_address,
+                    "user_agent": row.user_agent,
+                    "referer": row.referer,
+                    "clicked_at": row.clicked_at.isoformat(),
+                }) + "\n")
+            rows_written += len(rows)
+            last_id = rows[-1].id
+        segment.flush()
+        os.fsync(segment.fileno())
+    return rows_written
+
+
+def apply_retention(
+    retention_months: int,
+    archive_dir: str,
+    today: date | None = None,
+    chunk_size: int = 10_000,
+) -> list[dict]:
+    """
+    Archive and drop every partition that ends before the retention cut-off.
+
+    A partition is only dropped after its segment has been written and
+    fsync'ed.  Returns one ``{"partition", "rows", "segment"}`` per drop.
+    """
+    from app import db
+
+    if retention_months <= 0:
+        return []
+    dialect = _dialect()
+    cutoff = month_start(today or date.today(), -retention_months)
+
+    dropped = []
+    for partition in list_partitions():
+        if partition.upper is None or partition.upper > cutoff:
+            continue
+        rows = _archive_partition(partition, archive_dir, chunk_size)
+        if dialect == "mysql":
+            db.session.execute(text(f"ALTER TABLE click_logs DROP PARTITION {partition.name}"))
+        else:
+            db.session.execute(text(f"ALTER TABLE click_logs DETACH PARTITION {partition.name}"))
+            db.session.execute(text(f"DROP TABLE {partition.name}"))
+        db.session.commit()
+        logger.info("Archived and dropped %s (%d rows)", partition.name, rows)
+        dropped.append({
+            "partition": partition.name,
+            "rows": rows,
+            "segment": _segment_path(archive_dir, partition),
+        })
+    return dropped
+
+
+def iter_archived_clicks(
+    archive_dir: str,
+    url_id: int | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> Iterator[dict]:
+    """Stream archived click rows (constant memory), optionally filtered."""
+    if not os.path.isdir(archive_dir):
+        return
+    for filename in sorted(os.listdir(archive_dir)):
+        if not (filename.startswith(SEGMENT_PREFIX) and filename.endswith(SEGMENT_SUFFIX)):
+            continue
+        with gzip.open(os.path.join(archive_dir, filename), "rt", encoding="utf-8") as segment:
+            for line in segment:
+                row = json.loads(line)
+                if url_id is not None and row["url_id"] != url_id:
+                    continue
+                clicked_at = datetime.fromisoformat(row["clicked_at"])
+                if (since and clicked_at < since) or (until and clicked_at > until):
+                    continue
+                yield row
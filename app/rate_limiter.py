@@ -1,13 +1,18 @@
 """
 Rate limiter configuration backed by Redis.
+
+Storage and strategy come from RATELIMIT_STORAGE_URI / RATELIMIT_STRATEGY
+(see config.py); ``local+redis://`` selects the batched in-memory storage
+in app/limit_storage.py.
 """
 
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
+from app import limit_storage  # noqa: F401  (registers the local+redis:// scheme)
+
 limiter = Limiter(
     key_func=get_remote_address,
     default_limits=["200 per minute"],
     storage_uri=None,       # will be set from app config on init_app()
-    strategy="fixed-window",
 )
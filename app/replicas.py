@@ -0,0 +1,215 @@
+"""
+Read-replica routing for read-only endpoints.
+
+Strategy:
+- REPLICA_DATABASE_URLS lists replicas per shard; each becomes the
+  Flask-SQLAlchemy bind ``shard<n>-replica<i>`` with the same explicit pool
+  options as every other bind (app/config.py)
+- Views marked ``@replicas.read_only`` (URL metadata, analytics, exports
+  and the redirect's cache-miss lookup) and the cache warm-up send their
+  SELECTs to a healthy replica of the shard in use, round-robin
+- Writes always go to the primary, and once a session has written
+  (flush or INSERT/UPDATE/DELETE) every later read in it does too
+  (read-after-write); ``replicas.primary()`` forces it explicitly, e.g. to
+  re-check a row the replica may not have yet
+- A background thread per worker checks every replica each
+  REPLICA_CHECK_INTERVAL seconds (``SELECT 1`` plus replication lag on
+  PostgreSQL / MySQL); a replica that fails or lags past REPLICA_MAX_LAG
+  is skipped until it recovers, and with none left reads fall back to the
+  primary
+"""
+
+import os
+import time
+import logging
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app, g, request
+from sqlalchemy import Select, text
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger(__name__)
+
+_reading: ContextVar[bool] = ContextVar("replica_reads", default=False)
+
+
+class _Replica:
+    __slots__ = ("key", "shard", "engine", "healthy", "lag", "reads", "error")
+
+    def __init__(self, key: str, shard: int) -> None:
+        self.key = key
+        self.shard = shard
+        self.engine = None
+        self.healthy = False      # until the first check passes
+        self.lag: float | None = None
+        self.reads = 0
+        self.error: str | None = None
+
+
+def replication_lag(conn) -> float:
+    """Seconds this replica is behind its primary (0 if unknown / not a replica)."""
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        lag = conn.execute(text(
+            "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+        )).scalar()
+        return float(lag or 0)
+    if dialect in ("mysql", "mariadb"):
+        row = conn.execute(text("SHOW REPLICA STATUS")).mappings().first()
+        if row is None:
+            return 0.0
+        lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+        return float("inf") if lag is None else float(lag)  # NULL = replication stopped
+    conn.execute(text("SELECT 1"))
+    return 0.0
+
+
+class Replicas:
+    """Replica registry, health checks and read routing."""
+
+    def __init__(self) -> None:
+        self._app = None
+        self._by_shard: dict[int, list[_Replica]] = {}
+        self._turn = itertools.count()
+        self._checker_pid: int | None = None
+        self._lock = threading.Lock()
+        self.max_lag = 5.0
+        self.check_interval = 2.0
+        self.fallbacks = 0
+
+    def init_app(self, app) -> None:
+        self._app = app
+        self.max_lag = app.config.get("REPLICA_MAX_LAG", self.max_lag)
+        self.check_interval = app.config.get("REPLICA_CHECK_INTERVAL", self.check_interval)
+        self._by_shard = {}
+        for key, shard in app.config.get("REPLICA_BINDS", {}).items():
+            self._by_shard.setdefault(shard, []).append(_Replica(key, shard))
+        app.before_request(self._bind_request)
+        app.teardown_request(self._unbind_request)
+
+    # ------------------------------------------------------------------
+    # Routing
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def read_only(view):
+        """Mark a view whose reads may be served by a replica."""
+        view.replica_reads = True
+        return view
+
+    def configured(self) -> bool:
+        return bool(self._by_shard)
+
+    @contextmanager
+    def reading(self):
+        """Let reads in the block use replicas (background jobs)."""
+        token = _reading.set(True)
+        try:
+            yield
+        finally:
+            _reading.reset(token)
+
+    @contextmanager
+    def primary(self):
+        """Send every statement in the block to the primary."""
+        token = _reading.set(False)
+        try:
+            yield
+        finally:
+            _reading.reset(token)
+
+    def engine_for(self, session, shard: int, clause):
+        """Replica engine for this statement, or None for the primary."""
+        if session._flushing or isinstance(clause, UpdateBase):
+            session.info["wrote"] = True
+            return None
+        if not _reading.get() or session.info.get("wrote") or not isinstance(clause, Select):
+            return None
+        pool = self._by_shard.get(shard)
+        if not pool:
+            return None
+        self._ensure_checker()
+        healthy = [r for r in pool if r.healthy]
+        if not healthy:
+            self.fallbacks += 1
+            return None
+        replica = healthy[next(self._turn) % len(healthy)]
+        replica.reads += 1
+        return replica.engine
+
+    def _bind_request(self) -> None:
+        view = current_app.view_functions.get(request.endpoint)
+        if getattr(view, "replica_reads", False):
+            g._replica_token = _reading.set(True)
+
+    def _unbind_request(self, exc) -> None:
+        token = g.pop("_replica_token", None)
+        if token is not None:
+            _reading.reset(token)
+
+    # ------------------------------------------------------------------
+    # Health checks
+    # ------------------------------------------------------------------
+
+    def _ensure_checker(self) -> None:
+        if self._checker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._checker_pid == os.getpid():
+                return
+            self._checker_pid = os.getpid()
+            threading.Thread(target=self._check_loop, name="replica-check", daemon=True).start()
+
+    def _check_loop(self) -> None:
+        while True:
+            try:
+                self.check()
+            except Exception as exc:
+                logger.warning("Replica health check failed: %s", exc)
+            time.sleep(self.check_interval)
+
+    def check(self) -> None:
+        """Probe every replica once and update its health."""
+        from app import db
+
+        with self._app.app_context():
+            for pool in self._by_shard.values():
+                for replica in pool:
+                    replica.engine = db.engines[replica.key]
+                    try:
+                        with replica.engine.connect() as conn:
+                            replica.lag = replication_lag(conn)
+                        replica.error = None
+                    except Exception as exc:
+                        replica.lag, replica.error = None, str(exc)
+                    healthy = replica.lag is not None and replica.lag <= self.max_lag
+                    if healthy != replica.healthy:
+                        logger.warning(
+                            "Replica %s is now %s (lag %s, %s)", replica.key,
+                            "healthy" if healthy else "skipped", replica.lag, replica.error,
+                        )
+                    replica.healthy = healthy
+
+    def stats(self) -> dict:
+        return {
+            "max_lag": self.max_lag,
+            "fallbacks": self.fallbacks,
+            "replicas": [
+                {
+                    "bind": r.key,
+                    "shard": r.shard,
+                    "healthy": r.healthy,
+                    "lag": r.lag,
+                    "reads": r.reads,
+                    "error": r.error,
+                }
+                for pool in self._by_shard.values() for r in pool
+            ],
+        }
+
+
+replicas = Replicas()
@@ -4,25 +4,65 @@ REST API routes for the URL Shortener.
 Endpoints
 ---------
 POST   /api/shorten            — create a short URL
+POST   /api/shorten/batch      — create many short URLs in one request
 GET    /api/url/<code>         — retrieve URL metadata
-GET    /<code>                 — 302 redirect (cached)
+GET    /<code>                 — redirect (cached, one DB lookup per miss)
 GET    /api/analytics/<code>   — click analytics
+GET    /api/analytics/<code>/export — stream raw clicks (NDJSON / CSV)
+GET    /api/export/clicks      — stream raw clicks for many codes / a date range
 DELETE /api/url/<code>         — soft-delete a URL
+GET    /api/stats              — internal cache / pipeline counters
+POST   /api/admin/warm-cache   — preload the hottest links into the cache
+GET    /metrics                — Prometheus metrics (see app/metrics.py)
+
+Routes taking a ``<code>`` query the shard encoded in it (app/sharding.py).
+Views marked ``@replicas.read_only`` read from a replica of that shard when
+one is configured and healthy (app/replicas.py).
 """
 
 import time
+import base64
+import hashlib
 import logging
-from datetime import datetime, timezone
-
-from flask import Blueprint, request, jsonify, redirect, render_template, current_app
-from sqlalchemy import func
-
-from app import db
+from datetime import datetime, timedelta, timezone
+
+from flask import (
+    Blueprint,
+    Response,
+    request,
+    jsonify,
+    redirect,
+    render_template,
+    current_app,
+    stream_with_context,
+)
+from sqlalchemy import insert, select, tuple_
+
+from app import db, export, metrics, rollups
 from app.models import Url, ClickLog
 from app.encoder import base62_encode
-from app.cache import get_cached_url, set_cached_url, invalidate_cache
-from app.validators import validate_url, sanitize_url
+from app.cache import (
+    GONE,
+    CachedUrl,
+    to_epoch,
+    fetch_url,
+    set_cached_url,
+    set_cached_urls,
+    invalidate_cache,
+    cache_stats,
+)
+from app.bloom import code_filter
+from app.id_allocator import id_allocator
+from app.sharding import shards
+from app.replicas import replicas
+from app.click_ingest import click_ingestor, make_click_event
+from app.counters import get_pending
+from app.validators import validate_url, validate_redirect_type, sanitize_url, url_hash
+from app.dedup import find_existing, remember, remember_many
+from app.warmup import hot_keys
+from app.expiry import expiry_sweeper
 from app.rate_limiter import limiter
+from app.limit_storage import LocalBatchedStorage
 
 logger = logging.getLogger(__name__)
 
@@ -46,7 +86,19 @@ def index():
 @api_bp.route("/shorten", methods=["POST"])
 @limiter.limit("30 per minute")
 def shorten_url():
-    """Create a shortened URL."""
+    """
+    Create a shortened URL.
+
+    With ``"dedupe": true`` an existing active link for the same
+    (normalized) URL, expires_at and redirect_type is returned instead of
+    a new one.
+
+    ``"redirect_type"``: 302 (default) / 307 — every visit hits the server
+    and is counted; 301 / 308 — browsers and CDNs cache the redirect for up to
+    REDIRECT_CACHE_MAX_AGE (never past expires_at), so repeat visits from
+    the same client are neither served by us nor counted, and a deleted
+    link keeps redirecting there until that cache expires.
+    """
     data = request.get_json(silent=True)
     if not data:
         return jsonify({"error": "Request body must be JSON"}), 400
@@ -61,31 +113,164 @@ def shorten_url():
     original_url = sanitize_url(original_url)
 
     # Optional expiry (ISO-8601)
-    expires_at = None
-    if data.get("expires_at"):
-        try:
-            expires_at = datetime.fromisoformat(data["expires_at"])
-        except ValueError:
-            return jsonify({"error": "expires_at must be a valid ISO-8601 datetime"}), 400
+    expires_at, error_msg = _parse_datetime(data.get("expires_at"))
+    if error_msg:
+        return jsonify({"error": error_msg}), 400
+    redirect_type, error_msg = validate_redirect_type(data.get("redirect_type"))
+    if error_msg:
+        return jsonify({"error": error_msg}), 400
+
+    digest = url_hash(original_url)
+    base_url = current_app.config.get("BASE_URL", "")
+
+    # ---- Opt-in de-duplication ----
+    if data.get("dedupe", current_app.config["DEDUP_DEFAULT"]):
+        existing = find_existing(digest, expires_at)
+        if existing and existing.redirect_type == redirect_type:
+            return jsonify({
+                "message": "Existing short URL returned",
+                "deduplicated": True,
+                "data": existing.to_dict(base_url),
+            }), 200
 
     # ---- Persist to MySQL ----
-    # Use a temp short_code that fits VARCHAR(10), then replace after flush
-    url_record = Url(original_url=original_url, short_code="tmp", expires_at=expires_at)
-    db.session.add(url_record)
-    db.session.flush()  # get auto-increment id
-
-    # Generate collision-free short code from the unique id
-    short_code = base62_encode(url_record.id)
-    url_record.short_code = short_code
-    db.session.commit()
+    # Id comes from a pre-reserved block of the chosen shard, so the code
+    # (which carries the shard) is known before the INSERT and the row is
+    # written exactly once.
+    shard = shards.pick()
+    url_id = id_allocator.next_id(shard)
+    short_code = base62_encode(url_id)
+    url_record = Url(
+        id=url_id,
+        original_url=original_url,
+        url_hash=digest,
+        short_code=short_code,
+        expires_at=expires_at,
+        redirect_type=redirect_type,
+    )
+    with shards.bound(shard):
+        db.session.add(url_record)
+        db.session.commit()
+        # Still bound: the committed row is reloaded from its own shard.
+        data = url_record.to_dict(base_url, pending_clicks=0)
 
     # ---- Write-through to Redis ----
-    set_cached_url(short_code, original_url)
+    set_cached_url(short_code, original_url, url_id, expires_at, redirect_type)
+    code_filter.add(short_code)
+    remember(digest, expires_at, short_code)
 
-    base_url = current_app.config.get("BASE_URL", "")
     return jsonify({
         "message": "URL shortened successfully",
-        "data": url_record.to_dict(base_url),
+        "data": data,
+    }), 201
+
+
+# =====================  1b. POST /api/shorten/batch  =======================
+
+def _batch_cost() -> int:
+    """Rate-limit cost of a batch request: one unit per submitted item."""
+    data = request.get_json(silent=True) or {}
+    items = data.get("urls") if isinstance(data, dict) else None
+    return max(1, len(items)) if isinstance(items, list) else 1
+
+
+@api_bp.route("/shorten/batch", methods=["POST"])
+@limiter.limit(lambda: current_app.config["BATCH_RATE_LIMIT"], cost=_batch_cost)
+def shorten_batch():
+    """
+    Create many short URLs at once.
+
+    Body: ``{"urls": ["https://...", {"url": "https://...", "expires_at": "...",
+    "redirect_type": 301}]}``
+    Every item is validated independently; valid ones get ids from the
+    allocator, are inserted in one multi-row statement and written to Redis
+    in one pipeline.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("urls"), list) or not data["urls"]:
+        return jsonify({"error": "Request body must be JSON with a non-empty 'urls' list"}), 400
+
+    max_items = current_app.config["BATCH_MAX_ITEMS"]
+    if len(data["urls"]) > max_items:
+        return jsonify({"error": f"At most {max_items} URLs per batch"}), 400
+
+    # ---- Validate every item ----
+    results: list[dict] = []
+    rows: list[dict] = []
+    row_index: list[int] = []
+    for index, item in enumerate(data["urls"]):
+        if isinstance(item, str):
+            item = {"url": item}
+        if not isinstance(item, dict):
+            results.append({"index": index, "error": "Item must be a URL string or object"})
+            continue
+
+        original_url = str(item.get("url") or "").strip()
+        is_valid, error_msg = validate_url(original_url)
+        if not is_valid:
+            results.append({"index": index, "error": error_msg})
+            continue
+        expires_at, error_msg = _parse_datetime(item.get("expires_at"))
+        if not error_msg:
+            redirect_type, error_msg = validate_redirect_type(item.get("redirect_type"))
+        if error_msg:
+            results.append({"index": index, "error": error_msg})
+            continue
+
+        results.append({"index": index})
+        original_url = sanitize_url(original_url)
+        rows.append({
+            "original_url": original_url,
+            "url_hash": url_hash(original_url),
+            "expires_at": expires_at,
+            "redirect_type": redirect_type,
+        })
+        row_index.append(index)
+
+    if not rows:
+        return jsonify({"error": "No valid URLs in batch", "data": {"results": results}}), 400
+
+    # ---- Persist: codes assigned up front, one multi-row INSERT (one shard) ----
+    now = datetime.now(timezone.utc)
+    shard = shards.pick()
+    for row, url_id in zip(rows, id_allocator.reserve(len(rows), shard)):
+        row.update(
+            id=url_id,
+            short_code=base62_encode(url_id),
+            created_at=now,
+            is_active=True,
+            click_count=0,
+        )
+    with shards.bound(shard):
+        db.session.execute(insert(Url.__table__).values(rows))
+        db.session.commit()
+
+    # ---- Write-through to Redis (pipelined) ----
+    set_cached_urls([
+        (row["short_code"], row["original_url"], row["id"], row["expires_at"], row["redirect_type"])
+        for row in rows
+    ])
+    code_filter.add(*(row["short_code"] for row in rows))
+    remember_many([(row["url_hash"], row["expires_at"], row["short_code"]) for row in rows])
+
+    base_url = current_app.config.get("BASE_URL", "")
+    for index, row in zip(row_index, rows):
+        results[index]["data"] = {
+            "id": row["id"],
+            "short_code": row["short_code"],
+            "short_url": f"{base_url}/{row['short_code']}" if base_url else row["short_code"],
+            "original_url": row["original_url"],
+            "expires_at": row["expires_at"].isoformat() if row["expires_at"] else None,
+            "redirect_type": row["redirect_type"],
+        }
+
+    return jsonify({
+        "message": f"{len(rows)} of {len(results)} URLs shortened",
+        "data": {
+            "created": len(rows),
+            "failed": len(results) - len(rows),
+            "results": results,
+        },
     }), 201
 
 
@@ -93,113 +278,221 @@ def shorten_url():
 
 @api_bp.route("/url/<short_code>", methods=["GET"])
 @limiter.limit("100 per minute")
+@replicas.read_only
 def get_url_info(short_code: str):
-    """Return metadata for a short URL."""
-    url_record = Url.query.filter_by(short_code=short_code, is_active=True).first()
+    """Return metadata for a short URL (conditional: ETag / Last-Modified)."""
+    url_record = _active_url(short_code)
     if not url_record:
         return jsonify({"error": "Short URL not found"}), 404
 
+    pending = get_pending(url_record.id)
+    etag, last_modified = _validators(url_record, pending)
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified:
+        return not_modified
+
     base_url = current_app.config.get("BASE_URL", "")
-    return jsonify({"data": url_record.to_dict(base_url)}), 200
+    response = jsonify({"data": url_record.to_dict(base_url, pending_clicks=pending)})
+    return _with_validators(response, etag, last_modified), 200
 
 
 # =====================  3. GET /<code>  (redirect)  ========================
 
 @redirect_bp.route("/<short_code>")
 @limiter.limit("100 per minute")
+@replicas.read_only
 def redirect_short_url(short_code: str):
-    """Redirect to the original URL.  Uses Redis cache for speed."""
-    start = time.perf_counter_ns()
-
-    # --- Try Redis cache first ---
-    original_url = get_cached_url(short_code)
-
-    if original_url:
-        # Cache hit — still need to log the click asynchronously
-        _log_click_and_increment(short_code, request)
-        elapsed = (time.perf_counter_ns() - start) / 1_000_000
-        logger.info("REDIRECT (cache hit) %s → %s  [%.2f ms]", short_code, original_url, elapsed)
-        return redirect(original_url, code=302)
+    """
+    Redirect to the original URL.  Served from the cache; on a miss the DB
+    lookup runs once per code however many requests arrive for it at the
+    same time, and hot entries are renewed before they expire
+    (cache.fetch_url).
+    """
+    start = time.perf_counter()
+    loaded = False
+
+    def load() -> CachedUrl:
+        nonlocal loaded
+        loaded = True
+        url_record = _active_url(short_code)
+        if not url_record:
+            return GONE
+        if url_record.is_expired():
+            url_record.is_active = False
+            db.session.commit()
+        return CachedUrl(
+            url_record.id, url_record.original_url, to_epoch(url_record.expires_at), True,
+            url_record.redirect_type,
+        )
 
-    # --- Cache miss — query MySQL ---
-    url_record = Url.query.filter_by(short_code=short_code, is_active=True).first()
-    if not url_record:
+    # L1 → Redis → MySQL; codes that were never issued stop before the DB
+    entry = fetch_url(short_code, load, might_exist=code_filter.might_exist)
+    status = entry.status() if entry else "gone"
+    if status == "gone":
+        metrics.observe_redirect("not_found", start)
         return jsonify({"error": "Short URL not found"}), 404
-
-    # Check expiry
-    if url_record.expires_at and url_record.expires_at < datetime.now(timezone.utc):
-        url_record.is_active = False
-        db.session.commit()
-        invalidate_cache(short_code)
+    if status == "expired":
+        metrics.observe_redirect("expired", start)
         return jsonify({"error": "This short URL has expired"}), 404
 
-    original_url = url_record.original_url
-
-    # Populate cache for future hits
-    set_cached_url(short_code, original_url)
-
-    # Log click
-    _log_click(url_record.id, request)
-    url_record.click_count = Url.click_count + 1
-    db.session.commit()
-
-    elapsed = (time.perf_counter_ns() - start) / 1_000_000
-    logger.info("REDIRECT (db) %s → %s  [%.2f ms]", short_code, original_url, elapsed)
-    return redirect(original_url, code=302)
+    # Hand the click to the background ingestor
+    click_ingestor.enqueue(make_click_event(short_code, entry.url_id, request))
+    source = "db" if loaded else "cache"
+    metrics.observe_redirect(source, start)
+    metrics.log_sampled(logger, "REDIRECT (%s) %s → %s", source, short_code, entry.original_url)
+    return _redirect_response(entry)
 
 
 # ================  4. GET /api/analytics/<code>  ===========================
 
 @api_bp.route("/analytics/<short_code>", methods=["GET"])
 @limiter.limit("100 per minute")
+@replicas.read_only
 def get_analytics(short_code: str):
-    """Return click analytics for a short URL."""
-    url_record = Url.query.filter_by(short_code=short_code, is_active=True).first()
+    """
+    Return click analytics for a short URL.
+
+    Query params: ``granularity=hour|day`` (default day) and optional
+    ISO-8601 ``start`` / ``end`` (default: the last 30 days), served from
+    the pre-aggregated rollup tables; ``per_page`` and ``cursor`` (the
+    previous response's ``next_cursor``) page through recent clicks.
+    Responses carry ETag / Last-Modified; a matching If-None-Match or
+    If-Modified-Since gets 304 without touching clicks or rollups.
+    """
+    granularity = request.args.get("granularity", "day")
+    if granularity not in rollups.GRANULARITIES:
+        return jsonify({"error": "granularity must be 'hour' or 'day'"}), 400
+
+    start, end = rollups.default_range(granularity)
+    for name in ("start", "end"):
+        if request.args.get(name):
+            value, error_msg = _parse_datetime(request.args[name], name)
+            if error_msg:
+                return jsonify({"error": error_msg}), 400
+            if name == "start":
+                start = value
+            else:
+                end = value
+    if start > end:
+        return jsonify({"error": "start must not be after end"}), 400
+    max_days = current_app.config["ANALYTICS_MAX_HOURLY_DAYS"]
+    if granularity == "hour" and end - start > timedelta(days=max_days):
+        return jsonify({"error": f"Hourly ranges are limited to {max_days} days"}), 400
+
+    url_record = _active_url(short_code)
     if not url_record:
         return jsonify({"error": "Short URL not found"}), 404
 
-    # Pagination
-    page = request.args.get("page", 1, type=int)
+    # Keyset pagination on (clicked_at, id), newest first — no COUNT / OFFSET
     per_page = request.args.get("per_page", 20, type=int)
-    per_page = min(per_page, 100)  # cap
-
-    clicks = (
-        ClickLog.query
-        .filter_by(url_id=url_record.id)
-        .order_by(ClickLog.clicked_at.desc())
-        .paginate(page=page, per_page=per_page, error_out=False)
+    per_page = max(1, min(per_page, 100))  # cap
+    cursor = None
+    if request.args.get("cursor"):
+        cursor = _decode_cursor(request.args["cursor"])
+        if cursor is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    # Validators before any click / rollup query: new clicks always move
+    # the counter, and the range only matters to bucket precision.
+    pending = get_pending(url_record.id)
+    bucket = rollups.hour_bucket if granularity == "hour" else rollups.day_bucket
+    etag, last_modified = _validators(
+        url_record, pending, granularity, bucket(start), bucket(end), per_page,
+        request.args.get("cursor", ""),
     )
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified:
+        return not_modified
 
-    # Daily breakdown (last 30 days)
-    daily_clicks = (
-        db.session.query(
-            func.date(ClickLog.clicked_at).label("date"),
-            func.count(ClickLog.id).label("count"),
-        )
-        .filter(ClickLog.url_id == url_record.id)
-        .group_by(func.date(ClickLog.clicked_at))
-        .order_by(func.date(ClickLog.clicked_at).desc())
-        .limit(30)
+    clicks_query = ClickLog.query.filter(ClickLog.url_id == url_record.id)
+    if cursor:
+        clicks_query = clicks_query.filter(tuple_(ClickLog.clicked_at, ClickLog.id) < cursor)
+    clicks = (
+        clicks_query
+        .order_by(ClickLog.clicked_at.desc(), ClickLog.id.desc())
+        .limit(per_page + 1)
         .all()
     )
+    has_more = len(clicks) > per_page
+    clicks = clicks[:per_page]
+    next_cursor = _encode_cursor(clicks[-1]) if has_more else None
+
+    # Time series from the rollups (one range scan on the primary key)
+    buckets = rollups.series(url_record.id, granularity, start, end)
 
     base_url = current_app.config.get("BASE_URL", "")
-    return jsonify({
+    url_data = url_record.to_dict(base_url, pending_clicks=pending)
+    data = {
+        "url": url_data,
+        "total_clicks": url_data["click_count"],
+        "clicks_series": {
+            "granularity": granularity,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "buckets": buckets,
+        },
+    }
+    if granularity == "day":
+        data["daily_clicks"] = [{"date": b["bucket"], "count": b["count"]} for b in buckets]
+    response = jsonify({
         "data": {
-            "url": url_record.to_dict(base_url),
-            "total_clicks": url_record.click_count,
-            "daily_clicks": [
-                {"date": str(row.date), "count": row.count} for row in daily_clicks
-            ],
-            "recent_clicks": [c.to_dict() for c in clicks.items],
+            **data,
+            "recent_clicks": [c.to_dict() for c in clicks],
             "pagination": {
-                "page": clicks.page,
-                "per_page": clicks.per_page,
-                "total": clicks.total,
-                "pages": clicks.pages,
+                "per_page": per_page,
+                "next_cursor": next_cursor,
+                "has_more": has_more,
+                # From the click counter (persisted + pending), not COUNT(*)
+                "total": url_data["click_count"],
             },
         }
-    }), 200
+    })
+    return _with_validators(response, etag, last_modified), 200
+
+
+# ================  4b. Streaming click export  ============================
+
+@api_bp.route("/analytics/<short_code>/export", methods=["GET"])
+@limiter.limit("10 per minute")
+@replicas.read_only
+def export_clicks(short_code: str):
+    """
+    Stream every click of one short URL.
+
+    Query params: ``format=ndjson|csv`` (default ndjson), optional ISO-8601
+    ``since`` / ``until``.  Gzip-compressed when the client accepts it.
+    """
+    url_record = _active_url(short_code)
+    if not url_record:
+        return jsonify({"error": "Short URL not found"}), 404
+    return _export_response([url_record.id], f"clicks-{short_code}")
+
+
+@api_bp.route("/export/clicks", methods=["GET"])
+@limiter.limit("5 per minute")
+@replicas.read_only
+def export_clicks_bulk():
+    """
+    Stream clicks for many short codes (``codes=a,b,c``) or, without
+    ``codes``, for every URL within a required ``since`` / ``until`` range.
+    """
+    codes = [c for c in request.args.get("codes", "").split(",") if c]
+    url_ids = None
+    if codes:
+        max_codes = current_app.config["EXPORT_MAX_CODES"]
+        if len(codes) > max_codes:
+            return jsonify({"error": f"At most {max_codes} codes per export"}), 400
+        url_ids = []
+        for shard, shard_codes in shards.group_codes(codes).items():
+            with shards.bound(shard):
+                url_ids += db.session.scalars(
+                    select(Url.id).where(Url.short_code.in_(shard_codes))
+                ).all()
+        if not url_ids:
+            return jsonify({"error": "Short URL not found"}), 404
+    elif not (request.args.get("since") and request.args.get("until")):
+        return jsonify({"error": "Provide codes, or both since and until"}), 400
+    return _export_response(url_ids, "clicks")
 
 
 # ================  5. DELETE /api/url/<code>  ==============================
@@ -220,25 +513,179 @@ def delete_url(short_code: str):
     return "", 204
 
 
+# ================  6. GET /api/stats  =====================================
+
+@api_bp.route("/stats", methods=["GET"])
+def get_stats():
+    """Return internal counters for the cache tiers and click pipeline."""
+    return jsonify({
+        "data": {
+            "cache": cache_stats(),
+            "bloom": code_filter.stats(),
+            "click_ingest": click_ingestor.stats(),
+            "id_allocator": id_allocator.stats(),
+            "shards": shards.stats(),
+            "replicas": replicas.stats(),
+            "db": metrics.db_stats(),
+            "rate_limit": _rate_limit_stats(),
+            "warmup": hot_keys.stats(),
+            "expiry": expiry_sweeper.stats(),
+        }
+    }), 200
+
+
+def _rate_limit_stats() -> dict:
+    storage = limiter.storage
+    if isinstance(storage, LocalBatchedStorage):
+        return storage.stats()
+    return {"storage": type(storage).__name__}
+
+
+# ================  7. POST /api/admin/warm-cache  ==========================
+
+@api_bp.route("/admin/warm-cache", methods=["POST"])
+@limiter.limit("2 per minute")
+def warm_cache_now():
+    """
+    Preload the hottest links into Redis now.
+
+    Optional body: ``{"top_n": 1000, "recent_hours": 24}``.  Requires the
+    ``X-Admin-Token`` header when ADMIN_TOKEN is configured.
+    """
+    token = current_app.config.get("ADMIN_TOKEN")
+    if token and request.headers.get("X-Admin-Token") != token:
+        return jsonify({"error": "Forbidden"}), 403
+
+    data = request.get_json(silent=True) or {}
+    overrides = {}
+    for field in ("top_n", "recent_hours"):
+        if field in data:
+            value = data[field]
+            if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+                return jsonify({"error": f"{field} must be a positive integer"}), 400
+            overrides[field] = value
+
+    report = hot_keys.warm(**overrides)
+    return jsonify({"message": "Cache warmed", "data": report}), 200
+
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 
-def _log_click(url_id: int, req) -> None:
-    """Insert a click log record."""
-    click = ClickLog(
-        url_id=url_id,
-        ip_address=req.remote_addr or "unknown",
-        user_agent=req.headers.get("User-Agent", ""),
-        referer=req.headers.get("Referer", ""),
+def _redirect_response(entry: CachedUrl):
+    response = redirect(entry.original_url, code=entry.redirect_type)
+    response.headers["Cache-Control"] = entry.cache_control(
+        current_app.config["REDIRECT_CACHE_MAX_AGE"]
     )
-    db.session.add(click)
-
-
-def _log_click_and_increment(short_code: str, req) -> None:
-    """Log click + increment counter (used on cache-hit path)."""
+    return response
+
+
+def _validators(url_record: Url, pending: int, *extra) -> tuple[str, datetime | None]:
+    """
+    Weak ETag and Last-Modified for a representation of *url_record*.
+
+    Everything a response can show changes with the row (expiry, redirect
+    type) or the click total, so the pair costs one row lookup (the click
+    total is not in the redirect cache) and one counter read.
+    Last-Modified is updated_at, and only while no clicks are pending in
+    Redis (their time is unknown).
+    """
+    state = (
+        url_record.id, url_record.expires_at, url_record.redirect_type,
+        (url_record.click_count or 0) + pending, *extra,
+    )
+    etag = hashlib.blake2b(repr(state).encode(), digest_size=12).hexdigest()
+    changed = url_record.updated_at or url_record.created_at
+    if pending or changed is None:
+        return etag, None
+    if changed.tzinfo is None:
+        changed = changed.replace(tzinfo=timezone.utc)
+    return etag, changed.replace(microsecond=0)
+
+
+def _not_modified(etag: str, last_modified: datetime | None):
+    """A 304 response if the request's validators still match, else None."""
+    if request.if_none_match:
+        matched = request.if_none_match.contains_weak(etag)
+    else:
+        since = request.if_modified_since
+        matched = bool(last_modified and since and last_modified <= since)
+    if not matched:
+        return None
+    return _with_validators(Response(status=304), etag, last_modified)
+
+
+def _with_validators(response, etag: str, last_modified: datetime | None):
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    # Clients may keep the body but must revalidate before reusing it.
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _active_url(short_code: str) -> Url | None:
+    """The active row for *short_code*.  A miss on a replica is re-checked
+    on the primary: the link may be newer than the replica's last replay."""
     url_record = Url.query.filter_by(short_code=short_code, is_active=True).first()
-    if url_record:
-        _log_click(url_record.id, req)
-        url_record.click_count = Url.click_count + 1
-        db.session.commit()
+    if url_record is None and replicas.configured():
+        with replicas.primary():
+            url_record = Url.query.filter_by(short_code=short_code, is_active=True).first()
+    return url_record
+
+
+def _parse_datetime(value, field: str = "expires_at") -> tuple[datetime | None, str]:
+    """Parse an optional ISO-8601 value into naive UTC.  Returns (value, error)."""
+    if not value:
+        return None, ""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None, f"{field} must be a valid ISO-8601 datetime"
+    # Stored as naive UTC
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed, ""
+
+
+def _export_response(url_ids: list[int] | None, filename: str):
+    """Validate export query params and build the streaming response."""
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in export.FORMATS:
+        return jsonify({"error": "format must be 'ndjson' or 'csv'"}), 400
+    since, error_msg = _parse_datetime(request.args.get("since"), "since")
+    if error_msg:
+        return jsonify({"error": error_msg}), 400
+    until, error_msg = _parse_datetime(request.args.get("until"), "until")
+    if error_msg:
+        return jsonify({"error": error_msg}), 400
+
+    compress = request.accept_encodings["gzip"] > 0  # honours q=0
+    rows = export.click_rows(
+        url_ids, since, until, current_app.config["EXPORT_YIELD_PER"]
+    )
+    response = Response(
+        stream_with_context(export.stream_export(rows, fmt, compress)),
+        mimetype=export.FORMATS[fmt],
+    )
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+    response.headers["Vary"] = "Accept-Encoding"
+    if compress:
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+def _encode_cursor(click) -> str:
+    """Opaque keyset cursor for the click *after which* the next page starts."""
+    raw = f"{click.clicked_at.isoformat()}|{click.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(token: str) -> tuple[datetime, int] | None:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        clicked_at, click_id = raw.split("|", 1)
+        return datetime.fromisoformat(clicked_at), int(click_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
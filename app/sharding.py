@@ -0,0 +1,133 @@
+"""
+Horizontal partitioning of ``urls`` (and their clicks) across databases.
+
+Strategy:
+- Shard n owns the ids ``[n << 40, (n + 1) << 40)``; the shard number sits
+  in the high bits of urls.id, so the Base62 short code carries it as well
+  (app.encoder.shard_of_code) and routing needs no directory lookup
+- Shard 0 is SQLALCHEMY_DATABASE_URI.  Every id issued before sharding is
+  below 2**40, so existing codes keep resolving there unchanged
+- Shards 1..N come from SHARD_DATABASE_URLS (Flask-SQLAlchemy binds
+  ``shard<n>``); each holds the whole schema — urls, click_logs, rollups
+  and its own id_sequences row — so a link's clicks live next to it
+- ``db.session`` sends every statement to the shard bound in the current
+  context (``shards.bound(n)``); requests to a ``<short_code>`` route are
+  bound from the code before the view runs
+- New links go round-robin to SHARD_WRITE_IDS (default: all shards);
+  background jobs group their rows by the shard of each url_id, and
+  cross-shard reads (bloom rebuild, warm-up, de-dup, bulk export) loop
+  over ``shards.ids()``
+- Adding a shard: ``flask --app run shards init <n>`` (schema + id
+  sequence), then list it in SHARD_WRITE_IDS
+"""
+
+import itertools
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, request
+from flask_sqlalchemy.session import Session
+
+from app.encoder import shard_of_code, shard_of_id
+from app.replicas import replicas
+
+logger = logging.getLogger(__name__)
+
+_current_shard: ContextVar[int] = ContextVar("shard", default=0)
+
+
+class ShardSession(Session):
+    """Session that binds to the shard of the current context (or one of
+    its read replicas, see app.replicas)."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        shard = _current_shard.get()
+        if bind is None:
+            replica = replicas.engine_for(self, shard, clause)
+            if replica is not None:
+                return replica
+        if shard and bind is None:
+            return shards.engine(shard)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class Shards:
+    """Shard registry, write placement and per-request routing."""
+
+    def __init__(self) -> None:
+        self._ids = [0]
+        self.write_ids = [0]
+        self._turn = itertools.count()
+
+    def init_app(self, app) -> None:
+        self._ids = [0, *sorted(app.config.get("SHARD_DATABASE_URLS", {}))]
+        self.write_ids = app.config.get("SHARD_WRITE_IDS") or list(self._ids)
+        unknown = set(self.write_ids) - set(self._ids)
+        if unknown:
+            raise ValueError(f"SHARD_WRITE_IDS lists unconfigured shards {sorted(unknown)}")
+        app.before_request(self._bind_request)
+        app.teardown_request(self._unbind_request)
+
+    def ids(self) -> list[int]:
+        return list(self._ids)
+
+    def engine(self, shard: int):
+        """The engine of *shard* (app context required)."""
+        from app import db
+
+        return db.engine if shard == 0 else db.engines[f"shard{shard}"]
+
+    def pick(self) -> int:
+        """Shard for the next new link (round-robin over SHARD_WRITE_IDS)."""
+        return self.write_ids[next(self._turn) % len(self.write_ids)]
+
+    def for_code(self, short_code: str) -> int:
+        """Owning shard of *short_code*; unknown shards fall back to 0 (→ 404)."""
+        shard = shard_of_code(short_code)
+        return shard if shard in self._ids else 0
+
+    def group_ids(self, url_ids) -> dict[int, list[int]]:
+        """Split url ids by owning shard."""
+        grouped: dict[int, list[int]] = {}
+        for url_id in url_ids:
+            grouped.setdefault(shard_of_id(url_id), []).append(url_id)
+        return grouped
+
+    def group_codes(self, codes) -> dict[int, list[str]]:
+        grouped: dict[int, list[str]] = {}
+        for code in codes:
+            grouped.setdefault(self.for_code(code), []).append(code)
+        return grouped
+
+    @contextmanager
+    def bound(self, shard: int):
+        """Route ``db.session`` to *shard* inside the block."""
+        token = _current_shard.set(shard)
+        try:
+            yield
+        finally:
+            _current_shard.reset(token)
+
+    def current(self) -> int:
+        return _current_shard.get()
+
+    # ------------------------------------------------------------------
+    # Request routing
+    # ------------------------------------------------------------------
+
+    def _bind_request(self) -> None:
+        short_code = (request.view_args or {}).get("short_code")
+        if short_code is not None:
+            g._shard_token = _current_shard.set(self.for_code(short_code))
+
+    def _unbind_request(self, exc) -> None:
+        token = g.pop("_shard_token", None)
+        if token is not None:
+            _current_shard.reset(token)
+
+    def stats(self) -> dict:
+        return {"shards": self.ids(), "write": list(self.write_ids)}
+
+
+shards = Shards()
@@ -3,7 +3,8 @@ Input validation helpers for URL shortener.
 """
 
 import re
-from urllib.parse import urlparse
+import hashlib
+from urllib.parse import urlparse, urlunparse
 
 # Maximum length for original URL
 MAX_URL_LENGTH = 2048
@@ -11,6 +12,9 @@ MAX_URL_LENGTH = 2048
 # Allowed schemes
 ALLOWED_SCHEMES = {"http", "https"}
 
+# 302 / 307 = temporary (not cached); 301 / 308 = permanent (cacheable)
+REDIRECT_TYPES = (301, 302, 307, 308)
+
 # Basic URL pattern
 URL_REGEX = re.compile(
     r"^https?://"                     # scheme
@@ -55,6 +59,55 @@ def validate_url(url: str | None) -> tuple[bool, str]:
     return True, ""
 
 
+def validate_redirect_type(value) -> tuple[int | None, str]:
+    """Parse an optional redirect type (default 302): an int or a string of
+    digits, so 301.9, "301.0" and true are rejected rather than truncated."""
+    if value is None or value == "":
+        return 302, ""
+    redirect_type = None
+    if isinstance(value, int) and not isinstance(value, bool):
+        redirect_type = value
+    elif isinstance(value, str) and value.isascii() and value.isdigit():
+        redirect_type = int(value)
+    if redirect_type not in REDIRECT_TYPES:
+        return None, "redirect_type must be one of 301, 302, 307, 308."
+    return redirect_type, ""
+
+
 def sanitize_url(url: str) -> str:
     """Strip whitespace and normalize."""
     return url.strip()
+
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form used for de-duplication.
+
+    Lower-cases scheme and host, drops default ports and uses "/" for an
+    empty path.  Path, query and fragment are kept verbatim (the fragment
+    can select different content, so it is part of the destination).
+    """
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    # Split the port off by hand: ``parsed.port`` raises for values > 65535,
+    # which validate_url accepts.
+    userinfo, _, hostport = parsed.netloc.rpartition("@")
+    host, sep, port = hostport.rpartition(":")
+    if not sep or not (port.isdigit() or port == ""):
+        host, port = hostport, ""  # no port (or an IPv6 literal's colons)
+    host = host.lower()
+    if port and int(port) != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{int(port)}"
+    if userinfo:
+        host = f"{userinfo}@{host}"
+    return urlunparse(
+        (scheme, host, parsed.path or "/", parsed.params, parsed.query, parsed.fragment)
+    )
+
+
+def url_hash(url: str) -> str:
+    """Fixed-width (64 hex chars) SHA-256 of the normalized URL."""
+    return hashlib.sha256(normalize_url(url).encode()).hexdigest()
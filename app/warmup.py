@@ -0,0 +1,269 @@
+"""
+Cache warm-up and the rolling hot-key set.
+
+Strategy:
+- ``warm_cache`` preloads the hot set, the top links by clicks in the last
+  WARMUP_RECENT_HOURS (hourly rollups) and the top links by
+  urls.click_count — WARMUP_TOP_N of each, across all shards — into Redis
+  and this worker's L1, in pipelined batches of WARMUP_BATCH_SIZE
+- It runs on worker boot (gunicorn post_worker_init; a short NX lock lets
+  one worker per deploy do it), from ``flask --app run warm-cache`` and
+  from POST /api/admin/warm-cache, and reports links / batches / seconds
+- Hot keys: every click flush adds per-code counts to the Redis sorted set
+  ``cache:hot``; one worker per HOT_DECAY_INTERVAL halves the scores and
+  trims the set to HOT_KEYS_MAX, so it tracks recent popularity
+- Each worker refreshes a snapshot of the hot set every
+  HOT_REFRESH_INTERVAL; hot codes are cached with HOT_CACHE_TTL instead of
+  the default TTL (see cache.set_hot_codes)
+- A marker key is written after each warm-up; when the refresh finds it
+  gone (Redis restarted, flushed or evicting hard) the cache is re-warmed
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+import redis
+from sqlalchemy import and_, func, or_, select
+
+from app.cache import CircuitOpen, get_redis, set_cached_urls, set_hot_codes
+from app.replicas import replicas
+from app.sharding import shards
+
+logger = logging.getLogger(__name__)
+
+HOT_KEY = "cache:hot"
+MARKER_KEY = "cache:warmed-at"
+WARMUP_LOCK_KEY = "cache:warmup-lock"
+DECAY_LOCK_KEY = "cache:hot-decay-lock"
+WARMUP_LOCK_TTL = 120  # seconds
+
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def warm_cache(
+    top_n: int,
+    recent_hours: int,
+    batch_size: int = 500,
+    progress: Callable[[int, int], None] | None = None,
+) -> dict:
+    """
+    Load the hottest links into Redis (and L1).  Must run in an app context.
+
+    Returns ``{"links", "hot", "batches", "seconds"}``; ``progress(done,
+    total)`` is called after every pipelined batch.
+    """
+    from app import db
+    from app.models import Url, ClickRollupHourly
+
+    started = time.perf_counter()
+    urls, hourly = Url.__table__, ClickRollupHourly.__table__
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    live = and_(
+        urls.c.is_active.is_(True),
+        or_(urls.c.expires_at.is_(None), urls.c.expires_at > now),
+    )
+
+    hot_codes = hot_keys.load()[:top_n]
+    recent, top = [], []
+    for shard in shards.ids():
+        with shards.bound(shard):
+            recent += db.session.execute(
+                select(hourly.c.url_id, func.sum(hourly.c.clicks).label("score"))
+                .where(hourly.c.bucket >= now - timedelta(hours=recent_hours))
+                .group_by(hourly.c.url_id)
+                .order_by(func.sum(hourly.c.clicks).desc())
+                .limit(top_n)
+            ).all()
+            top += db.session.execute(
+                select(urls.c.id, urls.c.click_count).where(live)
+                .order_by(urls.c.click_count.desc()).limit(top_n)
+            ).all()
+    # Global top N of each source across shards
+    recent_ids = [row[0] for row in sorted(recent, key=lambda row: -row[1])[:top_n]]
+    top_ids = [row[0] for row in sorted(top, key=lambda row: -row[1])[:top_n]]
+
+    # Most valuable first, so an interrupted warm-up still covers the hot set.
+    columns = (
+        urls.c.short_code, urls.c.original_url, urls.c.id, urls.c.expires_at, urls.c.redirect_type,
+    )
+    chunks = [
+        (shard, urls.c.short_code, chunk)
+        for shard, codes in shards.group_codes(hot_codes).items()
+        for chunk in _chunks(codes, batch_size)
+    ]
+    for ids in (recent_ids, top_ids):
+        chunks += [
+            (shard, urls.c.id, chunk)
+            for shard, shard_ids in shards.group_ids(ids).items()
+            for chunk in _chunks(shard_ids, batch_size)
+        ]
+    total = len(hot_codes) + len(recent_ids) + len(top_ids)
+    seen: set[int] = set()
+    loaded = batches = done = 0
+    for shard, column, chunk in chunks:
+        with shards.bound(shard):
+            rows = [
+                tuple(row)
+                for row in db.session.execute(select(*columns).where(live, column.in_(chunk)))
+                if row.id not in seen
+            ]
+        seen.update(row[2] for row in rows)
+        if rows:
+            set_cached_urls(rows)
+            loaded += len(rows)
+            batches += 1
+        done += len(chunk)
+        if progress:
+            progress(done, total)
+
+    try:
+        get_redis().set(MARKER_KEY, int(time.time()))
+    except redis.RedisError as exc:
+        logger.warning("Could not write warm-up marker: %s", exc)
+
+    report = {
+        "links": loaded,
+        "hot": len(hot_codes),
+        "batches": batches,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    logger.info(
+        "Cache warm-up: %d links (%d hot) in %d batches, %.2fs",
+        loaded, len(hot_codes), batches, report["seconds"],
+    )
+    return report
+
+
+class HotKeys:
+    """Rolling hot-key set plus boot / on-demand warm-up for one worker."""
+
+    def __init__(self) -> None:
+        self._app = None
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+        self.max_keys = 1000
+        self.refresh_interval = 30.0
+        self.decay_interval = 600.0
+        self.last_warmup: dict | None = None
+        self.warmups = 0
+
+    def init_app(self, app) -> None:
+        self._app = app
+        self.max_keys = app.config.get("HOT_KEYS_MAX", self.max_keys)
+        self.refresh_interval = app.config.get("HOT_REFRESH_INTERVAL", self.refresh_interval)
+        self.decay_interval = app.config.get("HOT_DECAY_INTERVAL", self.decay_interval)
+
+    # ------------------------------------------------------------------
+    # Hot set
+    # ------------------------------------------------------------------
+
+    def record(self, per_code: dict[str, int]) -> None:
+        """Add click counts (called by the click flusher)."""
+        if not per_code:
+            return
+        self.start()
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for short_code, count in per_code.items():
+                pipe.zincrby(HOT_KEY, count, short_code)
+            pipe.execute()
+        except redis.RedisError as exc:
+            logger.debug("Hot-key update skipped: %s", exc)
+
+    def load(self) -> list[str]:
+        """Fetch the hot set (hottest first) and install it as the TTL snapshot."""
+        try:
+            codes = get_redis().zrevrange(HOT_KEY, 0, self.max_keys - 1)
+        except redis.RedisError as exc:
+            logger.debug("Hot-key load skipped: %s", exc)
+            return []
+        set_hot_codes(codes)
+        return codes
+
+    def _decay(self) -> None:
+        r = get_redis()
+        if not r.set(DECAY_LOCK_KEY, os.getpid(), nx=True, ex=int(self.decay_interval)):
+            return
+        pipe = r.pipeline(transaction=True)
+        pipe.zunionstore(HOT_KEY, {HOT_KEY: 0.5})
+        pipe.zremrangebyrank(HOT_KEY, 0, -(self.max_keys + 1))
+        pipe.zremrangebyscore(HOT_KEY, "-inf", 0.5)
+        pipe.execute()
+
+    def refresh(self) -> None:
+        """Periodic: decay, reload the snapshot, re-warm if Redis lost its data."""
+        try:
+            self._decay()
+            self.load()
+            if not get_redis().exists(MARKER_KEY):
+                logger.info("Warm-up marker missing (Redis flushed or restarted)")
+                self.warm(lock=True)
+        except CircuitOpen:
+            pass
+        except redis.RedisError as exc:
+            logger.warning("Hot-key refresh failed: %s", exc)
+
+    # ------------------------------------------------------------------
+    # Warm-up
+    # ------------------------------------------------------------------
+
+    def warm(self, lock: bool = False, **overrides) -> dict | None:
+        """Run warm_cache with config defaults.  With *lock*, only if no
+        other worker is already warming (returns None then)."""
+        config = self._app.config
+        if lock:
+            try:
+                if not get_redis().set(WARMUP_LOCK_KEY, os.getpid(), nx=True, ex=WARMUP_LOCK_TTL):
+                    return None
+            except redis.RedisError as exc:
+                logger.warning("Cache warm-up skipped: %s", exc)
+                return None
+        with self._app.app_context(), replicas.reading():
+            report = warm_cache(
+                top_n=overrides.get("top_n", config["WARMUP_TOP_N"]),
+                recent_hours=overrides.get("recent_hours", config["WARMUP_RECENT_HOURS"]),
+                batch_size=config["WARMUP_BATCH_SIZE"],
+                progress=overrides.get("progress"),
+            )
+        report["finished_at"] = datetime.now(timezone.utc).isoformat()
+        self.last_warmup = report
+        self.warmups += 1
+        return report
+
+    def start(self, warm: bool = False) -> None:
+        """Start this worker's refresh thread (once per process)."""
+        if self._pid == os.getpid() or self._app is None:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(
+                target=self._run, args=(warm,), name="hot-keys", daemon=True
+            ).start()
+
+    def _run(self, warm: bool) -> None:
+        if warm:
+            try:
+                self.warm(lock=True)
+            except Exception as exc:
+                logger.warning("Boot warm-up failed: %s", exc)
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except Exception as exc:
+                logger.warning("Hot-key refresh failed: %s", exc)
+
+    def stats(self) -> dict:
+        return {"warmups": self.warmups, "last_warmup": self.last_warmup}
+
+
+hot_keys = HotKeys()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Worker boot-time benchmark.
+
+Every sample is a fresh interpreter, like a new or recycled gunicorn
+worker.  It times ``import app``, building the app (``from app import
+app``) and the first redirect, and counts the SQL statements issued before
+that first request.  ``--legacy`` adds the ``db.create_all()`` call every
+worker used to make on boot, so both modes can be compared on the same
+database.
+
+Usage
+-----
+    pip install -r requirements-dev.txt
+    python bench/boot_bench.py --samples 20
+    BENCH_DATABASE_URL=postgresql://... python bench/boot_bench.py --output boot.json
+
+SQLite hides most of the difference (no network round trips); point
+BENCH_DATABASE_URL at a real server to see what workers actually pay.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SEED_URL = "https://bench.example.com/boot"
+
+
+# ---------------------------------------------------------------------------
+# Child: one boot
+# ---------------------------------------------------------------------------
+
+def use_fakeredis(cache) -> None:
+    import fakeredis
+
+    server = fakeredis.FakeServer()
+    cache._redis_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    cache._redis_binary_client = fakeredis.FakeRedis(server=server)
+
+
+def setup_child() -> None:
+    """Apply migrations and seed one link; prints its short code."""
+    import app.cache as cache
+
+    use_fakeredis(cache)
+    from app import app, migrate
+
+    with app.app_context():
+        migrate.upgrade()
+    response = app.test_client().post("/api/shorten", json={"url": SEED_URL})
+    print(response.get_json()["data"]["short_code"])
+
+
+def boot_child(legacy: bool, code: str) -> None:
+    started = time.perf_counter()
+    import app as package
+    import app.cache as cache
+    imported = time.perf_counter()
+
+    use_fakeredis(cache)
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    statements = []
+    event.listen(Engine, "before_cursor_execute", lambda *args: statements.append(1))
+
+    app = package.app
+    if legacy:
+        with app.app_context():
+            package.db.create_all()
+    ready = time.perf_counter()
+    boot_statements = len(statements)
+
+    status = app.test_client().get(f"/{code}").status_code
+    served = time.perf_counter()
+
+    print(json.dumps({
+        "import_ms": (imported - started) * 1000,
+        "ready_ms": (ready - started) * 1000,
+        "first_request_ms": (served - ready) * 1000,
+        "boot_statements": boot_statements,
+        "status": status,
+    }))
+
+
+# ---------------------------------------------------------------------------
+# Parent
+# ---------------------------------------------------------------------------
+
+def run_child(env: dict, *args: str) -> str:
+    return subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), *args], env=env, cwd=ROOT, text=True
+    ).strip().splitlines()[-1]
+
+
+def summarize(mode: str, samples: list[dict]) -> dict:
+    result = {"mode": mode, "samples": len(samples)}
+    for key in ("import_ms", "ready_ms", "first_request_ms"):
+        values = [s[key] for s in samples]
+        result[f"{key[:-3]}_median_ms"] = round(statistics.median(values), 2)
+        result[f"{key[:-3]}_max_ms"] = round(max(values), 2)
+    result["boot_statements"] = max(s["boot_statements"] for s in samples)
+    result["errors"] = sum(1 for s in samples if s["status"] != 302)
+    print(
+        f"  {mode:<8} import {result['import_median_ms']:>7.1f} ms   "
+        f"ready {result['ready_median_ms']:>7.1f} ms   "
+        f"first request {result['first_request_median_ms']:>7.1f} ms   "
+        f"SQL before first request {result['boot_statements']}"
+    )
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--samples", type=int, default=10, help="boots per mode")
+    parser.add_argument("--output", default=None, help="write JSON results here")
+    parser.add_argument("--child", choices=["setup", "boot", "legacy"], help=argparse.SUPPRESS)
+    parser.add_argument("--code", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == "setup":
+        setup_child()
+        return 0
+    if args.child:
+        boot_child(args.child == "legacy", args.code)
+        return 0
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "boot.db")
+    env = {
+        **os.environ,
+        "DATABASE_URL": os.getenv("BENCH_DATABASE_URL", f"sqlite:///{db_path}"),
+        "REDIS_URL": "memory://",
+    }
+    code = run_child(env, "--child", "setup")
+    print(f"{args.samples} boots per mode, one interpreter each")
+
+    # Interleave the modes so machine noise hits both alike.
+    samples: dict[str, list[dict]] = {"lazy": [], "legacy": []}
+    for _ in range(args.samples):
+        for mode, child in (("lazy", "boot"), ("legacy", "legacy")):
+            samples[mode].append(json.loads(run_child(env, "--child", child, "--code", code)))
+    results = [summarize(mode, samples[mode]) for mode in ("lazy", "legacy")]
+
+    lazy, legacy = results
+    print(
+        f"[OK] ready: lazy {lazy['ready_median_ms']:.1f} ms vs legacy "
+        f"{legacy['ready_median_ms']:.1f} ms (median); SQL before the first request "
+        f"{legacy['boot_statements']} -> {lazy['boot_statements']}"
+    )
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}, fh, indent=2)
+        print(f"[OK] results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
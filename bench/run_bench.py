@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Reproducible load / latency benchmark for the URL shortener.
+
+Runs the Flask app in-process against local stand-ins — SQLite (or any
+BENCH_DATABASE_URL, e.g. a local Postgres) and fakeredis (or a real Redis
+via --redis-url) — and drives configurable workloads through the WSGI test
+client from a pool of threads.  Network time is excluded on purpose: the
+numbers track the app's own cost across commits.
+
+Workloads
+---------
+redirect       GET /<code>, codes drawn from a Zipf distribution
+shorten        POST /api/shorten bursts
+analytics      GET /api/analytics/<code>
+Each redirect run is done cache-cold (Redis + L1 flushed) and cache-warm.
+
+Usage
+-----
+    pip install -r requirements-dev.txt
+    python bench/run_bench.py --output bench_results.json
+    python bench/run_bench.py --baseline bench_results.json --threshold 0.15
+
+Exits 1 when any workload's p95 latency or throughput regresses by more
+than --threshold against --baseline.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import platform
+import subprocess
+import threading
+from bisect import bisect_left
+from itertools import accumulate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# ---------------------------------------------------------------------------
+# Environment
+# ---------------------------------------------------------------------------
+
+def build_app(args):
+    """Import the app against local stand-ins.  Returns (app, flush_caches)."""
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL", f"sqlite:///{db_path}")
+    # Rate limiting is disabled below; keep flask-limiter off the network.
+    os.environ["REDIS_URL"] = args.redis_url or "memory://"
+
+    import app.cache as cache
+
+    if args.redis_url:
+        import redis
+
+        raw = redis.Redis.from_url(args.redis_url)
+    else:
+        import fakeredis
+
+        server = fakeredis.FakeServer()
+        cache._redis_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+        cache._redis_binary_client = fakeredis.FakeRedis(server=server)
+        raw = cache._redis_binary_client
+
+    from app import app, migrate
+    from app.rate_limiter import limiter
+
+    limiter.enabled = False
+    with app.app_context():
+        migrate.upgrade()
+
+    def flush_caches():
+        raw.flushdb()
+        cache._l1.clear()
+
+    return app, flush_caches
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_workload(app, name: str, requests: int, concurrency: int, make_request) -> dict:
+    """Issue *requests* calls of ``make_request(client, rng, i)`` across threads."""
+    latencies: list[list[float]] = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+
+    def worker(slot: int) -> None:
+        client = app.test_client()
+        rng = random.Random(slot)
+        for i in range(slot, requests, concurrency):
+            start = time.perf_counter_ns()
+            ok = make_request(client, rng, i)
+            latencies[slot].append((time.perf_counter_ns() - start) / 1_000_000)
+            if not ok:
+                errors[slot] += 1
+
+    threads = [threading.Thread(target=worker, args=(s,)) for s in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    values = sorted(v for per_thread in latencies for v in per_thread)
+    result = {
+        "workload": name,
+        "requests": len(values),
+        "errors": sum(errors),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+    }
+    print(
+        f"  {name:<18} {result['throughput_rps']:>9.1f} req/s   "
+        f"p50 {result['p50_ms']:>7.2f} ms   p95 {result['p95_ms']:>7.2f} ms   "
+        f"p99 {result['p99_ms']:>7.2f} ms   errors {result['errors']}"
+    )
+    return result
+
+
+def zipf_sampler(n: int, s: float):
+    """Return ``sample(rng) -> index`` drawing ranks 0..n-1 with P(k) ∝ 1/(k+1)^s."""
+    cumulative = list(accumulate(1 / (k + 1) ** s for k in range(n)))
+    total = cumulative[-1]
+    return lambda rng: bisect_left(cumulative, rng.random() * total)
+
+
+# ---------------------------------------------------------------------------
+# Workloads
+# ---------------------------------------------------------------------------
+
+def seed_codes(app, count: int) -> list[str]:
+    client = app.test_client()
+    codes: list[str] = []
+    for start in range(0, count, 1000):
+        urls = [f"https://bench.example.com/{i}" for i in range(start, min(count, start + 1000))]
+        response = client.post("/api/shorten/batch", json={"urls": urls})
+        codes.extend(r["data"]["short_code"] for r in response.get_json()["data"]["results"])
+    return codes
+
+
+def run_suite(args) -> list[dict]:
+    app, flush_caches = build_app(args)
+    codes = seed_codes(app, args.codes)
+    sample = zipf_sampler(len(codes), args.zipf)
+
+    def redirect(client, rng, i):
+        return client.get(f"/{codes[sample(rng)]}").status_code == 302
+
+    def shorten(client, rng, i):
+        response = client.post("/api/shorten", json={"url": f"https://bench.example.com/new/{i}"})
+        return response.status_code == 201
+
+    def analytics(client, rng, i):
+        return client.get(f"/api/analytics/{codes[sample(rng)]}").status_code == 200
+
+    print(f"Seeded {len(codes)} codes; {args.requests} requests x {args.concurrency} threads")
+    results = []
+    flush_caches()
+    results.append(run_workload(app, "redirect_cold", args.requests, args.concurrency, redirect))
+    results.append(run_workload(app, "redirect_warm", args.requests, args.concurrency, redirect))
+    results.append(run_workload(app, "shorten", args.requests // 4, args.concurrency, shorten))
+    results.append(run_workload(app, "analytics", args.requests // 4, args.concurrency, analytics))
+
+    from app.click_ingest import click_ingestor
+
+    click_ingestor.shutdown()
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Regression check
+# ---------------------------------------------------------------------------
+
+def compare(results: list[dict], baseline_path: str, threshold: float) -> list[str]:
+    with open(baseline_path) as fh:
+        baseline = {r["workload"]: r for r in json.load(fh)["results"]}
+    failures = []
+    for current in results:
+        previous = baseline.get(current["workload"])
+        if not previous:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + threshold):
+            failures.append(
+                f"{current['workload']}: p95 {previous['p95_ms']} → {current['p95_ms']} ms"
+            )
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 - threshold):
+            failures.append(
+                f"{current['workload']}: throughput {previous['throughput_rps']} → "
+                f"{current['throughput_rps']} req/s"
+            )
+    return failures
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--codes", type=int, default=1000, help="short codes to seed")
+    parser.add_argument("--requests", type=int, default=4000, help="requests per redirect run")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent for code popularity")
+    parser.add_argument("--redis-url", default=None, help="use a real Redis instead of fakeredis")
+    parser.add_argument("--output", default=None, help="write JSON results here")
+    parser.add_argument("--baseline", default=None, help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed regression (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    results = run_suite(args)
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": {
+            "codes": args.codes,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "zipf": args.zipf,
+            "redis": "real" if args.redis_url else "fakeredis",
+            "database": "custom" if os.getenv("BENCH_DATABASE_URL") else "sqlite",
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"[OK] results written to {args.output}")
+
+    if args.baseline:
+        failures = compare(results, args.baseline, args.threshold)
+        if failures:
+            print("[FAIL] regressions past threshold:")
+            for failure in failures:
+                print(f"    {failure}")
+            return 1
+        print(f"[OK] no regressions past {args.threshold:.0%} vs {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,3 +4,9 @@ set -o errexit
 
 pip install --upgrade pip
 pip install -r requirements.txt
+
+# Schema migrations run once per deploy, never in the workers
+flask --app run db upgrade
+
+# Upcoming click_logs months (databases that are not partitioned are skipped)
+flask --app run partitions ensure
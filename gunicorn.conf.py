@@ -0,0 +1,44 @@
+"""
+Gunicorn configuration — loaded automatically from the working directory.
+"""
+
+import os
+import glob
+import tempfile
+
+# Workers write Prometheus samples here so /metrics can merge them
+# (app/metrics.py).  Must be set before any worker imports prometheus_client.
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR",
+    os.path.join(tempfile.gettempdir(), "url-shortener-metrics"),
+)
+
+
+def on_starting(server):
+    """Start from an empty metrics directory (stale worker files would be merged)."""
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    os.makedirs(path, exist_ok=True)
+    for stale in glob.glob(os.path.join(path, "*.db")):
+        os.remove(stale)
+
+
+def post_worker_init(worker):
+    """Start the hot-key refresher and the expiry sweeper; one worker per
+    deploy also warms the cache."""
+    from app.config import Config
+    from app.expiry import expiry_sweeper
+    from app.warmup import hot_keys
+    hot_keys.start(warm=Config.WARMUP_ON_BOOT)
+    expiry_sweeper.start()
+
+
+def worker_exit(server, worker):
+    """Drain buffered click events before the worker goes away."""
+    from app.click_ingest import click_ingestor
+    click_ingestor.shutdown()
+
+
+def child_exit(server, worker):
+    """Let the metrics collector drop live gauges of the dead worker."""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
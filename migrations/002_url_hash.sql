@@ -0,0 +1,10 @@
+-- =============================================================
+-- Add url_hash for de-duplication (existing databases)
+-- Then run:  flask --app run backfill-url-hashes
+-- =============================================================
+
+USE url_shortener;
+
+ALTER TABLE urls
+    ADD COLUMN url_hash CHAR(64) NULL AFTER original_url,
+    ADD INDEX idx_url_hash (url_hash);
@@ -0,0 +1,21 @@
+-- =============================================================
+-- Click rollup tables (existing databases)
+-- Then run:  flask --app run rebuild-rollups
+-- =============================================================
+
+USE url_shortener;
+
+-- ----- Click rollups (maintained by the click flusher) -----
+CREATE TABLE IF NOT EXISTS click_rollups_hourly (
+    url_id      BIGINT          NOT NULL,
+    bucket      DATETIME        NOT NULL,          -- hour start, UTC
+    clicks      BIGINT          NOT NULL DEFAULT 0,
+    PRIMARY KEY (url_id, bucket)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS click_rollups_daily (
+    url_id      BIGINT          NOT NULL,
+    bucket      DATE            NOT NULL,          -- UTC day
+    clicks      BIGINT          NOT NULL DEFAULT 0,
+    PRIMARY KEY (url_id, bucket)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
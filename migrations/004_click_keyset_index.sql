@@ -0,0 +1,9 @@
+-- =============================================================
+-- Composite index for keyset pagination of recent clicks
+-- (existing databases)
+-- =============================================================
+
+USE url_shortener;
+
+ALTER TABLE click_logs
+    ADD INDEX idx_url_clicked (url_id, clicked_at, id);
@@ -0,0 +1,36 @@
+-- =============================================================
+-- Monthly RANGE partitioning of click_logs (MySQL 8)
+--
+-- MySQL requires the partitioning column in every unique key and does not
+-- allow foreign keys on partitioned tables, so the FK to urls is dropped
+-- (urls are only ever soft-deleted) and the PK becomes (id, clicked_at).
+--
+-- Run by hand, once.  Not schema step 5: app/migrate.py owns version
+-- numbers, and this file is kept out of ``db upgrade`` on purpose.
+--
+-- Monthly partitions are then managed by:
+--   flask --app run partitions ensure      (create upcoming months)
+--   flask --app run partitions retention   (archive + drop old months)
+-- =============================================================
+
+USE url_shortener;
+
+ALTER TABLE click_logs DROP FOREIGN KEY fk_click_url;
+
+ALTER TABLE click_logs
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (id, clicked_at);
+
+-- Everything already stored, and the rest of this month, stays in p_legacy;
+-- the cut-over is the first day of next month.  New months are split out of
+-- p_future (MAXVALUE, so inserts never fail) by `partitions ensure`.
+-- Partition bounds must be literals, hence the prepared statement.
+SET @cutover = DATE_FORMAT(CURRENT_DATE + INTERVAL 1 MONTH, '%Y-%m-01');
+SET @ddl = CONCAT(
+    'ALTER TABLE click_logs PARTITION BY RANGE COLUMNS (clicked_at) (',
+    'PARTITION p_legacy VALUES LESS THAN (''', @cutover, '''), ',
+    'PARTITION p_future VALUES LESS THAN (MAXVALUE))'
+);
+PREPARE partition_click_logs FROM @ddl;
+EXECUTE partition_click_logs;
+DEALLOCATE PREPARE partition_click_logs;
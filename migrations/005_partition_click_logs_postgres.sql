@@ -0,0 +1,47 @@
+-- =============================================================
+-- Monthly RANGE partitioning of click_logs (PostgreSQL 12+)
+--
+-- Postgres cannot partition an existing table in place: the current table
+-- is renamed and attached as the "legacy" partition of a new partitioned
+-- click_logs.  The FK to urls is dropped (urls are only soft-deleted) so
+-- old months can be detached as a metadata-only operation.
+--
+-- Run by hand, once.  Not schema step 5: app/migrate.py owns version
+-- numbers, and this file is kept out of ``db upgrade`` on purpose.
+--
+-- Monthly partitions are then managed by:
+--   flask --app run partitions ensure      (create upcoming months)
+--   flask --app run partitions retention   (archive + drop old months)
+-- =============================================================
+
+BEGIN;
+
+ALTER TABLE click_logs RENAME TO click_logs_legacy;
+ALTER TABLE click_logs_legacy DROP CONSTRAINT IF EXISTS click_logs_url_id_fkey;
+ALTER TABLE click_logs_legacy DROP CONSTRAINT IF EXISTS click_logs_pkey;
+ALTER INDEX IF EXISTS idx_url_clicked RENAME TO idx_url_clicked_legacy;
+
+CREATE TABLE click_logs (
+    id          BIGINT          NOT NULL DEFAULT nextval('click_logs_id_seq'),
+    url_id      BIGINT          NOT NULL,
+    ip_address  VARCHAR(45)     NOT NULL,
+    user_agent  TEXT            NULL,
+    referer     TEXT            NULL,
+    clicked_at  TIMESTAMP       NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, clicked_at)
+) PARTITION BY RANGE (clicked_at);
+
+ALTER SEQUENCE click_logs_id_seq OWNED BY click_logs.id;
+
+CREATE INDEX idx_url_clicked ON click_logs (url_id, clicked_at, id);
+
+-- Existing rows and the rest of this month stay in the legacy partition;
+-- the cut-over is the first day of next month (bounds are evaluated once).
+ALTER TABLE click_logs ATTACH PARTITION click_logs_legacy
+    FOR VALUES FROM (MINVALUE) TO (date_trunc('month', CURRENT_DATE) + INTERVAL '1 month');
+
+-- Catches clicks past the last monthly partition, so inserts never fail if
+-- `partitions ensure` has not run in time; ensure moves them out again.
+CREATE TABLE click_logs_default PARTITION OF click_logs DEFAULT;
+
+COMMIT;
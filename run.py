@@ -14,5 +14,12 @@ logging.basicConfig(
 )
 
 if __name__ == "__main__":
+    # Development server: bring the schema up to date first.  Deployed
+    # workers never do this; build.sh runs `flask --app run db upgrade`.
+    from app import migrate
+    from app.sharding import shards
+    with app.app_context():
+        for shard in shards.ids():
+            migrate.upgrade(shards.engine(shard))
     app.run(host="0.0.0.0", port=5000, debug=True, use_reloader=False)
 
@@ -63,6 +63,7 @@ print("[PASS]")
 
 # ---- 4. GET /api/analytics/<code> ----
 sep("4. GET /api/analytics/<code>  (Click analytics)")
+time.sleep(1.5)  # clicks are flushed in the background (CLICK_FLUSH_INTERVAL)
 r6 = requests.get(f"{BASE}/api/analytics/{short_code}")
 print(f"Status: {r6.status_code}")
 print(json.dumps(r6.json(), indent=2))
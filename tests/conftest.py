@@ -0,0 +1,46 @@
+"""
+Shared fixtures: the app on a throwaway SQLite database and fakeredis.
+
+Config is read at import time, so the environment is set before ``app``
+is imported.  Run with ``python -m pytest tests``.
+"""
+
+import os
+import tempfile
+
+_db_path = os.path.join(tempfile.mkdtemp(prefix="shortener-tests-"), "test.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_path}"
+os.environ["REDIS_URL"] = "memory://"
+os.environ.setdefault("EXPIRY_SWEEP_INTERVAL", "0")
+
+import fakeredis
+import pytest
+
+from app import app as flask_app, cache, db, migrate
+
+# Session-wide default, so exit hooks (click_ingest drains at exit) never
+# reach for the real client
+cache._redis_client = fakeredis.FakeRedis(decode_responses=True)
+cache._redis_binary_client = fakeredis.FakeRedis()
+
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    """Fresh fakeredis behind app.cache's clients, with the breaker closed."""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(cache, "_redis_client", fakeredis.FakeRedis(server=server, decode_responses=True))
+    monkeypatch.setattr(cache, "_redis_binary_client", fakeredis.FakeRedis(server=server))
+    cache.breaker.record_success()
+    return server
+
+
+@pytest.fixture
+def app(redis_server):
+    """App context on an upgraded, empty database."""
+    with flask_app.app_context():
+        migrate.upgrade()
+        yield flask_app
+        db.session.remove()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
@@ -0,0 +1,80 @@
+"""
+Click-counter reconcile (app/counters.py): exactly-once write-back to
+urls.click_count across crashes and replays.
+"""
+
+import redis
+
+from app import counters, db
+from app.cache import get_redis
+from app.models import CounterBatch, Url
+
+
+def _url(url_id: int) -> Url:
+    url = Url(id=url_id, short_code=f"c{url_id}", original_url=f"https://example.com/{url_id}")
+    db.session.add(url)
+    db.session.commit()
+    return url
+
+
+def _click_count(url_id: int) -> int:
+    db.session.expire_all()
+    return db.session.get(Url, url_id).click_count
+
+
+def test_reconcile_folds_pending_into_click_count(app):
+    _url(1)
+    _url(2)
+    assert counters.add_clicks({1: 3, 2: 1})
+    assert counters.get_pending_many([1, 2]) == {1: 3, 2: 1}
+
+    assert counters.reconcile() == 2
+
+    assert (_click_count(1), _click_count(2)) == (3, 1)
+    assert counters.get_pending_many([1, 2]) == {1: 0, 2: 0}
+    assert not get_redis().exists(counters.INFLIGHT_KEY, counters.BATCH_KEY)
+    assert db.session.query(CounterBatch).count() == 1
+
+
+def test_idle_reconcile_writes_nothing(app):
+    assert counters.reconcile() == 0
+    assert not get_redis().exists(counters.BATCH_KEY)
+
+
+def test_crash_between_commit_and_hdel_is_not_reapplied(app, monkeypatch):
+    _url(1)
+    counters.add_clicks({1: 5})
+    r = get_redis()
+
+    def crash(*args):
+        raise redis.ConnectionError("lost Redis after COMMIT")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(r, "hdel", crash)
+        assert counters.reconcile() == 0  # committed on the DB, then "crashed"
+    assert _click_count(1) == 5
+    assert r.exists(counters.INFLIGHT_KEY)
+
+    counters.add_clicks({1: 2})  # lands in a new pending hash meanwhile
+    assert counters.reconcile() == 1  # replays the inflight batch: marker found, skipped
+    assert _click_count(1) == 5
+    assert counters.reconcile() == 1  # then the new pending hash
+    assert _click_count(1) == 7
+
+
+def test_inflight_hash_from_before_batch_ids_is_applied_once(app):
+    _url(1)
+    get_redis().hset(counters.INFLIGHT_KEY, "1", 4)
+
+    assert counters.reconcile() == 1
+    assert counters.reconcile() == 0
+    assert _click_count(1) == 4
+
+
+def test_get_pending_many_adds_pending_and_inflight(app):
+    r = get_redis()
+    r.hset(counters.INFLIGHT_KEY, "1", 4)
+    r.hset(counters.PENDING_KEY, "1", 2)
+
+    assert counters.get_pending(1) == 6
+    assert counters.get_pending_many([1, 9]) == {1: 6, 9: 0}
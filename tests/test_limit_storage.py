@@ -0,0 +1,103 @@
+"""
+Batched rate-limit storage (app/limit_storage.py): local counting, inline
+and background pushes, circuit-breaker fallback.
+"""
+
+import os
+
+import fakeredis
+import pytest
+import redis
+from limits import parse
+from limits.strategies import FixedWindowRateLimiter, SlidingWindowCounterRateLimiter
+
+from app import cache
+from app.limit_storage import KEY_PREFIX, LocalBatchedStorage
+
+
+@pytest.fixture
+def shared(redis_server):
+    return fakeredis.FakeRedis(server=redis_server)
+
+
+def _storage(server, max_pending: int = 10) -> LocalBatchedStorage:
+    """A worker's storage on *server*, without its background thread."""
+    storage = LocalBatchedStorage("local+redis://localhost:6379", max_pending=max_pending)
+    storage.redis = fakeredis.FakeRedis(server=server)
+    storage._syncer_pid = os.getpid()  # sync() is called by the tests
+    return storage
+
+
+def test_fixed_window_counts_locally_between_pushes(redis_server, shared):
+    storage = _storage(redis_server, max_pending=3)
+    limiter = FixedWindowRateLimiter(storage)
+    limit = parse("5/minute")
+
+    assert [limiter.hit(limit, "ip") for _ in range(6)] == [True] * 5 + [False]
+    # The window's first hit and the third local hit after it went inline
+    assert storage.stats()["inline_pushes"] == 2
+    storage.sync()
+    assert int(shared.get(KEY_PREFIX + limit.key_for("ip"))) == 6
+
+
+def test_workers_see_each_other_after_a_sync(redis_server):
+    first, second = _storage(redis_server), _storage(redis_server)
+    limiter_a, limiter_b = FixedWindowRateLimiter(first), FixedWindowRateLimiter(second)
+    limit = parse("4/minute")
+
+    assert all(limiter_a.hit(limit, "ip") for _ in range(3))
+    first.sync()
+    assert limiter_b.hit(limit, "ip")  # learns 3 on its first (inline) hit
+    assert not limiter_b.hit(limit, "ip")
+
+
+def test_max_pending_one_is_exact(redis_server, shared):
+    storage = _storage(redis_server, max_pending=1)
+    limiter = FixedWindowRateLimiter(storage)
+    limit = parse("10/minute")
+
+    for expected in range(1, 4):
+        limiter.hit(limit, "ip")
+        assert int(shared.get(KEY_PREFIX + limit.key_for("ip"))) == expected
+
+
+def test_sliding_window_counter(redis_server):
+    storage = _storage(redis_server, max_pending=2)
+    limiter = SlidingWindowCounterRateLimiter(storage)
+    limit = parse("3/minute")
+
+    assert [limiter.hit(limit, "ip") for _ in range(4)] == [True, True, True, False]
+    assert limiter.get_window_stats(limit, "ip").remaining == 0
+    storage.sync()
+    assert not SlidingWindowCounterRateLimiter(_storage(redis_server)).hit(limit, "ip")
+
+
+def test_open_breaker_keeps_limiting_locally(redis_server, monkeypatch):
+    storage = _storage(redis_server, max_pending=2)
+    limiter = FixedWindowRateLimiter(storage)
+    limit = parse("3/minute")
+    monkeypatch.setattr(cache.breaker, "allow", lambda: False)
+
+    assert [limiter.hit(limit, "ip") for _ in range(4)] == [True, True, True, False]
+    assert storage.stats()["inline_pushes"] == 0
+    with pytest.raises(cache.CircuitOpen):
+        storage.sync()
+
+
+def test_failed_sync_keeps_pending_hits(redis_server, shared, monkeypatch):
+    storage = _storage(redis_server)
+    limiter = FixedWindowRateLimiter(storage)
+    limit = parse("10/minute")
+    limiter.hit(limit, "ip")
+    limiter.hit(limit, "ip")
+
+    def down(batch):
+        raise redis.ConnectionError("down")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(storage, "_push", down)
+        with pytest.raises(redis.ConnectionError):
+            storage.sync()
+    cache.breaker.record_success()
+    storage.sync()
+    assert int(shared.get(KEY_PREFIX + limit.key_for("ip"))) == 2